@@ -0,0 +1,274 @@
+import argparse
+import contextlib
+import io
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from solarwinds_common import load_script, InstrumentedSwisClient, SwisMetrics, RetryPolicy, AdaptiveLimiter, defaultLatencyTarget, run_async
+
+# Drive the scripts' bulk functions against mock-swis-server.py and report throughput and
+# SWIS round trips per operation. Round trips don't depend on the machine, so they are what
+# --baseline compares; ops/sec is printed for comparing runs on the same machine.
+
+mockServer = load_script("mock-swis-server")
+copyNode = load_script("copy-solarwinds-node")
+copyApps = load_script("copy-solarwinds-apps")
+bulkCreateApps = load_script("bulk-create-solarwinds-apps")
+bulkUpdatePoller = load_script("bulk-update-solarwinds-memory-poller")
+onboardNodes = load_script("onboard-solarwinds-nodes")
+reconcileNodes = load_script("reconcile-solarwinds-nodes")
+
+scenarios = ["copy_node", "copy_apps", "create_apps", "update_poller", "onboard", "reconcile", "copy_node_async", "copy_apps_async", "create_apps_async", "update_poller_async"]
+
+# Golden node the copy scenarios read from; see build_inventory
+sourceNodeIP = "10.0.0.1"
+
+# Backoff between retries of failed calls and circuit breaker cooldown, in seconds.
+# The mock's errors are random, so waiting long gains nothing.
+retryBaseDelay = 0.01
+retryMaxDelay = 0.1
+retryCooldown = 1.0
+
+# Calls per operation may grow this much over the baseline before it counts as a regression
+defaultTolerance = 0.05
+
+def bench_copy_node(swis:object, inventory:object, count:int, concurrency:int) -> int:
+    # New nodes get made-up names and addresses, so no DNS lookups are timed
+    targets = ["bench-node%d.example.com" % number for number in range(count)]
+    targetIPs = dict([(target, "192.168.%d.%d" % (number // 250, 1 + number % 250)) for number, target in enumerate(targets)])
+    results = copyNode.copy_nodes(swis=swis, sourceNodeIP=sourceNodeIP, targets=targets, concurrency=concurrency, targetIPs=targetIPs)
+    return len([result for result in results if result["status"] not in ("succeeded", "partial")])
+
+def bench_copy_apps(swis:object, inventory:object, count:int, concurrency:int) -> int:
+    # Copy to existing nodes that don't have the golden node's applications yet
+    targets = [node["Caption"] for node in inventory.rows("Orion.Nodes") if node["NodeID"] > 1][:count]
+    sourceApps = copyApps.get_source_apps(swis, sourceNodeIP)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        copyApps.copy_apps_batch(swis, sourceNodeIP, targets, sourceApps, concurrency)
+    # Targets that already have every application are skipped on purpose and aren't failures
+    return len([line for line in output.getvalue().splitlines() if " failed." in line or (" skipped." in line and "already on the node" not in line)])
+
+def bench_create_apps(swis:object, inventory:object, count:int, concurrency:int) -> int:
+    hostnames = ["bench-site%d.example.com" % number for number in range(count)]
+    errors = bulkCreateApps.create_apps_bulk(swis, "golden.example.com", hostnames, concurrency)
+    return len(errors)
+
+def bench_update_poller(swis:object, inventory:object, count:int, concurrency:int) -> int:
+    conditions, params = bulkUpdatePoller.build_poller_filter(bulkUpdatePoller.defaultPollerType)
+    uris = []
+    for page in bulkUpdatePoller.select_pollers(swis, conditions, params):
+        uris += [poller["Uri"] for poller in page]
+    uris = bulkUpdatePoller.pollers_needing_update(swis, uris[:count], bulkUpdatePoller.defaultPollerType)
+    errors = bulkUpdatePoller.update_pollers(swis, uris, bulkUpdatePoller.defaultPollerType)
+    return len(errors)
+
+def bench_onboard(swis:object, inventory:object, count:int, concurrency:int) -> int:
+    # Every new node goes through the whole pipeline and gets one HTTP monitor
+    targets = ["bench-server%d.example.com" % number for number in range(count)]
+    targetIPs = dict([(target, "192.168.%d.%d" % (number // 250, 1 + number % 250)) for number, target in enumerate(targets)])
+    results = {}
+    appStage = ThreadPoolExecutor(max_workers=onboardNodes.defaultAppConcurrency)
+    monitorStage = ThreadPoolExecutor(max_workers=onboardNodes.defaultMonitorConcurrency)
+    onboardNodes.onboard_nodes(
+        swis=swis,
+        sourceNodeIP=sourceNodeIP,
+        targets=targets,
+        hostnames=dict([(target, ["".join(["www.", target])]) for target in targets]),
+        sourceSnapshot=copyNode.get_source_snapshot(swis, sourceNodeIP),
+        sourceApps=copyApps.get_source_apps(swis, sourceNodeIP),
+        applicationTemplateID=bulkCreateApps.get_http_template_id(swis),
+        appStage=appStage,
+        monitorStage=monitorStage,
+        results=results,
+        resultsLock=threading.Lock(),
+        concurrency=concurrency,
+        targetIPs=targetIPs
+    )
+    appStage.shutdown(wait=True)
+    monitorStage.shutdown(wait=True)
+    return len([result for result in results.values() if any([result[stage] not in ("succeeded", "skipped") for stage in onboardNodes.stages])])
+
+def bench_reconcile(swis:object, inventory:object, count:int, concurrency:int) -> int:
+    # Existing nodes lack most of the golden node's applications and overrides; every node's
+    # Comments differ on purpose, so they are left alone
+    targets = [node["Caption"] for node in inventory.rows("Orion.Nodes") if node["NodeID"] > 1][:count]
+    golden = reconcileNodes.golden_state(swis, sourceNodeIP, ["Comments"])
+    results = reconcileNodes.reconcile_nodes(swis, sourceNodeIP, targets, golden, pollerConcurrency=concurrency, settingConcurrency=concurrency)
+    return len([result for result in results if result["status"] == "failed"])
+
+# The --async paths of the same scripts. These take the AsyncSwisClient first; it shares the blocking
+# client's metrics and retry policy, and --concurrency bounds its calls in flight
+
+def bench_copy_node_async(asyncSwis:object, swis:object, inventory:object, count:int, concurrency:int) -> int:
+    targets = ["bench-node%d.example.com" % number for number in range(count)]
+    targetIPs = dict([(target, "192.168.%d.%d" % (number // 250, 1 + number % 250)) for number, target in enumerate(targets)])
+    results = run_async(asyncSwis, copyNode.copy_nodes_async, swis=swis, sourceNodeIP=sourceNodeIP, targets=targets, targetIPs=targetIPs)
+    return len([result for result in results if result["status"] not in ("succeeded", "partial")])
+
+def bench_copy_apps_async(asyncSwis:object, swis:object, inventory:object, count:int, concurrency:int) -> int:
+    targets = [node["Caption"] for node in inventory.rows("Orion.Nodes") if node["NodeID"] > 1][:count]
+    sourceApps = copyApps.get_source_apps(swis, sourceNodeIP)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        run_async(asyncSwis, copyApps.copy_apps_batch_async, swis, sourceNodeIP, targets, sourceApps)
+    return len([line for line in output.getvalue().splitlines() if " failed." in line or (" skipped." in line and "already on the node" not in line)])
+
+def bench_create_apps_async(asyncSwis:object, swis:object, inventory:object, count:int, concurrency:int) -> int:
+    hostnames = ["bench-site%d.example.com" % number for number in range(count)]
+    errors = run_async(asyncSwis, bulkCreateApps.create_apps_bulk_async, swis, "golden.example.com", hostnames)
+    return len(errors)
+
+def bench_update_poller_async(asyncSwis:object, swis:object, inventory:object, count:int, concurrency:int) -> int:
+    conditions, params = bulkUpdatePoller.build_poller_filter(bulkUpdatePoller.defaultPollerType)
+    uris = []
+    for page in bulkUpdatePoller.select_pollers(swis, conditions, params):
+        uris += [poller["Uri"] for poller in page]
+    uris = bulkUpdatePoller.pollers_needing_update(swis, uris[:count], bulkUpdatePoller.defaultPollerType)
+    errors = run_async(asyncSwis, bulkUpdatePoller.update_pollers_async, uris, bulkUpdatePoller.defaultPollerType)
+    return len(errors)
+
+benchmarks = {
+    "copy_node": bench_copy_node,
+    "copy_apps": bench_copy_apps,
+    "create_apps": bench_create_apps,
+    "update_poller": bench_update_poller,
+    "onboard": bench_onboard,
+    "reconcile": bench_reconcile
+}
+
+asyncBenchmarks = {
+    "copy_node_async": bench_copy_node_async,
+    "copy_apps_async": bench_copy_apps_async,
+    "create_apps_async": bench_create_apps_async,
+    "update_poller_async": bench_update_poller_async
+}
+
+def run_scenario(name:str, args:object) -> dict:
+
+    # Every scenario gets a fresh inventory and server so they don't affect each other
+    inventory = mockServer.build_inventory(max(args.nodes, args.count + 1), args.pollersPerNode, args.appsPerNode, args.engines, args.templates)
+    server = mockServer.start_mock_server(inventory, 0, args.latency / 1000, args.jitter / 1000, args.errorRate)
+    try:
+        workers = args.concurrency * copyNode.defaultPollerConcurrency
+        limiter = AdaptiveLimiter(workers, latencyTarget=args.latencyTarget / 1000) if args.adaptive else None
+        swis = InstrumentedSwisClient(mockServer.mock_swis_client(server, workers=workers), SwisMetrics(), RetryPolicy(args.retries, retryBaseDelay, retryMaxDelay, cooldown=retryCooldown), limiter)
+        # The asyncio client has no adaptive limit: its calls in flight are fixed at the workers' number
+        asyncSwis = None
+        if name in asyncBenchmarks:
+            asyncSwis = mockServer.mock_async_swis_client(server, limit=workers, metrics=swis.metrics, retryPolicy=swis.retryPolicy)
+        started = time.monotonic()
+        with contextlib.redirect_stdout(io.StringIO()):
+            if asyncSwis is not None:
+                failures = asyncBenchmarks[name](asyncSwis, swis, inventory, args.count, args.concurrency)
+            else:
+                failures = benchmarks[name](swis, inventory, args.count, args.concurrency)
+        seconds = time.monotonic() - started
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    totals = swis.metrics.totals()
+    return {
+        "scenario": name,
+        "ops": args.count,
+        "failures": failures,
+        "seconds": seconds,
+        "opsPerSecond": args.count / seconds if seconds > 0 else 0.0,
+        "calls": totals["count"],
+        "callsPerOp": totals["count"] / args.count,
+        "errors": totals["errors"]
+    }
+
+def print_results(results:list) -> None:
+    print("  ".join(["Scenario".ljust(19), "Ops".rjust(6), "Failed".rjust(6), "Seconds".rjust(8), "Ops/sec".rjust(8), "Calls".rjust(7), "Calls/op".rjust(8), "Errors".rjust(6)]))
+    for result in results:
+        print("  ".join([
+            result["scenario"].ljust(19),
+            str(result["ops"]).rjust(6),
+            str(result["failures"]).rjust(6),
+            "{:.2f}".format(result["seconds"]).rjust(8),
+            "{:.1f}".format(result["opsPerSecond"]).rjust(8),
+            str(result["calls"]).rjust(7),
+            "{:.2f}".format(result["callsPerOp"]).rjust(8),
+            str(result["errors"]).rjust(6)
+        ]))
+
+def compare_baseline(results:list, baseline:dict, tolerance:float) -> list:
+    # One message per scenario whose calls per operation grew beyond the tolerance
+    regressions = []
+    for result in results:
+        previous = baseline.get(result["scenario"])
+        if previous is None:
+            continue
+        if result["callsPerOp"] > previous["callsPerOp"] * (1 + tolerance):
+            regressions.append(" ".join([result["scenario"], "makes", "{:.2f}".format(result["callsPerOp"]), "SWIS calls per operation, baseline is", "{:.2f}".format(previous["callsPerOp"])]))
+    return regressions
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Benchmark the Solarwinds scripts against a local mock SWIS server")
+    parser.add_argument("scenarios", metavar="SCENARIO", nargs="*", type=str, default=scenarios, help="".join(["Scenarios to run. Default: all of ", " ".join(scenarios)]))
+    parser.add_argument("-n", "--count", metavar="N", action="store", type=int, dest="count", default=50, help="Operations per scenario: nodes copied, nodes given applications, HTTP monitors created, pollers changed, servers onboarded or nodes reconciled")
+    parser.add_argument("-c", "--concurrency", metavar="N", action="store", type=int, dest="concurrency", default=4, help="Concurrency passed to the scripts")
+    parser.add_argument("--nodes", metavar="N", action="store", type=int, dest="nodes", default=200, help="Number of synthetic nodes in the mock inventory")
+    parser.add_argument("--pollers-per-node", metavar="N", action="store", type=int, dest="pollersPerNode", default=8, help="Pollers on each synthetic node")
+    parser.add_argument("--apps-per-node", metavar="N", action="store", type=int, dest="appsPerNode", default=3, help="Application monitors on each synthetic node")
+    parser.add_argument("--engines", metavar="N", action="store", type=int, dest="engines", default=4, help="Number of additional polling engines")
+    parser.add_argument("--templates", metavar="N", action="store", type=int, dest="templates", default=10, help="Number of application templates")
+    parser.add_argument("--latency", metavar="MS", action="store", type=float, dest="latency", default=5.0, help="Milliseconds the mock adds to every request")
+    parser.add_argument("--jitter", metavar="MS", action="store", type=float, dest="jitter", default=0.0, help="Up to this many random milliseconds the mock adds to every request")
+    parser.add_argument("--error-rate", metavar="FRACTION", action="store", type=float, dest="errorRate", default=0.0, help="Fraction of requests the mock fails")
+    parser.add_argument("--retries", metavar="N", action="store", type=int, dest="retries", default=0, required=False, help="Times to repeat a SWIS call the mock failed")
+    parser.add_argument("--adaptive", action="store_true", dest="adaptive", default=False, help="Let the scripts adapt the number of SWIS calls in flight, up to the concurrency")
+    parser.add_argument("--latency-target", metavar="MS", action="store", type=int, dest="latencyTarget", default=int(defaultLatencyTarget * 1000), help="Mean SWIS latency above which --adaptive cuts the calls in flight")
+    parser.add_argument("--baseline", metavar="JSON_FILE", action="store", type=str, dest="baseline", default=None, help="Fail if any scenario makes more SWIS calls per operation than this saved baseline")
+    parser.add_argument("--tolerance", metavar="FRACTION", action="store", type=float, dest="tolerance", default=defaultTolerance, help="Growth in calls per operation allowed over the baseline")
+    parser.add_argument("--save-baseline", metavar="JSON_FILE", action="store", type=str, dest="saveBaseline", default=None, help="Save this run's results as a baseline")
+    args = parser.parse_args()
+
+    # Sanity test for the command line
+    try:
+        for name in args.scenarios:
+            if name not in benchmarks and name not in asyncBenchmarks:
+                raise Exception(" ".join(["Unknown scenario", name, ". Choose from", " ".join(scenarios)]))
+        if args.count < 1 or args.concurrency < 1:
+            raise Exception(" ".join(["Count and concurrency must be at least 1, got", str(min(args.count, args.concurrency))]))
+        if args.appsPerNode < 1 or args.templates < 1:
+            raise Exception("The golden node needs at least one application and template")
+    except Exception as e:
+        print(" ".join(["Illegal value on command line. Details:", str(e.args)]))
+        quit()
+
+    results = []
+    for name in args.scenarios:
+        try:
+            results.append(run_scenario(name, args))
+        except Exception as e:
+            print(" ".join(["Scenario", name, "failed. Details:", str(e.args)]))
+    print_results(results)
+
+    if args.saveBaseline is not None:
+        try:
+            with open(args.saveBaseline, "w") as f:
+                json.dump(dict([(result["scenario"], result) for result in results]), f, indent=2)
+        except Exception as e:
+            print(" ".join(["Unable to save baseline", args.saveBaseline, ". Details:", str(e.args)]))
+
+    if args.baseline is not None:
+        try:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        except Exception as e:
+            print(" ".join(["Unable to read baseline", args.baseline, ". Details:", str(e.args)]))
+            raise SystemExit(2)
+        regressions = compare_baseline(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(regression)
+        if len(regressions) > 0:
+            raise SystemExit(1)
+
+    if len(results) < len(args.scenarios):
+        raise SystemExit(1)
@@ -4,7 +4,12 @@ import argparse
 import ipaddress
 import re
 import getpass
-from orionsdk import SwisClient
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from solarwinds_common import read_manifest, iter_batches, Journal, defaultBatchSize, InstrumentedSwisClient, report_metrics, make_swis_client, defaultSwisTimeout, RetryPolicy, defaultRetries, AdaptiveLimiter, defaultLatencyTarget, open_inventory_cache, defaultCacheTTL, run_query, AsyncSwisClient, defaultAsyncLimit, run_async, run_query_async
+
+# HTTP monitors created in parallel on each target node
+defaultConcurrency = 4
 
 def getIP(hostname:str)->str:
     retval = socket.gethostbyname(hostname)
@@ -31,46 +36,71 @@ def validate_fqdn (fqdn_eval:str) -> None:
         if allowed.match(x) == None:
             raise Exception(" ".join([fqdn_eval, "is not a valid FQDN. Details:", fqdn_eval, "is not part of a valid FQDN", x]))
 
-def create_apps(swis:object, targetNodeName:str, hostname:str) -> None:
-
+def get_target_node_id(swis:object, targetNodeName:str, cache:object=None) -> int:
+    # The inventory cache answers first; a node found in SWIS is added to it
+    if cache is not None:
+        cached = cache.find_nodes(caption=targetNodeName)
+        if len(cached) > 0:
+            return cached[0]["NodeID"]
     try:
-        response = swis.query("".join(["SELECT NodeID from Orion.Nodes where Caption ='",targetNodeName,"'"]))
-        targetNodeID = response["results"][0]["NodeID"]
+        nodes = run_query(swis, "nodes_by_caption", caption=targetNodeName)
+        if cache is not None:
+            cache.add_nodes(nodes)
+        return nodes[0]["NodeID"]
     except Exception as e:
         raise Exception(" ".join(["Error getting node ID for target node", targetNodeName, ". Details:", str(e.args)]))
 
+def get_http_template_id(swis:object, cache:object=None) -> int:
+    if cache is not None:
+        templateID = cache.get_template_id("HTTP")
+        if templateID is not None:
+            return templateID
     try:
-        response = swis.query("SELECT ApplicationTemplateID FROM Orion.APM.ApplicationTemplate where Name = 'HTTP'")
-        applicationTemplateID = response["results"][0]["ApplicationTemplateID"]
+        return run_query(swis, "template_by_name", name="HTTP")[0]["ApplicationTemplateID"]
     except Exception as e:
         raise Exception(" ".join(["Error getting application template ID for HTTP Monitor. Details:", str(e.args)]))
 
+def create_apps(swis:object, targetNodeName:str, hostname:str, targetNodeID:int=None, applicationTemplateID:int=None, journal:object=None, cache:object=None) -> None:
+
+    # With a journal, a monitor an earlier run finished is left alone,
+    # and one it created but didn't finish is renamed and given its URL
+    journalKey = "/".join([targetNodeName, hostname])
+    if journal is not None and journal.done(journalKey, "finished"):
+        print(" ".join(["Application monitor for",hostname,"on",targetNodeName,"already created according to the journal"]))
+        return
+
+    # Look up the node and the HTTP template unless the caller already has them
+    if targetNodeID is None:
+        targetNodeID = get_target_node_id(swis, targetNodeName, cache)
+
+    if applicationTemplateID is None:
+        applicationTemplateID = get_http_template_id(swis, cache)
+
     try:
-        # Create app monitor with inherited credentials. Explicit credentials will copy later.
-        appParams = [
-            targetNodeID,
-            applicationTemplateID,
-            -4, # Inherit credentials from the application template
-            False
-        ]
-        
-        newAppID = swis.invoke(
-            'Orion.APM.Application',
-            'CreateApplication',
-            *appParams
-        )
-        print("Created new app on Node ID",targetNodeID,"with application ID",newAppID)
-
-        # Get the URI of the new app monitor
-        query = "".join([
-            """SELECT Uri
-            FROM Orion.APM.Application
-            where ApplicationID = '""",
-            str(newAppID),
-            "'"
-        ])
-        response = swis.query(query)
-        appUri = response["results"][0]["Uri"]
+        if journal is not None and journal.done(journalKey, "created"):
+            newAppID = journal.get(journalKey, "created")["ApplicationID"]
+        else:
+            # Create app monitor with inherited credentials. Explicit credentials will copy later.
+            appParams = [
+                targetNodeID,
+                applicationTemplateID,
+                -4, # Inherit credentials from the application template
+                False
+            ]
+            
+            newAppID = swis.invoke(
+                'Orion.APM.Application',
+                'CreateApplication',
+                *appParams
+            )
+            print("Created new app on Node ID",targetNodeID,"with application ID",newAppID)
+            if journal is not None:
+                journal.record(journalKey, "created", ApplicationID=newAppID)
+
+        # Get the URI of the new app monitor and its component
+        results = run_query(swis, "application_component", applicationId=newAppID)
+        appUri = results[0]["Uri"]
+        component = results[0]["ComponentID"]
         #print("Uri of Application ID",newAppID,"on Node ID",targetNodeID,"is",appUri)
         
         # Change the name of the new app from the default
@@ -83,17 +113,6 @@ def create_apps(swis:object, targetNodeName:str, hostname:str) -> None:
         )
         print("    Updated name of app monitor",appUri,". Output",updatedAppID)
 
-        # Get components of the new app
-        query = "".join([
-            """SELECT ComponentID
-            FROM Orion.APM.Component
-            where ApplicationID = '""",
-            str(newAppID),
-            "'"
-        ])
-        response = swis.query(query)
-        component = response["results"][0]["ComponentID"]
-
         #print("    URL=","".join(["http://",hostname]))
         properties = {
             "ComponentID":component,
@@ -107,16 +126,144 @@ def create_apps(swis:object, targetNodeName:str, hostname:str) -> None:
             **properties
         )
         print(newSettingID)
+        if journal is not None:
+            journal.record(journalKey, "finished", ApplicationID=newAppID)
 
     except Exception as e:
         raise Exception(" ".join(["Error creating HTTP app on target node", targetNodeName, ". Details:", str(e.args)]))
-        
+
+def get_existing_monitors(swis:object, targetNodeID:int, applicationTemplateID:int) -> set:
+
+    # Names of the monitors the node already has from the template, lower case
+    try:
+        return set([str(app["Name"]).lower() for app in run_query(swis, "applications_by_template", nodeId=targetNodeID, templateId=applicationTemplateID)])
+    except Exception as e:
+        raise Exception(" ".join(["Unable to read existing application monitors of Node ID", str(targetNodeID), ". Details:", str(e.args)]))
+
+def plan_apps_bulk(swis:object, targetNodeName:str, hostnames:list, applicationTemplateID:int=None, journal:object=None, cache:object=None, preflight:bool=True, skipped:list=None) -> tuple:
+
+    # Look up the node and the HTTP template once for all the hostnames, and work out which hostnames need a monitor.
+    # Hostnames the journal says an earlier run finished are skipped. The pre-flight check also skips
+    # hostnames the node already has a monitor for, unless the journal shows an earlier run created it and didn't finish.
+    # Returns the NodeID, the template ID and the hostnames to create monitors for; skipped ones are added to skipped.
+    targetNodeID = get_target_node_id(swis, targetNodeName, cache)
+    if applicationTemplateID is None:
+        applicationTemplateID = get_http_template_id(swis, cache)
+
+    planned = list(hostnames)
+    if journal is not None:
+        for hostname in hostnames:
+            if journal.done("/".join([targetNodeName, hostname]), "finished"):
+                print(" ".join(["Application monitor for",hostname,"on",targetNodeName,"already created according to the journal"]))
+        hostnames = [hostname for hostname in hostnames if not journal.done("/".join([targetNodeName, hostname]), "finished")]
+
+    if preflight:
+        existing = get_existing_monitors(swis, targetNodeID, applicationTemplateID)
+        for hostname in hostnames:
+            if hostname.lower() in existing and (journal is None or not journal.done("/".join([targetNodeName, hostname]), "created")):
+                print(" ".join(["Application monitor for",hostname,"already exists on",targetNodeName,"and is skipped"]))
+        hostnames = [hostname for hostname in hostnames if hostname.lower() not in existing or (journal is not None and journal.done("/".join([targetNodeName, hostname]), "created"))]
+
+    if skipped is not None:
+        skipped += [hostname for hostname in planned if hostname not in hostnames]
+    return targetNodeID, applicationTemplateID, hostnames
+
+def create_apps_bulk(swis:object, targetNodeName:str, hostnames:list, concurrency:int=defaultConcurrency, applicationTemplateID:int=None, journal:object=None, cache:object=None, preflight:bool=True, skipped:list=None) -> dict:
+
+    # Create, rename and set the URL of the monitor for each hostname in a bounded pool.
+    # Returns an error message for every hostname whose monitor could not be created.
+    # Hostnames that needed no monitor are added to skipped.
+    targetNodeID, applicationTemplateID, hostnames = plan_apps_bulk(swis, targetNodeName, hostnames, applicationTemplateID, journal, cache, preflight, skipped)
+
+    def create_one(hostname:str) -> str:
+        try:
+            create_apps(swis=swis, targetNodeName=targetNodeName, hostname=hostname, targetNodeID=targetNodeID, applicationTemplateID=applicationTemplateID, journal=journal)
+            print(" ".join(["Create application monitor for",hostname,"on",targetNodeName,"succeeded"]))
+            return None
+        except Exception as e:
+            return str(e.args)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(hostnames) or 1))) as executor:
+        errors = list(executor.map(create_one, hostnames))
+
+    return dict([(hostname, error) for hostname, error in zip(hostnames, errors) if error is not None])
+
+async def create_apps_async(swis:object, targetNodeName:str, hostname:str, targetNodeID:int, applicationTemplateID:int, journal:object=None) -> None:
+
+    # create_apps for an AsyncSwisClient. The caller looks up the node and the HTTP template.
+    journalKey = "/".join([targetNodeName, hostname])
+    if journal is not None and journal.done(journalKey, "finished"):
+        print(" ".join(["Application monitor for",hostname,"on",targetNodeName,"already created according to the journal"]))
+        return
+
+    try:
+        if journal is not None and journal.done(journalKey, "created"):
+            newAppID = journal.get(journalKey, "created")["ApplicationID"]
+        else:
+            # Create app monitor with credentials inherited from the application template
+            newAppID = await swis.invoke('Orion.APM.Application', 'CreateApplication', targetNodeID, applicationTemplateID, -4, False)
+            print("Created new app on Node ID",targetNodeID,"with application ID",newAppID)
+            if journal is not None:
+                journal.record(journalKey, "created", ApplicationID=newAppID)
+
+        # Rename the new app and give its component the URL; neither depends on the other
+        results = await run_query_async(swis, "application_component", applicationId=newAppID)
+        properties = {
+            "ComponentID":results[0]["ComponentID"],
+            "Key":"Url",
+            "Required":1,
+            "Value":"".join(["http://",hostname]),
+            "ValueType":0
+        }
+        renamed, newSettingID = await asyncio.gather(swis.update(results[0]["Uri"], Name=hostname), swis.create("Orion.APM.ComponentSetting", **properties))
+        print("    Updated name of app monitor",results[0]["Uri"],". Output",renamed)
+        print(newSettingID)
+        if journal is not None:
+            journal.record(journalKey, "finished", ApplicationID=newAppID)
+
+    except Exception as e:
+        raise Exception(" ".join(["Error creating HTTP app on target node", targetNodeName, ". Details:", str(e.args)]))
+
+async def create_apps_bulk_async(asyncSwis:object, swis:object, targetNodeName:str, hostnames:list, applicationTemplateID:int=None, journal:object=None, cache:object=None, preflight:bool=True, skipped:list=None) -> dict:
+
+    # create_apps_bulk with every monitor created at once on the event loop, limited only by the calls in
+    # flight allowed by the open AsyncSwisClient asyncSwis. The lookups before creating use the blocking client swis.
+    targetNodeID, applicationTemplateID, hostnames = plan_apps_bulk(swis, targetNodeName, hostnames, applicationTemplateID, journal, cache, preflight, skipped)
+
+    async def create_one(hostname:str) -> str:
+        try:
+            await create_apps_async(asyncSwis, targetNodeName, hostname, targetNodeID, applicationTemplateID, journal)
+            print(" ".join(["Create application monitor for",hostname,"on",targetNodeName,"succeeded"]))
+            return None
+        except Exception as e:
+            return str(e.args)
+
+    errors = await asyncio.gather(*[create_one(hostname) for hostname in hostnames])
+
+    return dict([(hostname, error) for hostname, error in zip(hostnames, errors) if error is not None])
+
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(description="Create HTTP apps in bulk on a Solarwinds node")
     parser.add_argument("-S", "--server", metavar="SW_SERVER", action="store", type=str, dest="swisInfo", default="localhost", help="IP or FQDN of Solarwinds server")
-    parser.add_argument("-t", "--targetNodeName", metavar="TARGET_NODE", action="append", type=str, dest="targets", required=True, help="FQDN of new node")
+    parser.add_argument("-t", "--targetNodeName", metavar="TARGET_NODE", action="append", type=str, dest="targets", default=[], required=False, help="FQDN of new node")
+    parser.add_argument("-m", "--manifest", metavar="MANIFEST", action="store", type=str, dest="manifest", default=None, required=False, help="CSV or JSON Lines file with a 'hostname' column, and optionally a 'target' column, to use instead of the built-in hostname list. Use - for standard input")
+    parser.add_argument("-j", "--journal", metavar="JOURNAL", action="store", type=str, dest="journal", default=None, required=False, help="Journal file recording each completed step. Rerunning with the same journal resumes where the last run stopped")
+    parser.add_argument("--batch-size", metavar="N", action="store", type=int, dest="batchSize", default=defaultBatchSize, required=False, help="Number of manifest rows processed together")
     parser.add_argument("-w", "--wait", metavar="WAIT_TIME", action="store", type=int, dest="waitTime", default=0, required=False, help="Seconds to wait between creating each node and setting custom properties")
+    parser.add_argument("--allow-duplicates", action="store_false", dest="preflight", default=True, required=False, help="Create every monitor even if the target node already has one for the hostname")
+    parser.add_argument("-c", "--concurrency", metavar="N", action="store", type=int, dest="concurrency", default=defaultConcurrency, required=False, help="Number of HTTP monitors to create in parallel")
+    parser.add_argument("--cache", metavar="CACHE_FILE", action="store", type=str, dest="cache", default=None, required=False, help="SQLite file caching Orion nodes, polling engines and application templates between runs")
+    parser.add_argument("--cache-ttl", metavar="SECONDS", action="store", type=int, dest="cacheTTL", default=defaultCacheTTL, required=False, help="Age after which the cache is pulled from Orion in full again")
+    parser.add_argument("--refresh", action="store_true", dest="refresh", default=False, required=False, help="Pull the whole cache from Orion again now")
+    parser.add_argument("--ca-bundle", metavar="PEM", action="store", type=str, dest="caBundle", default=None, required=False, help="Verify the SWIS server certificate against this CA bundle. Without it the certificate is not checked")
+    parser.add_argument("--retries", metavar="N", action="store", type=int, dest="retries", default=defaultRetries, required=False, help="Times to repeat a SWIS call that failed with a transient error. Queries, reads and updates are repeated after any transient error, creates only when SWIS never started on them")
+    parser.add_argument("--adaptive", action="store_true", dest="adaptive", default=False, required=False, help="Start with few SWIS calls in flight and add more while Orion keeps up, backing off when it slows down or fails. Concurrency from -c sets the most calls in flight")
+    parser.add_argument("--latency-target", metavar="MS", action="store", type=int, dest="latencyTarget", default=int(defaultLatencyTarget * 1000), required=False, help="Mean SWIS latency above which --adaptive cuts the calls in flight")
+    parser.add_argument("--async", action="store_true", dest="asyncMode", default=False, required=False, help="Create every monitor of a target node at once on one asyncio event loop instead of in threads. Needs the aiohttp package. -c doesn't apply; --async-limit bounds the SWIS calls in flight")
+    parser.add_argument("--async-limit", metavar="N", action="store", type=int, dest="asyncLimit", default=defaultAsyncLimit, required=False, help="Most SWIS calls in flight with --async")
+    parser.add_argument("--timeout", metavar="SECONDS", action="store", type=int, dest="timeout", default=defaultSwisTimeout, required=False, help="Longest time to wait for each SWIS response")
+    parser.add_argument("--metrics-file", metavar="PROM_FILE", action="store", type=str, dest="metricsFile", default=None, required=False, help="Write SWIS call counts and latencies to this Prometheus textfile at the end of the run")
     args = parser.parse_args()
 
     # Sanity test for the command line
@@ -128,6 +275,15 @@ if __name__ == '__main__':
 
         for target in args.targets:
             validate_fqdn(target)
+
+        if args.concurrency < 1 or args.batchSize < 1 or args.asyncLimit < 1:
+            raise Exception(" ".join(["Concurrency and batch size must be at least 1, got", str(min(args.concurrency, args.batchSize, args.asyncLimit))]))
+
+        if args.asyncMode and args.adaptive:
+            raise Exception("--adaptive works with the threaded creation only, not with --async")
+
+        if len(args.targets) == 0 and args.manifest is None:
+            raise Exception("Give the target node with -t, or a manifest with a 'target' column with -m")
     except Exception as e:
         print(" ".join(["Illegal value on command line. Details:", str(e.args)]))
         quit()
@@ -135,19 +291,26 @@ if __name__ == '__main__':
     username = input("Username: ")
     password = getpass.getpass("Password: ")
     
-    # Allow swis to ignore certificate warnings
-    verify = False
-    if not verify:
-        import urllib3
-        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
-    # Create the SWIS connection and run a simple test
+    # Create the SWIS connection, pooled for every worker, and run a simple test
+    workers = args.concurrency
+    limiter = AdaptiveLimiter(workers, latencyTarget=args.latencyTarget / 1000) if args.adaptive else None
     try:
-        swis = SwisClient("solarwinds.ci.northwestern.edu", username, password)
-        response = swis.query("SELECT Top 1 NodeID from Orion.Nodes")
+        swis = InstrumentedSwisClient(make_swis_client("solarwinds.ci.northwestern.edu", username, password, workers, args.caBundle, args.timeout), retryPolicy=RetryPolicy(args.retries), limiter=limiter)
+        response = run_query(swis, "probe")
     except Exception as e:
         print("Unable to connect to SWIS server")
         quit()
+
+    # With --async the monitors are created by an asyncio client counted in the same metrics
+    asyncSwis = None
+    if args.asyncMode:
+        try:
+            asyncSwis = AsyncSwisClient("solarwinds.ci.northwestern.edu", username, password, args.caBundle, args.timeout, args.asyncLimit, metrics=swis.metrics, retryPolicy=swis.retryPolicy)
+        except Exception as e:
+            print(" ".join(["Unable to use --async. Details:", str(e.args)]))
+            quit()
+
+    cache = open_inventory_cache(args.cache, "solarwinds.ci.northwestern.edu", swis, args.cacheTTL, args.refresh)
     
     # List of hosts for URLs
     hostnames=[
@@ -196,13 +359,63 @@ if __name__ == '__main__':
         # "surgery-dev.fsm.northwestern.edu"
     ]
 
-    # Copy applications from source node to target nodes
-    for target in args.targets:
-        try:
-            for hostname in set(hostnames):
-                print(hostname)
-                create_apps(swis=swis, targetNodeName=target, hostname=hostname)
-                print(" ".join(["Create application monitor on",target,"succeeded"]))
-        except Exception as e:
-            print(" ".join(["Create application monitor on", target, "failed. Details:", str(e.args)]))
+    # Create an HTTP monitor for every hostname on each target node
+    try:
+        applicationTemplateID = get_http_template_id(swis, cache)
+    except Exception as e:
+        print(" ".join(["Create application monitors failed. Details:", str(e.args)]))
+        quit()
+
+    try:
+        journal = Journal(args.journal) if args.journal else None
+    except Exception as e:
+        print(" ".join(["Unable to open journal. Details:", str(e.args)]))
+        quit()
+
+    # Each batch is a list of (target, hostname) pairs, from the manifest or from the built-in list.
+    # Manifest rows are checked as they are read, and bad ones are reported and left out.
+    if args.manifest is not None:
+        def manifest_pairs():
+            for row in read_manifest(args.manifest, "hostname"):
+                try:
+                    validate_fqdn(row["hostname"])
+                    if row.get("target") not in (None, ""):
+                        validate_fqdn(row["target"])
+                except Exception as e:
+                    print(" ".join(["Manifest row for hostname", str(row["hostname"]), "skipped. Details:", str(e.args)]))
+                    continue
+                if row.get("target") not in (None, ""):
+                    yield (row["target"], row["hostname"])
+                elif len(args.targets) > 0:
+                    for target in args.targets:
+                        yield (target, row["hostname"])
+                else:
+                    raise Exception(" ".join(["No target node for hostname", row["hostname"]]))
+        batches = iter_batches(manifest_pairs(), args.batchSize)
+    else:
+        batches = [[(target, hostname) for target in args.targets for hostname in dict.fromkeys(hostnames)]]
+
+    try:
+        for batch in batches:
+            for target in dict.fromkeys([pair[0] for pair in batch]):
+                targetHostnames = list(dict.fromkeys([pair[1] for pair in batch if pair[0] == target]))
+                skipped = []
+                try:
+                    if asyncSwis is not None:
+                        errors = run_async(asyncSwis, create_apps_bulk_async, swis=swis, targetNodeName=target, hostnames=targetHostnames, applicationTemplateID=applicationTemplateID, journal=journal, cache=cache, preflight=args.preflight, skipped=skipped)
+                    else:
+                        errors = create_apps_bulk(swis=swis, targetNodeName=target, hostnames=targetHostnames, concurrency=args.concurrency, applicationTemplateID=applicationTemplateID, journal=journal, cache=cache, preflight=args.preflight, skipped=skipped)
+                    for hostname in errors:
+                        print(" ".join(["Create application monitor for", hostname, "on", target, "failed. Details:", errors[hostname]]))
+                    print(" ".join([str(len(targetHostnames)), "application monitors on", "".join([target, ":"]), str(len(targetHostnames) - len(skipped) - len(errors)), "created,", str(len(skipped)), "skipped,", str(len(errors)), "failed"]))
+                except Exception as e:
+                    print(" ".join(["Create application monitor on", target, "failed. Details:", str(e.args)]))
+    except Exception as e:
+        print(" ".join(["Reading manifest", args.manifest, "failed. Details:", str(e.args)]))
+
+    if journal is not None:
+        journal.close()
+    if cache is not None:
+        cache.close()
 
+    report_metrics(swis, args.metricsFile, "bulk-create-solarwinds-apps")
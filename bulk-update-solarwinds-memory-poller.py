@@ -4,7 +4,17 @@ import argparse
 import ipaddress
 import re
 import getpass
-from orionsdk import SwisClient
+import time
+import asyncio
+from solarwinds_common import read_manifest, iter_batches, Journal, InstrumentedSwisClient, report_metrics, make_swis_client, defaultSwisTimeout, RetryPolicy, defaultRetries, run_query, run_swql, AsyncSwisClient, defaultAsyncLimit, run_async
+
+# Poller URIs sent per BulkUpdate request
+defaultChunkSize = 100
+
+# Pollers read per page when selecting them with a query
+defaultPageSize = 500
+
+defaultPollerType = "N.Memory.SNMP.HrStorage"
 
 def getIP(hostname:str)->str:
     retval = socket.gethostbyname(hostname)
@@ -44,12 +54,176 @@ def update_poller(swis:object, pollerUri:str, pollerType:str) -> None:
         )
     except Exception as e:
         raise Exception(" ".join(["Error updating poller with Uri", pollerUri, "to type",pollerType,". Details:", str(e.args)]))
-        
+
+def build_poller_filter(pollerType:str, vendor:str=None, engineID:int=None, customProperties:list=None, currentType:str=None, where:str=None) -> tuple:
+
+    # SWQL conditions on Orion.Pollers P joined to Orion.Nodes N, and the @parameters they use.
+    # Only node memory pollers are ever selected, and never ones already of the wanted type.
+    conditions = [
+        "P.NetObjectType = 'N'",
+        "P.PollerType like 'N.Memory.%'",
+        "P.PollerType <> @pollerType"
+    ]
+    params = {"pollerType": pollerType}
+    if vendor is not None:
+        conditions.append("N.Vendor = @vendor")
+        params["vendor"] = vendor
+    if engineID is not None:
+        conditions.append("N.EngineID = @engineId")
+        params["engineId"] = int(engineID)
+    if currentType is not None:
+        conditions.append("P.PollerType like @currentType")
+        params["currentType"] = currentType
+    for index, customProperty in enumerate(customProperties or []):
+        name, value = customProperty.split("=", 1)
+        if re.match(r"^[A-Za-z_][A-Za-z0-9_]*$", name) == None:
+            raise Exception(" ".join([name, "is not a valid custom property name"]))
+        conditions.append("".join(["N.CustomProperties.", name, " = @customProperty", str(index)]))
+        params["".join(["customProperty", str(index)])] = value
+    if where is not None:
+        conditions.append("".join(["(", where, ")"]))
+    return conditions, params
+
+def select_pollers(swis:object, conditions:list, params:dict=None, pageSize:int=defaultPageSize):
+
+    # Stream matching pollers from SWIS a page at a time, in PollerID order.
+    # Yields one list of {PollerID, Uri, PollerType} per page.
+    # Every page is the same query text with a new @lastPollerID.
+    query = "".join([
+        "SELECT TOP ", str(pageSize), " P.PollerID, P.Uri, P.PollerType",
+        " FROM Orion.Pollers P INNER JOIN Orion.Nodes N on P.NetObjectID = N.NodeID",
+        " where ", " and ".join(conditions + ["P.PollerID > @lastPollerID"]),
+        " order by P.PollerID"
+    ])
+    lastPollerID = 0
+    while True:
+        try:
+            page = run_swql(swis, query, lastPollerID=lastPollerID, **(params or {}))
+        except Exception as e:
+            raise Exception(" ".join(["Error selecting pollers after PollerID", str(lastPollerID), ". Details:", str(e.args)]))
+
+        if len(page) == 0:
+            return
+        yield page
+        if len(page) < pageSize:
+            return
+        lastPollerID = page[-1]["PollerID"]
+
+def pollers_needing_update(swis:object, pollerUris:list, pollerType:str, chunkSize:int=defaultChunkSize) -> list:
+
+    # Read the current type of listed pollers and keep only the ones that actually need changing.
+    # URIs that don't name a PollerID are kept as they are.
+    needed = []
+    for start in range(0, len(pollerUris), chunkSize):
+        chunk = pollerUris[start:start + chunkSize]
+        pollerIDs = {}
+        for uri in chunk:
+            match = re.search(r"PollerID=(\d+)", uri)
+            if match == None:
+                needed.append(uri)
+            else:
+                pollerIDs[int(match.group(1))] = uri
+        if len(pollerIDs) == 0:
+            continue
+
+        try:
+            current = dict([(poller["PollerID"], poller["PollerType"]) for poller in run_query(swis, "poller_types", pollerIds=list(pollerIDs))])
+        except Exception as e:
+            print(" ".join(["Unable to read current poller types, updating all of them. Details:", str(e.args)]))
+            current = {}
+
+        for pollerID in pollerIDs:
+            if current.get(pollerID) != pollerType:
+                needed.append(pollerIDs[pollerID])
+
+    return needed
+
+def update_pollers(swis:object, pollerUris:list, pollerType:str, chunkSize:int=defaultChunkSize, journal:object=None) -> dict:
+
+    # Change the poller type of many pollers with one BulkUpdate per chunk.
+    # If a chunk fails, update its pollers one at a time so one bad URI doesn't fail the rest.
+    # Returns an error message for every poller that could not be updated.
+    # With a journal, every updated poller is recorded there.
+    errors = {}
+    for start in range(0, len(pollerUris), chunkSize):
+        chunk = pollerUris[start:start + chunkSize]
+        started = time.monotonic()
+        try:
+            swis.bulkupdate(chunk, PollerType=pollerType)
+            if journal is not None:
+                for uri in chunk:
+                    journal.record(uri, "updated", PollerType=pollerType)
+            print(" ".join(["Updated", str(len(chunk)), "pollers", str(start + 1), "to", str(start + len(chunk)), "in one request,", "{:.2f}".format(time.monotonic() - started), "seconds"]))
+            continue
+        except Exception as e:
+            print(" ".join(["Bulk update of pollers", str(start + 1), "to", str(start + len(chunk)), "failed, updating them one at a time. Details:", str(e.args)]))
+
+        for uri in chunk:
+            try:
+                update_poller(swis=swis, pollerUri=uri, pollerType=pollerType)
+                if journal is not None:
+                    journal.record(uri, "updated", PollerType=pollerType)
+            except Exception as e:
+                errors[uri] = str(e.args)
+        print(" ".join(["Updated", str(len(chunk) - len([uri for uri in chunk if uri in errors])), "of", str(len(chunk)), "pollers", str(start + 1), "to", str(start + len(chunk)), "one at a time,", "{:.2f}".format(time.monotonic() - started), "seconds"]))
+
+    return errors
+
+async def update_pollers_async(swis:object, pollerUris:list, pollerType:str, chunkSize:int=defaultChunkSize, journal:object=None) -> dict:
+
+    # update_pollers for an AsyncSwisClient, with every chunk sent at once.
+    # A chunk that fails still falls back to its pollers one at a time, also sent at once.
+    errors = {}
+
+    async def update_one(uri:str) -> None:
+        try:
+            await swis.update(uri, PollerType=pollerType)
+            if journal is not None:
+                journal.record(uri, "updated", PollerType=pollerType)
+        except Exception as e:
+            errors[uri] = str(e.args)
+
+    async def update_chunk(start:int) -> None:
+        chunk = pollerUris[start:start + chunkSize]
+        started = time.monotonic()
+        try:
+            await swis.bulkupdate(chunk, PollerType=pollerType)
+            if journal is not None:
+                for uri in chunk:
+                    journal.record(uri, "updated", PollerType=pollerType)
+            print(" ".join(["Updated", str(len(chunk)), "pollers", str(start + 1), "to", str(start + len(chunk)), "in one request,", "{:.2f}".format(time.monotonic() - started), "seconds"]))
+            return
+        except Exception as e:
+            print(" ".join(["Bulk update of pollers", str(start + 1), "to", str(start + len(chunk)), "failed, updating them one at a time. Details:", str(e.args)]))
+
+        await asyncio.gather(*[update_one(uri) for uri in chunk])
+        print(" ".join(["Updated", str(len(chunk) - len([uri for uri in chunk if uri in errors])), "of", str(len(chunk)), "pollers", str(start + 1), "to", str(start + len(chunk)), "one at a time,", "{:.2f}".format(time.monotonic() - started), "seconds"]))
+
+    await asyncio.gather(*[update_chunk(start) for start in range(0, len(pollerUris), chunkSize)])
+
+    return errors
+
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(description="Create HTTP apps in bulk on a Solarwinds node")
     parser.add_argument("-S", "--server", metavar="SW_SERVER", action="store", type=str, dest="swisInfo", default="localhost", help="IP or FQDN of Solarwinds server")
     parser.add_argument("-w", "--wait", metavar="WAIT_TIME", action="store", type=int, dest="waitTime", default=0, required=False, help="Seconds to wait between creating each node and setting custom properties")
+    parser.add_argument("-p", "--poller-type", metavar="POLLER_TYPE", action="store", type=str, dest="pollerType", default=defaultPollerType, required=False, help="".join(["Memory poller type to set. Default: ", defaultPollerType]))
+    parser.add_argument("--vendor", metavar="VENDOR", action="store", type=str, dest="vendor", default=None, required=False, help="Select the memory pollers of nodes from this vendor instead of the built-in list")
+    parser.add_argument("--engine", metavar="ENGINE_ID", action="store", type=int, dest="engineID", default=None, required=False, help="Select the memory pollers of nodes on this polling engine instead of the built-in list")
+    parser.add_argument("--custom-property", metavar="NAME=VALUE", action="append", type=str, dest="customProperties", default=None, required=False, help="Select the memory pollers of nodes with this custom property value instead of the built-in list. May be repeated")
+    parser.add_argument("--current-type", metavar="POLLER_TYPE", action="store", type=str, dest="currentType", default=None, required=False, help="Select memory pollers whose type is like this SWQL pattern instead of the built-in list")
+    parser.add_argument("--where", metavar="SWQL", action="store", type=str, dest="where", default=None, required=False, help="Extra SWQL condition on Orion.Pollers P and Orion.Nodes N selecting the pollers instead of the built-in list")
+    parser.add_argument("--page-size", metavar="N", action="store", type=int, dest="pageSize", default=defaultPageSize, required=False, help="Number of pollers read per query when selecting them")
+    parser.add_argument("-m", "--manifest", metavar="MANIFEST", action="store", type=str, dest="manifest", default=None, required=False, help="CSV or JSON Lines file with a 'uri' column listing the pollers to change, instead of the built-in list. Use - for standard input")
+    parser.add_argument("-j", "--journal", metavar="JOURNAL", action="store", type=str, dest="journal", default=None, required=False, help="Journal file recording each poller that has been checked or changed. Rerunning with the same journal skips them")
+    parser.add_argument("-b", "--chunk-size", metavar="N", action="store", type=int, dest="chunkSize", default=defaultChunkSize, required=False, help="Number of pollers changed per BulkUpdate request")
+    parser.add_argument("--ca-bundle", metavar="PEM", action="store", type=str, dest="caBundle", default=None, required=False, help="Verify the SWIS server certificate against this CA bundle. Without it the certificate is not checked")
+    parser.add_argument("--retries", metavar="N", action="store", type=int, dest="retries", default=defaultRetries, required=False, help="Times to repeat a SWIS call that failed with a transient error. Queries, reads and updates are repeated after any transient error, creates only when SWIS never started on them")
+    parser.add_argument("--async", action="store_true", dest="asyncMode", default=False, required=False, help="Send the BulkUpdate requests of each batch at once on one asyncio event loop instead of one after another. Needs the aiohttp package")
+    parser.add_argument("--async-limit", metavar="N", action="store", type=int, dest="asyncLimit", default=defaultAsyncLimit, required=False, help="Most SWIS calls in flight with --async")
+    parser.add_argument("--timeout", metavar="SECONDS", action="store", type=int, dest="timeout", default=defaultSwisTimeout, required=False, help="Longest time to wait for each SWIS response")
+    parser.add_argument("--metrics-file", metavar="PROM_FILE", action="store", type=str, dest="metricsFile", default=None, required=False, help="Write SWIS call counts and latencies to this Prometheus textfile at the end of the run")
     args = parser.parse_args()
 
     # Sanity test for the command line
@@ -59,26 +233,54 @@ if __name__ == '__main__':
         except:
             validate_fqdn(args.swisInfo)
 
+        if args.chunkSize < 1 or args.pageSize < 1 or args.asyncLimit < 1:
+            raise Exception(" ".join(["Chunk and page sizes must be at least 1, got", str(min(args.chunkSize, args.pageSize, args.asyncLimit))]))
+
+        for customProperty in args.customProperties or []:
+            if "=" not in customProperty:
+                raise Exception(" ".join([customProperty, "is not in the form NAME=VALUE"]))
+
+        # Select pollers with a query when any filter is given, otherwise use the built-in list
+        queryMode = any(value is not None for value in [args.vendor, args.engineID, args.customProperties, args.currentType, args.where])
+        if queryMode and args.manifest is not None:
+            raise Exception("Select pollers either with a manifest or with query filters, not both")
+        if queryMode:
+            conditions, params = build_poller_filter(args.pollerType, args.vendor, args.engineID, args.customProperties, args.currentType, args.where)
     except Exception as e:
         print(" ".join(["Illegal value on command line. Details:", str(e.args)]))
         quit()
 
+    try:
+        journal = Journal(args.journal) if args.journal else None
+    except Exception as e:
+        print(" ".join(["Unable to open journal. Details:", str(e.args)]))
+        quit()
+
     username = input("Username: ")
     password = getpass.getpass("Password: ")
     
-    # Allow swis to ignore certificate warnings
-    verify = False
-    if not verify:
-        import urllib3
-        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
-    # Create the SWIS connection and run a simple test
+    # Create the SWIS connection, pooled for every worker, and run a simple test
     try:
-        swis = SwisClient("solarwinds.ci.northwestern.edu", username, password)
-        response = swis.query("SELECT Top 1 NodeID from Orion.Nodes")
+        swis = InstrumentedSwisClient(make_swis_client("solarwinds.ci.northwestern.edu", username, password, 1, args.caBundle, args.timeout), retryPolicy=RetryPolicy(args.retries))
+        response = run_query(swis, "probe")
     except Exception as e:
         print("Unable to connect to SWIS server")
         quit()
+
+    # With --async the updates are sent by an asyncio client counted in the same metrics.
+    # Selecting and checking the pollers stays on the blocking client.
+    asyncSwis = None
+    if args.asyncMode:
+        try:
+            asyncSwis = AsyncSwisClient("solarwinds.ci.northwestern.edu", username, password, args.caBundle, args.timeout, args.asyncLimit, metrics=swis.metrics, retryPolicy=swis.retryPolicy)
+        except Exception as e:
+            print(" ".join(["Unable to use --async. Details:", str(e.args)]))
+            quit()
+
+    def apply_updates(pollerUris:list, journal:object=None) -> dict:
+        if asyncSwis is not None:
+            return run_async(asyncSwis, update_pollers_async, pollerUris, args.pollerType, args.chunkSize, journal)
+        return update_pollers(swis=swis, pollerUris=pollerUris, pollerType=args.pollerType, chunkSize=args.chunkSize, journal=journal)
     
     # List of hosts for URLs
     uris=[
@@ -282,12 +484,68 @@ if __name__ == '__main__':
 		"swis://SOLARWINDS.ci.northwestern.edu/Orion/Orion.Pollers/PollerID=457665"
     ]
 
-    # Copy applications from source node to target nodes
-    for uri in set(uris):
+    if queryMode:
+        # Change the poller type of the selected pollers, a page at a time,
+        # skipping pollers the journal says an earlier run already did
+        selected = 0
+        journaled = 0
+        updated = 0
+        errors = {}
         try:
-            print(uri)
-            update_poller(swis=swis,pollerUri=uri,pollerType="N.Memory.SNMP.HrStorage")
-            print(" ".join(["Updated poller with Uri",uri,"succeeded"]))
+            for page in select_pollers(swis, conditions, params, args.pageSize):
+                selected += len(page)
+                unfinished = [poller for poller in page if journal is None or not journal.done(poller["Uri"], "updated")]
+                journaled += len(page) - len(unfinished)
+                pending = [poller["Uri"] for poller in unfinished if poller["PollerType"] != args.pollerType]
+                if journal is not None:
+                    for poller in unfinished:
+                        if poller["PollerType"] == args.pollerType:
+                            journal.record(poller["Uri"], "updated", PollerType=args.pollerType)
+                pageErrors = apply_updates(pending, journal)
+                updated += len(pending) - len(pageErrors)
+                errors.update(pageErrors)
         except Exception as e:
-            print(" ".join(["Update poller with Uri", uri, "failed. Details:", str(e.args)]))
+            print(" ".join(["Selecting pollers failed. Details:", str(e.args)]))
+        if journal is not None:
+            journal.close()
+        for uri in errors:
+            print(" ".join(["Update poller with Uri", uri, "failed. Details:", errors[uri]]))
+        print(" ".join(["Updated", str(updated), "of", str(selected), "selected pollers,", str(len(errors)), "failed,", str(journaled), "already done according to the journal; the rest already had type", args.pollerType]))
+        report_metrics(swis, args.metricsFile, "bulk-update-solarwinds-memory-poller")
+        quit()
+
+    # Change the poller type in bulk, a chunk at a time, skipping pollers that already have it
+    # and pollers the journal says an earlier run already did
+    if args.manifest is not None:
+        uris = (row["uri"] for row in read_manifest(args.manifest, "uri"))
+    else:
+        uris = dict.fromkeys(uris)
+
+    listed = 0
+    journaled = 0
+    updated = 0
+    errors = {}
+    try:
+        for batch in iter_batches(uris, args.chunkSize):
+            listed += len(batch)
+            unfinished = [uri for uri in batch if journal is None or not journal.done(uri, "updated")]
+            journaled += len(batch) - len(unfinished)
+            batch = unfinished
+            pending = pollers_needing_update(swis, batch, args.pollerType, args.chunkSize)
+            if journal is not None:
+                for uri in batch:
+                    if uri not in pending:
+                        journal.record(uri, "updated", PollerType=args.pollerType)
+            batchErrors = apply_updates(pending, journal)
+            updated += len(pending) - len(batchErrors)
+            errors.update(batchErrors)
+    except Exception as e:
+        print(" ".join(["Reading manifest", str(args.manifest), "failed. Details:", str(e.args)]))
+
+    if journal is not None:
+        journal.close()
+    for uri in errors:
+        print(" ".join(["Update poller with Uri", uri, "failed. Details:", errors[uri]]))
+    print(" ".join(["Updated", str(updated), "of", str(listed), "listed pollers,", str(len(errors)), "failed,", str(journaled), "already done according to the journal; the rest already had type", args.pollerType]))
 
+    report_metrics(swis, args.metricsFile, "bulk-update-solarwinds-memory-poller")
@@ -4,7 +4,15 @@ import argparse
 import ipaddress
 import re
 import getpass
-from orionsdk import SwisClient
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from solarwinds_common import read_manifest, iter_batches, Journal, defaultBatchSize, InstrumentedSwisClient, report_metrics, make_swis_client, defaultSwisTimeout, RetryPolicy, defaultRetries, AdaptiveLimiter, defaultLatencyTarget, open_inventory_cache, defaultCacheTTL, run_query, AsyncSwisClient, defaultAsyncLimit, run_async, run_query_async
+
+# Component settings created in parallel on each target node
+defaultSettingConcurrency = 4
+
+# Target names looked up per Orion.Nodes query
+defaultResolveChunkSize = 100
 
 def getIP(hostname:str)->str:
     retval = socket.gethostbyname(hostname)
@@ -31,32 +39,222 @@ def validate_fqdn (fqdn_eval:str) -> None:
         if allowed.match(x) == None:
             raise Exception(" ".join([fqdn_eval, "is not a valid FQDN. Details:", fqdn_eval, "is not part of a valid FQDN", x]))
 
-def copy_apps(swis:object, sourceNodeIP:str, targetNode:str) -> None:
+def get_component_settings(swis:object, applicationIDs:list) -> dict:
+
+    # Get any overrides on the components of the given apps, grouped by ApplicationID
+    settings = {}
+    if len(applicationIDs) == 0:
+        return settings
+
     try:
-        response = swis.query("".join(["SELECT NodeID from Orion.Nodes where IPAddress ='",sourceNodeIP,"'"]))
-        sourceNodeID = response["results"][0]["NodeID"]
+        results = run_query(swis, "component_settings", applicationIds=[int(applicationID) for applicationID in applicationIDs])
     except Exception as e:
-        raise Exception(" ".join(["Error getting node ID for source Node", sourceNodeIP, ". Details:", str(e.args)]))
+        raise Exception(" ".join(["Error getting component settings for applications. Details:", str(e.args)]))
+
+    for setting in results:
+        settings.setdefault(setting["ApplicationID"], []).append(setting)
+
+    return settings
+
+def get_component_map(swis:object, applicationIDs:list) -> dict:
+
+    # Map (ApplicationID, component TemplateID) to ComponentID for the given apps
+    components = {}
+    if len(applicationIDs) == 0:
+        return components
 
     try:
-        response = swis.query("".join(["SELECT NodeID from Orion.Nodes where Caption ='",targetNode,"' or IPAddress = '",targetNode,"'"]))
-        if len(response["results"]) > 1:
-            raise Exception(" ".join(["Multiple matches for target node", targetNode, ". Details:", str(e.args)]))
-        if len(response["results"]) == 0:
-            raise Exception(" ".join(["No match for target node", targetNode, ". Details:", str(e.args)]))
-        targetNodeID = response["results"][0]["NodeID"]
+        results = run_query(swis, "component_map", applicationIds=[int(applicationID) for applicationID in applicationIDs])
     except Exception as e:
-        raise Exception(" ".join(["Error getting node ID for target node", targetNode, ". Details:", str(e.args)]))
+        raise Exception(" ".join(["Error getting components of new applications. Details:", str(e.args)]))
+
+    for component in results:
+        components[(component["ApplicationID"], component["TemplateID"])] = component["ComponentID"]
+
+    return components
+
+def create_component_settings(swis:object, settings:list, concurrency:int=defaultSettingConcurrency) -> list:
+
+    # Create the component settings with a bounded pool.
+    # Returns, in order, the new setting ID or the exception raised for each setting.
+    def create_one(properties:dict) -> object:
+        try:
+            return swis.create(
+                "Orion.APM.ComponentSetting",
+                **properties
+            )
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(settings) or 1))) as executor:
+        return list(executor.map(create_one, settings))
+
+def get_source_apps(swis:object, sourceNodeIP:str, cache:object=None) -> dict:
+
+    # Everything copy_apps needs from the source node, read once and reused for every target
+    cached = cache.find_nodes(ipAddress=sourceNodeIP) if cache is not None else []
+    if len(cached) == 1:
+        sourceNodeID = cached[0]["NodeID"]
+    else:
+        try:
+            sourceNodeID = run_query(swis, "node_id_by_ip", ip=sourceNodeIP)[0]["NodeID"]
+        except Exception as e:
+            raise Exception(" ".join(["Error getting node ID for source Node", sourceNodeIP, ". Details:", str(e.args)]))
 
     try:
-        response = swis.query("".join(["SELECT Uri, ApplicationID, ApplicationTemplateID from Orion.APM.Application where NodeID ='",str(sourceNodeID),"'"]))
-        applications = response["results"]
+        applications = run_query(swis, "node_applications", nodeId=sourceNodeID)
     except Exception as e:
         raise Exception(" ".join(["Error getting applications for source Node", sourceNodeIP, ". Details:", str(e.args)]))
 
+    # Read the component overrides of every source application in one query
+    settings = get_component_settings(swis, [app["ApplicationID"] for app in applications])
+
+    return {"NodeID": sourceNodeID, "Applications": applications, "Settings": settings}
+
+def resolve_targets(swis:object, targets:list, chunkSize:int=defaultResolveChunkSize, cache:object=None) -> tuple:
+
+    # Look up the NodeID of every target by Caption or IP address, a chunk of targets per query.
+    # Returns the targets that matched exactly one node, and an error message for every other target.
+    # Targets found in the inventory cache are not looked up in SWIS; the ones that are get added to it.
+    resolved = {}
+    problems = {}
+    if cache is not None:
+        for target in targets:
+            matches = [node["NodeID"] for node in cache.find_nodes(caption=target, ipAddress=target)]
+            if len(matches) > 1:
+                problems[target] = " ".join(["Multiple matches for target node", target, ". Node IDs:", ", ".join([str(nodeID) for nodeID in matches])])
+            elif len(matches) == 1:
+                resolved[target] = matches[0]
+        targets = [target for target in targets if target not in resolved and target not in problems]
+
+    for start in range(0, len(targets), chunkSize):
+        chunk = targets[start:start + chunkSize]
+        try:
+            nodes = run_query(swis, "nodes_by_name", names=chunk)
+        except Exception as e:
+            for target in chunk:
+                problems[target] = " ".join(["Error getting node ID for target node", target, ". Details:", str(e.args)])
+            continue
+
+        if cache is not None:
+            cache.add_nodes(nodes)
+
+        for target in chunk:
+            # Orion compares Caption without regard to case
+            matches = [node["NodeID"] for node in nodes if str(node["Caption"]).lower() == target.lower() or node["IPAddress"] == target]
+            if len(matches) > 1:
+                problems[target] = " ".join(["Multiple matches for target node", target, ". Node IDs:", ", ".join([str(nodeID) for nodeID in matches])])
+            elif len(matches) == 0:
+                problems[target] = " ".join(["No match for target node", target])
+            else:
+                resolved[target] = matches[0]
+
+    return resolved, problems
+
+def component_setting_properties(sourceSettings:dict, newApps:dict, pendingApps:list, targetComponents:dict) -> tuple:
+
+    # The component settings to create on the new apps, and the source app each one belongs to
+    properties = []
+    owners = []
+    for sourceAppID in pendingApps:
+        for setting in sourceSettings.get(sourceAppID, []):
+            component = targetComponents.get((newApps[sourceAppID], setting["TemplateID"]))
+            if component is None:
+                continue
+            print("    ComponentID=",component,"Key=",setting["Key"],"Value=",setting["Value"],"Type=",setting["ValueType"], "Required=",setting["Required"])
+            properties.append({
+                "ComponentID":component,
+                "Key":setting["Key"],
+                "Required":setting["Required"],
+                "Value":setting["Value"],
+                "ValueType":setting["ValueType"]
+            })
+            owners.append(sourceAppID)
+    return properties, owners
+
+def record_component_settings(targetNode:str, pendingApps:list, owners:list, outcomes:list, journal:object=None) -> None:
+
+    # Note in the journal which apps got all their settings, and fail if any setting didn't make it.
+    # outcomes has the new setting ID or the exception for each setting, in the order of owners.
+    failedApps = set()
+    errors = []
+    for sourceAppID, newSettingID in zip(owners, outcomes):
+        if isinstance(newSettingID, Exception):
+            failedApps.add(sourceAppID)
+            errors.append(str(newSettingID.args))
+        else:
+            print(newSettingID)
+
+    if journal is not None:
+        for sourceAppID in pendingApps:
+            if sourceAppID not in failedApps:
+                journal.record(targetNode, "".join(["settings:", str(sourceAppID)]))
+
+    if len(errors) > 0:
+        raise Exception(" ".join([str(len(errors)), "component settings could not be created:", "; ".join(errors)]))
+
+def get_existing_apps(swis:object, nodeIDs:list, chunkSize:int=defaultResolveChunkSize) -> dict:
+
+    # Application monitors the given nodes already have, as {NodeID: {ApplicationTemplateID: [ApplicationIDs]}},
+    # a chunk of nodes per query
+    existing = dict([(nodeID, {}) for nodeID in nodeIDs])
+    for start in range(0, len(nodeIDs), chunkSize):
+        try:
+            for app in run_query(swis, "applications_of_nodes", nodeIds=nodeIDs[start:start + chunkSize]):
+                existing.setdefault(app["NodeID"], {}).setdefault(app["ApplicationTemplateID"], []).append(app["ApplicationID"])
+        except Exception as e:
+            raise Exception(" ".join(["Unable to read application monitors of target nodes from Solarwinds. Details:", str(e.args)]))
+    return existing
+
+def match_existing_apps(applications:list, existingApps:dict, claimed:set=None) -> dict:
+
+    # Pair source apps with apps the target already has from the same template, as {source ApplicationID: ApplicationID}.
+    # A template is matched as many times as the target has apps from it, so a source node with two apps
+    # from one template still gets the second one created on a target that has only one.
+    # Apps in claimed, created by an earlier run for other source apps, aren't paired again.
+    unclaimed = dict([(templateID, sorted([appID for appID in appIDs if appID not in (claimed or set())])) for templateID, appIDs in existingApps.items()])
+    matches = {}
+    for app in applications:
+        if len(unclaimed.get(app["ApplicationTemplateID"], [])) > 0:
+            matches[app["ApplicationID"]] = unclaimed[app["ApplicationTemplateID"]].pop(0)
+    return matches
+
+def copy_apps(swis:object, sourceNodeIP:str, targetNode:str, settingConcurrency:int=defaultSettingConcurrency, sourceApps:dict=None, targetNodeID:int=None, journal:object=None, cache:object=None, existingApps:dict=None) -> None:
+
+    # existingApps maps the ApplicationTemplateIDs the target already has to its ApplicationIDs.
+    # Source apps paired with one of them by match_existing_apps are left alone: neither created nor given settings.
+
+    # Read the source node unless the caller already has it
+    if sourceApps is None:
+        sourceApps = get_source_apps(swis, sourceNodeIP, cache)
+
+    # Look up the target node unless the caller already has it
+    if targetNodeID is None:
+        resolved, problems = resolve_targets(swis, [targetNode], cache=cache)
+        if targetNode in problems:
+            raise Exception(problems[targetNode])
+        targetNodeID = resolved[targetNode]
+
+    applications = sourceApps["Applications"]
+    sourceSettings = sourceApps["Settings"]
+
     try:
         # Create app monitor with inherited credentials. Explicit credentials will copy later.
+        # Apps an earlier run already created, according to the journal, are reused.
+        newApps = {}
+        for app in applications:
+            appStep = "".join(["app:", str(app["ApplicationID"])])
+            if journal is not None and journal.done(targetNode, appStep):
+                newApps[app["ApplicationID"]] = journal.get(targetNode, appStep)["ApplicationID"]
+        matches = match_existing_apps([app for app in applications if app["ApplicationID"] not in newApps], existingApps or {}, set(newApps.values()))
         for app in applications:
+            appStep = "".join(["app:", str(app["ApplicationID"])])
+            if app["ApplicationID"] in newApps:
+                continue
+            if app["ApplicationID"] in matches:
+                print("Node ID",targetNodeID,"already has application ID",matches[app["ApplicationID"]],"from template",app["ApplicationTemplateID"])
+                continue
+
             templateID = (app["ApplicationTemplateID"])
             appParams = [
                 targetNodeID,
@@ -70,51 +268,172 @@ def copy_apps(swis:object, sourceNodeIP:str, targetNode:str) -> None:
                 *appParams
             )
             print("Created new app on Node ID",targetNodeID,"with application ID",newAppID)
+            newApps[app["ApplicationID"]] = newAppID
+            if journal is not None:
+                journal.record(targetNode, appStep, ApplicationID=newAppID)
 
-            # Get any overrides on the components of the app being copied
-            # and set them on the components of the new app
-            # Setting it up as a separate query string because it's easier to read
-            query = "".join([
-                """SELECT Source.ComponentID as [Source]
-                , Target.ComponentID as [Target]
-                , Source.TemplateID
-                , CS.Key, CS.Value, CS.ValueType, CS.Required
-                FROM Orion.APM.Component Source
-                INNER JOIN Orion.APM.ComponentSetting CS on Source.ComponentID=CS.ComponentID
-                INNER JOIN Orion.APM.Component Target on Source.TemplateID=Target.TemplateID
-                where Source.ApplicationID = '""",
-                str(app["ApplicationID"]),
-                "' and Target.ApplicationID = '",
-                str(newAppID),
-                "'"
-            ])
-            response = swis.query(query)
-            componentSettings = response["results"]
-
-            for setting in componentSettings:
-                print("    ComponentID=",setting["Target"],"Key=",setting["Key"],"Value=",setting["Value"],"Type=",setting["ValueType"], "Required=",setting["Required"])
-                properties = {
-                    "ComponentID":setting["Target"],
-                    "Key":setting["Key"],
-                    "Required":setting["Required"],
-                    "Value":setting["Value"],
-                    "ValueType":setting["ValueType"]
-                }
-                newSettingID = swis.create(
-                    "Orion.APM.ComponentSetting",
-                    **properties
-                )
-                print(newSettingID)
+        # Only the apps whose overrides haven't been set yet still need them
+        pendingApps = [sourceAppID for sourceAppID in newApps if journal is None or not journal.done(targetNode, "".join(["settings:", str(sourceAppID)]))]
+
+        # Map each component template of the new apps to the component created from it
+        targetComponents = get_component_map(swis, [newApps[sourceAppID] for sourceAppID in pendingApps])
+
+        # Set the overrides on the components of the new apps
+        properties, owners = component_setting_properties(sourceSettings, newApps, pendingApps, targetComponents)
+        record_component_settings(targetNode, pendingApps, owners, create_component_settings(swis, properties, settingConcurrency), journal)
     except Exception as e:
         raise Exception(" ".join(["Error creating applications on target node", targetNode, ". Details:", str(e.args)]))
-        
+
+    if journal is not None:
+        journal.record(targetNode, "finished", NodeID=targetNodeID)
+
+def plan_apps_batch(swis:object, sourceNodeIP:str, targets:list, sourceApps:dict, strict:bool=False, journal:object=None, cache:object=None, preflight:bool=True) -> list:
+
+    # The targets of a batch that need applications, as (target, NodeID, existing apps) tuples.
+    # Targets finished by an earlier run, according to the journal, are not even looked up
+    if journal is not None:
+        for target in targets:
+            if journal.done(target, "finished"):
+                print(" ".join(["Copy application monitors", target, "from", sourceNodeIP,"skipped. Details: already copied according to the journal"]))
+        targets = [target for target in targets if not journal.done(target, "finished")]
+
+    # Find every target node before changing anything
+    resolved, problems = resolve_targets(swis, targets, cache=cache)
+    for target in targets:
+        if target in problems:
+            print(" ".join(["Copy application monitors", target, "from", sourceNodeIP,"skipped. Details:", problems[target]]))
+    if len(problems) > 0 and strict:
+        raise Exception(" ".join([str(len(problems)), "of", str(len(targets)), "target nodes could not be resolved. Nothing was changed for these targets."]))
+
+    # The pre-flight check reads the monitors every target already has in one query per chunk,
+    # so targets that have them all are skipped and the rest only get the ones they lack
+    existing = {}
+    if preflight and len(resolved) > 0:
+        existing = get_existing_apps(swis, list(dict.fromkeys(resolved.values())))
+
+    planned = []
+    for target in targets:
+        if target not in resolved:
+            continue
+        # Apps an earlier run created may still need their settings, so those targets aren't skipped
+        resuming = journal is not None and any([journal.done(target, "".join(["app:", str(app["ApplicationID"])])) for app in sourceApps["Applications"]])
+        if preflight and not resuming and len(match_existing_apps(sourceApps["Applications"], existing.get(resolved[target], {}))) == len(sourceApps["Applications"]):
+            print(" ".join(["Copy application monitors", target, "from", sourceNodeIP,"skipped. Details: every application monitor is already on the node"]))
+            continue
+        planned.append((target, resolved[target], existing.get(resolved[target])))
+    return planned
+
+def copy_apps_batch(swis:object, sourceNodeIP:str, targets:list, sourceApps:dict, settingConcurrency:int=defaultSettingConcurrency, strict:bool=False, journal:object=None, cache:object=None, preflight:bool=True) -> None:
+
+    # Copy applications from source node to target nodes
+    for target, targetNodeID, existingApps in plan_apps_batch(swis, sourceNodeIP, targets, sourceApps, strict, journal, cache, preflight):
+        try:
+            copy_apps(swis=swis, sourceNodeIP=sourceNodeIP, targetNode=target, settingConcurrency=settingConcurrency, sourceApps=sourceApps, targetNodeID=targetNodeID, journal=journal, existingApps=existingApps)
+            print(" ".join(["Copy application monitors from",sourceNodeIP,"to",target,"succeeded"]))
+        except Exception as e:
+            print(" ".join(["Copy application monitors", target, "from", sourceNodeIP,"failed. Details:", str(e.args)]))
+
+async def get_component_map_async(swis:object, applicationIDs:list) -> dict:
+
+    # get_component_map for an AsyncSwisClient
+    components = {}
+    if len(applicationIDs) == 0:
+        return components
+
+    try:
+        results = await run_query_async(swis, "component_map", applicationIds=[int(applicationID) for applicationID in applicationIDs])
+    except Exception as e:
+        raise Exception(" ".join(["Error getting components of new applications. Details:", str(e.args)]))
+
+    for component in results:
+        components[(component["ApplicationID"], component["TemplateID"])] = component["ComponentID"]
+
+    return components
+
+async def copy_apps_async(swis:object, sourceNodeIP:str, targetNode:str, sourceApps:dict, targetNodeID:int, journal:object=None, existingApps:dict=None) -> None:
+
+    # copy_apps for an AsyncSwisClient, with every app and then every component setting created at once.
+    # The caller reads the source node and resolves the target.
+    try:
+        newApps = {}
+        toCreate = []
+        for app in sourceApps["Applications"]:
+            appStep = "".join(["app:", str(app["ApplicationID"])])
+            if journal is not None and journal.done(targetNode, appStep):
+                newApps[app["ApplicationID"]] = journal.get(targetNode, appStep)["ApplicationID"]
+        matches = match_existing_apps([app for app in sourceApps["Applications"] if app["ApplicationID"] not in newApps], existingApps or {}, set(newApps.values()))
+        for app in sourceApps["Applications"]:
+            if app["ApplicationID"] in newApps:
+                continue
+            if app["ApplicationID"] in matches:
+                print("Node ID",targetNodeID,"already has application ID",matches[app["ApplicationID"]],"from template",app["ApplicationTemplateID"])
+            else:
+                toCreate.append(app)
+
+        # Create app monitors with credentials inherited from the application template
+        outcomes = await asyncio.gather(*[swis.invoke('Orion.APM.Application', 'CreateApplication', targetNodeID, app["ApplicationTemplateID"], -4, False) for app in toCreate], return_exceptions=True)
+        errors = []
+        for app, newAppID in zip(toCreate, outcomes):
+            if isinstance(newAppID, Exception):
+                errors.append(str(newAppID.args))
+                continue
+            print("Created new app on Node ID",targetNodeID,"with application ID",newAppID)
+            newApps[app["ApplicationID"]] = newAppID
+            if journal is not None:
+                journal.record(targetNode, "".join(["app:", str(app["ApplicationID"])]), ApplicationID=newAppID)
+
+        # Only the apps whose overrides haven't been set yet still need them
+        pendingApps = [sourceAppID for sourceAppID in newApps if journal is None or not journal.done(targetNode, "".join(["settings:", str(sourceAppID)]))]
+        targetComponents = await get_component_map_async(swis, [newApps[sourceAppID] for sourceAppID in pendingApps])
+        properties, owners = component_setting_properties(sourceApps["Settings"], newApps, pendingApps, targetComponents)
+        settingOutcomes = await asyncio.gather(*[swis.create("Orion.APM.ComponentSetting", **setting) for setting in properties], return_exceptions=True)
+        record_component_settings(targetNode, pendingApps, owners, settingOutcomes, journal)
+
+        if len(errors) > 0:
+            raise Exception(" ".join([str(len(errors)), "applications could not be created:", "; ".join(errors)]))
+    except Exception as e:
+        raise Exception(" ".join(["Error creating applications on target node", targetNode, ". Details:", str(e.args)]))
+
+    if journal is not None:
+        journal.record(targetNode, "finished", NodeID=targetNodeID)
+
+async def copy_apps_batch_async(asyncSwis:object, swis:object, sourceNodeIP:str, targets:list, sourceApps:dict, strict:bool=False, journal:object=None, cache:object=None, preflight:bool=True) -> None:
+
+    # copy_apps_batch with every target copied at once on the event loop, limited only by the calls in flight
+    # allowed by the open AsyncSwisClient asyncSwis. The lookups before copying use the blocking client swis.
+    async def copy_one(target:str, targetNodeID:int, existingApps:dict) -> None:
+        try:
+            await copy_apps_async(asyncSwis, sourceNodeIP, target, sourceApps, targetNodeID, journal, existingApps)
+            print(" ".join(["Copy application monitors from",sourceNodeIP,"to",target,"succeeded"]))
+        except Exception as e:
+            print(" ".join(["Copy application monitors", target, "from", sourceNodeIP,"failed. Details:", str(e.args)]))
+
+    await asyncio.gather(*[copy_one(*planned) for planned in plan_apps_batch(swis, sourceNodeIP, targets, sourceApps, strict, journal, cache, preflight)])
+
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(description="Copy a Solarwinds node")
     parser.add_argument("-s", "--sourceNodeIP", metavar="SOURCE_NODE_IP", action="store", type=str, dest="sourceNodeIP", required=True, help="Source node IP in Solarwinds")
     parser.add_argument("-S", "--server", metavar="SW_SERVER", action="store", type=str, dest="swisInfo", default="localhost", help="IP or FQDN of Solarwinds server")
-    parser.add_argument("-t", "--targetNode", metavar="TARGET_NODE", action="append", type=str, dest="targets", required=True, help="FQDN of new node")
+    parser.add_argument("-t", "--targetNode", metavar="TARGET_NODE", action="append", type=str, dest="targets", default=[], required=False, help="FQDN of new node")
+    parser.add_argument("-m", "--manifest", metavar="MANIFEST", action="store", type=str, dest="manifest", default=None, required=False, help="CSV or JSON Lines file with a 'target' column naming the target nodes, read as the run goes. Use - for standard input")
+    parser.add_argument("-j", "--journal", metavar="JOURNAL", action="store", type=str, dest="journal", default=None, required=False, help="Journal file recording each completed step. Rerunning with the same journal resumes where the last run stopped")
+    parser.add_argument("--batch-size", metavar="N", action="store", type=int, dest="batchSize", default=defaultBatchSize, required=False, help="Number of manifest targets looked up and copied together")
     parser.add_argument("-w", "--wait", metavar="WAIT_TIME", action="store", type=int, dest="waitTime", default=0, required=False, help="Seconds to wait between creating each node and setting custom properties")
+    parser.add_argument("--strict", action="store_true", dest="strict", default=False, required=False, help="Do not copy anything if any target node is missing or ambiguous. With a manifest this applies to each batch")
+    parser.add_argument("--allow-duplicates", action="store_false", dest="preflight", default=True, required=False, help="Create every application monitor even if the target node already has one from the same template")
+    parser.add_argument("--setting-concurrency", metavar="N", action="store", type=int, dest="settingConcurrency", default=defaultSettingConcurrency, required=False, help="Number of component settings to create in parallel on each target node")
+    parser.add_argument("--cache", metavar="CACHE_FILE", action="store", type=str, dest="cache", default=None, required=False, help="SQLite file caching Orion nodes, polling engines and application templates between runs")
+    parser.add_argument("--cache-ttl", metavar="SECONDS", action="store", type=int, dest="cacheTTL", default=defaultCacheTTL, required=False, help="Age after which the cache is pulled from Orion in full again")
+    parser.add_argument("--refresh", action="store_true", dest="refresh", default=False, required=False, help="Pull the whole cache from Orion again now")
+    parser.add_argument("--ca-bundle", metavar="PEM", action="store", type=str, dest="caBundle", default=None, required=False, help="Verify the SWIS server certificate against this CA bundle. Without it the certificate is not checked")
+    parser.add_argument("--retries", metavar="N", action="store", type=int, dest="retries", default=defaultRetries, required=False, help="Times to repeat a SWIS call that failed with a transient error. Queries, reads and updates are repeated after any transient error, creates only when SWIS never started on them")
+    parser.add_argument("--adaptive", action="store_true", dest="adaptive", default=False, required=False, help="Start with few SWIS calls in flight and add more while Orion keeps up, backing off when it slows down or fails. Concurrency from --setting-concurrency sets the most calls in flight")
+    parser.add_argument("--latency-target", metavar="MS", action="store", type=int, dest="latencyTarget", default=int(defaultLatencyTarget * 1000), required=False, help="Mean SWIS latency above which --adaptive cuts the calls in flight")
+    parser.add_argument("--async", action="store_true", dest="asyncMode", default=False, required=False, help="Copy to every target of a batch at once on one asyncio event loop instead of one target at a time. Needs the aiohttp package. --async-limit bounds the SWIS calls in flight")
+    parser.add_argument("--async-limit", metavar="N", action="store", type=int, dest="asyncLimit", default=defaultAsyncLimit, required=False, help="Most SWIS calls in flight with --async")
+    parser.add_argument("--timeout", metavar="SECONDS", action="store", type=int, dest="timeout", default=defaultSwisTimeout, required=False, help="Longest time to wait for each SWIS response")
+    parser.add_argument("--metrics-file", metavar="PROM_FILE", action="store", type=str, dest="metricsFile", default=None, required=False, help="Write SWIS call counts and latencies to this Prometheus textfile at the end of the run")
     args = parser.parse_args()
 
     # Sanity test for the command line
@@ -130,6 +449,18 @@ if __name__ == '__main__':
                 validate_ip(target)
             except:
                 validate_fqdn(target)
+
+        if args.settingConcurrency < 1 or args.asyncLimit < 1:
+            raise Exception(" ".join(["Concurrency must be at least 1, got", str(min(args.settingConcurrency, args.asyncLimit))]))
+
+        if args.asyncMode and args.adaptive:
+            raise Exception("--adaptive works with the threaded copy only, not with --async")
+
+        if args.batchSize < 1:
+            raise Exception(" ".join(["Batch size must be at least 1, got", str(args.batchSize)]))
+
+        if len(args.targets) == 0 and args.manifest is None:
+            raise Exception("Give the target nodes with -t or a manifest with -m")
     except Exception as e:
         print(" ".join(["Illegal value on command line. Details:", str(e.args)]))
         quit()
@@ -137,25 +468,74 @@ if __name__ == '__main__':
     username = input("Username: ")
     password = getpass.getpass("Password: ")
     
-    # Allow swis to ignore certificate warnings
-    verify = False
-    if not verify:
-        import urllib3
-        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
-    # Create the SWIS connection and run a simple test
+    # Create the SWIS connection, pooled for every worker, and run a simple test
+    workers = args.settingConcurrency
+    limiter = AdaptiveLimiter(workers, latencyTarget=args.latencyTarget / 1000) if args.adaptive else None
     try:
-        swis = SwisClient("solarwinds.ci.northwestern.edu", username, password)
-        response = swis.query("SELECT Top 1 NodeID from Orion.Nodes")
+        swis = InstrumentedSwisClient(make_swis_client("solarwinds.ci.northwestern.edu", username, password, workers, args.caBundle, args.timeout), retryPolicy=RetryPolicy(args.retries), limiter=limiter)
+        response = run_query(swis, "probe")
     except Exception as e:
         print("Unable to connect to SWIS server")
         quit()
+
+    # With --async the applications are copied by an asyncio client counted in the same metrics
+    asyncSwis = None
+    if args.asyncMode:
+        try:
+            asyncSwis = AsyncSwisClient("solarwinds.ci.northwestern.edu", username, password, args.caBundle, args.timeout, args.asyncLimit, metrics=swis.metrics, retryPolicy=swis.retryPolicy)
+        except Exception as e:
+            print(" ".join(["Unable to use --async. Details:", str(e.args)]))
+            quit()
+
+    cache = open_inventory_cache(args.cache, "solarwinds.ci.northwestern.edu", swis, args.cacheTTL, args.refresh)
         
-    # Copy applications from source node to target nodes
-    for target in args.targets:
+    # Read the source node once for all targets
+    try:
+        sourceApps = get_source_apps(swis, args.sourceNodeIP, cache)
+    except Exception as e:
+        print(" ".join(["Unable to read source node", args.sourceNodeIP, "Details:", str(e.args)]))
+        quit()
+
+    try:
+        journal = Journal(args.journal) if args.journal else None
+    except Exception as e:
+        print(" ".join(["Unable to open journal. Details:", str(e.args)]))
+        quit()
+
+    # A batch that fails, such as one --strict refuses, is reported and the next batch still runs
+    def copy_batch(targets:list) -> None:
         try:
-            copy_apps(swis=swis, sourceNodeIP=args.sourceNodeIP, targetNode=target)
-            print(" ".join(["Copy application monitors from",args.sourceNodeIP,"to",target,"succeeded"]))
+            if asyncSwis is not None:
+                run_async(asyncSwis, copy_apps_batch_async, swis, args.sourceNodeIP, targets, sourceApps, args.strict, journal, cache, args.preflight)
+            else:
+                copy_apps_batch(swis, args.sourceNodeIP, targets, sourceApps, args.settingConcurrency, args.strict, journal, cache, args.preflight)
         except Exception as e:
-            print(" ".join(["Copy application monitors", target, "from", args.sourceNodeIP,"failed. Details:", str(e.args)]))
+            print(" ".join(["Copy application monitors to", ", ".join(targets), "from", args.sourceNodeIP, "failed. Details:", str(e.args)]))
+
+    # Copy to the targets on the command line, then to the manifest a batch at a time
+    try:
+        if len(args.targets) > 0:
+            copy_batch(args.targets)
+
+        if args.manifest is not None:
+            for batch in iter_batches((row["target"] for row in read_manifest(args.manifest, "target")), args.batchSize):
+                valid = []
+                for target in batch:
+                    try:
+                        try:
+                            validate_ip(target)
+                        except:
+                            validate_fqdn(target)
+                        valid.append(target)
+                    except Exception as e:
+                        print(" ".join(["Copy application monitors", target, "from", args.sourceNodeIP,"skipped. Details:", str(e.args)]))
+                copy_batch(valid)
+    except Exception as e:
+        print(" ".join(["Copy application monitors stopped. Details:", str(e.args)]))
+
+    if journal is not None:
+        journal.close()
+    if cache is not None:
+        cache.close()
 
+    report_metrics(swis, args.metricsFile, "copy-solarwinds-apps")
@@ -5,12 +5,131 @@ import ipaddress
 import re
 import getpass
 import time
-from orionsdk import SwisClient
+import json
+import heapq
+import os
+import threading
+import contextlib
+import asyncio
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from solarwinds_common import read_manifest, iter_batches, Journal, defaultBatchSize, InstrumentedSwisClient, report_metrics, make_swis_client, defaultSwisTimeout, RetryPolicy, defaultRetries, AdaptiveLimiter, defaultLatencyTarget, open_inventory_cache, defaultCacheTTL, run_query, run_swql, AsyncSwisClient, defaultAsyncLimit, run_async
+
+# Polling engines that never receive new nodes (SWQL LIKE patterns on DisplayName)
+defaultEngineExcludes = ["NUQ%", "swpoller04%"]
+
+# Pollers created in parallel for each new node
+defaultPollerConcurrency = 4
+
+# Longest pause between two readiness polls of a new node, in seconds
+maxReadyDelay = 15
+
+# Most new nodes that may sit in the readiness wait at once. Waiting nodes hold no SWIS slot.
+maxWaitingNodes = 100
+
+# Resolved addresses are reused for this many seconds
+dnsCacheTTL = 300
+
+# Lookups run in parallel by the DNS stage, and how long each one may take
+defaultDnsConcurrency = 16
+defaultDnsTimeout = 10
+
+dnsCache = {}
+dnsCacheLock = threading.Lock()
+
+# Targets looked up per pre-flight query
+preflightChunkSize = 100
+
+# Custom property URIs sent per BulkUpdate request
+customPropsChunkSize = 100
+
+# A saved source node snapshot older than this many seconds is read from SWIS again
+defaultSnapshotMaxAge = 3600
+
+# Manifest columns named with this prefix set a custom property of that target only, e.g. cp.Department
+customPropColumnPrefix = "cp."
 
 def getIP(hostname:str)->str:
-    retval = socket.gethostbyname(hostname)
+
+    # Prefer an IPv4 address, but accept an IPv6-only host
+    with dnsCacheLock:
+        cached = dnsCache.get(hostname.lower())
+    if cached is not None and cached[1] > time.monotonic():
+        return cached[0]
+
+    addresses = socket.getaddrinfo(hostname, None, proto=socket.IPPROTO_TCP)
+    ipv4 = [address[4][0] for address in addresses if address[0] == socket.AF_INET]
+    ipv6 = [address[4][0] for address in addresses if address[0] == socket.AF_INET6]
+    retval = (ipv4 + ipv6)[0]
+
+    with dnsCacheLock:
+        dnsCache[hostname.lower()] = (retval, time.monotonic() + dnsCacheTTL)
     return retval
 
+def resolve_hostnames(hostnames:list, concurrency:int=defaultDnsConcurrency, timeout:int=defaultDnsTimeout) -> tuple:
+
+    # Resolve every hostname in parallel before any SWIS work.
+    # Returns the addresses that resolved, and an error message for every hostname that did not.
+    resolved = {}
+    problems = {}
+    unique = list(dict.fromkeys(hostnames))
+    if len(unique) == 0:
+        return resolved, problems
+
+    # getaddrinfo can't be interrupted, so the lookups run on daemon threads. Each lookup gets `timeout`
+    # seconds from when it starts; one still hanging after that is given up on and its thread replaced,
+    # so the other names keep resolving, and the hung thread holds up neither the run nor its exit.
+    workers = max(1, min(concurrency, len(unique)))
+    waiting = queue.SimpleQueue()
+    for hostname in unique:
+        waiting.put(hostname)
+    started = {}
+    outcomes = {}
+    finished = threading.Condition()
+    stopped = threading.Event()
+
+    def lookup() -> None:
+        while not stopped.is_set():
+            try:
+                hostname = waiting.get_nowait()
+            except queue.Empty:
+                return
+            with finished:
+                started[hostname] = time.monotonic()
+            try:
+                outcome = (getIP(hostname), None)
+            except Exception as e:
+                outcome = (None, " ".join(["Unable resolve IP for target FQDN", hostname, ". Details:", str(e.args)]))
+            with finished:
+                if hostname in outcomes:
+                    # Timed out, and another thread has taken over this one's place
+                    return
+                outcomes[hostname] = outcome
+                finished.notify()
+
+    def start_worker() -> None:
+        threading.Thread(target=lookup, name="".join(["dns-", str(len(started))]), daemon=True).start()
+
+    for number in range(workers):
+        start_worker()
+
+    with finished:
+        while len(outcomes) < len(unique):
+            now = time.monotonic()
+            for hostname in [hostname for hostname in started if hostname not in outcomes and now - started[hostname] >= timeout]:
+                outcomes[hostname] = (None, " ".join(["Unable resolve IP for target FQDN", hostname, ". Details: timed out after", str(timeout), "seconds"]))
+                start_worker()
+            running = [started[hostname] for hostname in started if hostname not in outcomes]
+            finished.wait(min(running) + timeout - now if len(running) > 0 else timeout)
+        stopped.set()
+        for hostname in unique:
+            if outcomes[hostname][1] is not None:
+                problems[hostname] = outcomes[hostname][1]
+            else:
+                resolved[hostname] = outcomes[hostname][0]
+
+    return resolved, problems
+
 def validate_ip (ip_eval:str) -> None:
     try:
         ipaddress.ip_address(ip_eval)
@@ -32,38 +151,195 @@ def validate_fqdn (fqdn_eval:str) -> None:
         if allowed.match(x) == None:
             raise Exception(" ".join([fqdn_eval, "is not a valid FQDN. Details:", fqdn_eval, "is not part of a valid FQDN", x]))
 
-def copy_node(swis:object, sourceNodeIP:str, targetNodeName:str, waitTime:int=0) -> None:
+def get_source_snapshot(swis:object, sourceNodeIP:str, cache:object=None) -> dict:
 
-    # Resolve DNS for the new host
-    try:
-        targetNodeIP = getIP(targetNodeName)
-    except Exception as e:
-        raise Exception(" ".join(["Unable resolve IP for target FQDN", targetNodeName, ". Details:", str(e.args)]))
-   
-    # Get source node URI
+    # Everything copy_node needs to know about the source node, read once per run
+    # and shared by every target
+    snapshot = {"SourceNodeIP": sourceNodeIP}
+
+    # Get source node URI, from the inventory cache if there is one
     # Python understands that this is a dict delivered as JSON
-    try:
-        response = swis.query("".join(["SELECT Uri FROM Orion.Nodes WHERE IPAddress='",sourceNodeIP,"'"]))
-        sourceNodeURI = response["results"][0]["Uri"]
-    except Exception as e:
-        raise Exception(" ".join(["Unable get source node URI from Solarwinds. Details:", str(e.args)]))
+    cached = cache.find_nodes(ipAddress=sourceNodeIP) if cache is not None else []
+    if len(cached) == 1:
+        snapshot["Uri"] = cached[0]["Uri"]
+    else:
+        try:
+            snapshot["Uri"] = run_query(swis, "node_uri_by_ip", ip=sourceNodeIP)[0]["Uri"]
+        except Exception as e:
+            raise Exception(" ".join(["Unable get source node URI from Solarwinds. Details:", str(e.args)]))
 
     # Get source node properties
     # Python understands that this is a dict delivered as JSON
     try:
-        sourceNode = swis.read(sourceNodeURI)
+        sourceNode = swis.read(snapshot["Uri"])
     except Exception as e:
         raise Exception(" ".join(["Unable get properties of source node. Details:", str(e.args)]))
 
     # Define which custom properties will be copied from the source to the target
     nodePropsToCopy = ("MachineType", "ObjectSubType", "SNMPVersion", "Community") 
 
-    # Find the polling engine with the smallest current load
+    snapshot["NodeID"] = sourceNode["NodeID"]
+    snapshot["NodeProps"] = {}
+    for prop in nodePropsToCopy:
+        snapshot["NodeProps"][prop] = sourceNode[prop]
+
+    # Get the set of custom properties values from the source node
+    # Populate a dict with custom properties from the source node. Some members of this structure should not be copied.
+    try:
+        sourceNodeCustomProps = swis.read(snapshot["Uri"] + "/CustomProperties")
+    except Exception as e:
+        raise Exception(" ".join(["SWIS error reading custom properties from source node",sourceNodeIP,". Details:", str(e.args)]))
+
+    nodePropsNoCopy = ["NodeID", "DisplayName", "InstanceSiteId", "Uri", "InstanceType", "Description"]
+    snapshot["CustomProps"] = {}
+    for prop in sourceNodeCustomProps:
+        if prop not in nodePropsNoCopy:
+            snapshot["CustomProps"][prop]=sourceNodeCustomProps[prop]
+
+    # Get the set of pollers assigned the source node
+    try:
+        pollers = run_query(swis, "node_pollers", nodeId=snapshot["NodeID"])
+        snapshot["Pollers"] = [{"PollerType": poller["PollerType"], "Enabled": poller["Enabled"]} for poller in pollers]
+    except Exception as e:
+        raise Exception(" ".join(["SWIS error reading pollers from source node",sourceNodeIP,". Details:", str(e.args)]))
+
+    # Count the source node's application monitors, which will usually be copied too.
+    # Not every Orion install has SAM, so a failure here just means no applications.
+    try:
+        snapshot["ApplicationCount"] = run_query(swis, "node_application_count", nodeId=snapshot["NodeID"])[0]["Applications"]
+    except Exception as e:
+        snapshot["ApplicationCount"] = 0
+
+    return snapshot
+
+def save_source_snapshot(snapshot:dict, path:str, server:str) -> None:
+    # The snapshot includes the SNMP community, so keep it readable by the owner only.
+    # It records the server it was read from and when, for load_source_snapshot to check.
+    try:
+        with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+            json.dump(dict(snapshot, Server=server, CapturedAt=time.time()), f, indent=4, default=str)
+    except Exception as e:
+        raise Exception(" ".join(["Unable to save source node snapshot to", path, ". Details:", str(e.args)]))
+
+def load_source_snapshot(path:str, sourceNodeIP:str, server:str, maxAge:int=defaultSnapshotMaxAge) -> dict:
+    # Returns None if the snapshot is older than maxAge seconds, so the caller reads the source node again
     try:
-        response = swis.query("SELECT top 1 EngineID FROM Orion.Engines where ServerType='Additional' and DisplayName not like 'NUQ%' and DisplayName not like 'swpoller04%' order by Elements ASC")
-        engineID = response["results"][0]["EngineID"]
+        with open(path) as f:
+            snapshot = json.load(f)
     except Exception as e:
-        raise Exception(" ".join(["Unable get polling engine ID from Solarwinds. Details:", str(e.args)]))
+        raise Exception(" ".join(["Unable to load source node snapshot from", path, ". Details:", str(e.args)]))
+
+    # A snapshot of a different golden node, or of a node on another server, is never what the caller wants
+    if snapshot.get("SourceNodeIP") != sourceNodeIP:
+        raise Exception(" ".join(["Snapshot", path, "is for source node", str(snapshot.get("SourceNodeIP")), "not", sourceNodeIP]))
+    if str(snapshot.get("Server")).lower() != server.lower():
+        raise Exception(" ".join(["Snapshot", path, "was read from server", str(snapshot.get("Server")), "not", server]))
+
+    try:
+        age = time.time() - float(snapshot["CapturedAt"])
+    except Exception as e:
+        raise Exception(" ".join(["Snapshot", path, "has no capture time. Details:", str(e.args)]))
+    if age > maxAge or age < 0:
+        return None
+
+    return snapshot
+
+def get_engines(swis:object, excludePatterns:list=None, cache:object=None) -> list:
+
+    # Read every additional polling engine that may receive new nodes, with its current element count.
+    # The inventory cache has them as of its last full pull, plus the nodes this script placed since.
+    if excludePatterns is None:
+        excludePatterns = defaultEngineExcludes
+
+    if cache is not None:
+        engines = cache.get_engines(excludePatterns)
+        if len(engines) > 0:
+            return engines
+
+    query = "SELECT EngineID, DisplayName, Elements FROM Orion.Engines where ServerType='Additional'"
+    params = {}
+    for index, pattern in enumerate(excludePatterns):
+        query = "".join([query, " and DisplayName not like @exclude", str(index)])
+        params["".join(["exclude", str(index)])] = pattern
+
+    try:
+        engines = run_swql(swis, query, **params)
+    except Exception as e:
+        raise Exception(" ".join(["Unable get polling engines from Solarwinds. Details:", str(e.args)]))
+
+    if len(engines) == 0:
+        raise Exception(" ".join(["No polling engines left after excluding", ", ".join(excludePatterns)]))
+
+    return engines
+
+def find_existing_nodes(swis:object, targets:list, targetIPs:dict, chunkSize:int=preflightChunkSize) -> tuple:
+
+    # Look for nodes Orion already has for the targets, by Caption, DNS name or IP address,
+    # a chunk of targets per query. Returns the node found for each target that matched exactly one
+    # by name, and an error message for each target that matched several, or only a node with its
+    # address under another name: that node belongs to someone else and is left alone.
+    found = {}
+    conflicts = {}
+    for start in range(0, len(targets), chunkSize):
+        chunk = targets[start:start + chunkSize]
+        ips = [targetIPs[target] for target in chunk if target in targetIPs]
+        try:
+            nodes = run_query(swis, "nodes_by_name_or_ip", names=chunk, ips=ips)
+        except Exception as e:
+            raise Exception(" ".join(["Unable to check Solarwinds for existing target nodes. Details:", str(e.args)]))
+
+        for target in chunk:
+            matches = [node for node in nodes if target.lower() in (str(node["Caption"]).lower(), str(node["DNS"]).lower()) or node["IPAddress"] == targetIPs.get(target)]
+            if len(matches) > 1:
+                conflicts[target] = " ".join(["Target matches several existing nodes. Node IDs:", ", ".join([str(node["NodeID"]) for node in matches])])
+            elif len(matches) == 1 and target.lower() not in (str(matches[0]["Caption"]).lower(), str(matches[0]["DNS"]).lower()):
+                conflicts[target] = " ".join(["Target IP address", str(matches[0]["IPAddress"]), "already belongs to node", str(matches[0]["Caption"]), "Node ID:", str(matches[0]["NodeID"])])
+            elif len(matches) == 1:
+                found[target] = matches[0]
+
+    return found, conflicts
+
+def find_existing_pollers(swis:object, nodeIDs:list, chunkSize:int=preflightChunkSize) -> dict:
+
+    # Poller types each of the given nodes already has, a chunk of nodes per query
+    pollers = dict([(nodeID, set()) for nodeID in nodeIDs])
+    for start in range(0, len(nodeIDs), chunkSize):
+        try:
+            for poller in run_query(swis, "pollers_of_nodes", nodeIds=nodeIDs[start:start + chunkSize]):
+                pollers.setdefault(poller["NetObjectID"], set()).add(poller["PollerType"])
+        except Exception as e:
+            raise Exception(" ".join(["Unable to read pollers of existing nodes from Solarwinds. Details:", str(e.args)]))
+    return pollers
+
+def projected_node_load(sourceSnapshot:dict) -> int:
+    # Elements a copy of the source node adds to its engine: the node, its pollers and its applications
+    return 1 + len(sourceSnapshot["Pollers"]) + sourceSnapshot.get("ApplicationCount", 0)
+
+def plan_engine_placement(engines:list, targets:list, nodeLoad:int=1) -> list:
+
+    # Orion only re-counts Elements periodically, so picking the least loaded engine per node
+    # puts a whole batch on the same engine. Instead, track the projected load of every engine
+    # and give each target to whichever engine is lightest after the targets placed before it.
+    # Returns the EngineID for each target, in the order the targets were given.
+    load = [(engine["Elements"] or 0, engine["EngineID"]) for engine in engines]
+    heapq.heapify(load)
+
+    placement = []
+    for target in targets:
+        elements, engineID = heapq.heappop(load)
+        placement.append(engineID)
+        heapq.heappush(load, (elements + nodeLoad, engineID))
+
+    return placement
+
+def print_placement(engines:list, placement:list, nodeLoad:int=1) -> None:
+    for engine in sorted(engines, key=lambda engine: engine["EngineID"]):
+        planned = placement.count(engine["EngineID"])
+        if planned > 0:
+            current = engine["Elements"] or 0
+            print(" ".join(["Engine", str(engine["DisplayName"]), "(EngineID", "".join([str(engine["EngineID"]), ")"]), "gets", str(planned), "new nodes, elements", str(current), "->", str(current + planned * nodeLoad)]))
+
+def target_node_props(targetNodeName:str, targetNodeIP:str, engineID:int, sourceSnapshot:dict) -> dict:
 
     # set up property bag for the new node
     targetNodeProps = {}
@@ -71,21 +347,114 @@ def copy_node(swis:object, sourceNodeIP:str, targetNodeName:str, waitTime:int=0)
     targetNodeProps["DNS"]=targetNodeName
     targetNodeProps["IP"]=targetNodeIP
     targetNodeProps["EngineID"]= engineID
-    for prop in nodePropsToCopy:
-        targetNodeProps[prop] = sourceNode[prop]
+    for prop in sourceSnapshot["NodeProps"]:
+        targetNodeProps[prop] = sourceSnapshot["NodeProps"][prop]
+    return targetNodeProps
+
+def target_node_pollers(nodeID:int, sourceSnapshot:dict, existingPollers:set=None) -> list:
+
+    # The source node's pollers as they are created on the target, less the types it already has
+    targetNodePollers = []
+    for poller in sourceSnapshot["Pollers"]:
+        if existingPollers is not None and poller["PollerType"] in existingPollers:
+            continue
+        targetNodePollers.append(
+            {
+                'PollerType': poller["PollerType"],
+                'NetObject': "".join(["N:",str(nodeID) ]),
+                'NetObjectType': "N",
+                'NetObjectID': nodeID,
+                'Enabled': poller["Enabled"]
+            }
+        )
+    return targetNodePollers
+
+def create_target_node(swis:object, sourceNodeIP:str, targetNodeName:str, sourceSnapshot:dict=None, engineID:int=None, targetNodeIP:str=None) -> str:
+
+    # Resolve DNS for the new host, unless the caller already has
+    if targetNodeIP is None:
+        try:
+            targetNodeIP = getIP(targetNodeName)
+        except Exception as e:
+            raise Exception(" ".join(["Unable resolve IP for target FQDN", targetNodeName, ". Details:", str(e.args)]))
+   
+    # Read the source node unless the caller already has it
+    if sourceSnapshot is None:
+        sourceSnapshot = get_source_snapshot(swis, sourceNodeIP)
+
+    # Find the polling engine with the smallest current load, unless the caller planned one
+    if engineID is None:
+        try:
+            engineID = run_query(swis, "least_loaded_engine")[0]["EngineID"]
+        except Exception as e:
+            raise Exception(" ".join(["Unable get polling engine ID from Solarwinds. Details:", str(e.args)]))
 
     # Create a new node
     try:
-        targetNodeURI = swis.create('Orion.Nodes', **targetNodeProps)
+        targetNodeURI = swis.create('Orion.Nodes', **target_node_props(targetNodeName, targetNodeIP, engineID, sourceSnapshot))
     except Exception as e:
         raise Exception(" ".join(["SWIS error creating new node", targetNodeName ,". Details:", str(e.args)]))
 
     print(" ".join(["Created new node",targetNodeName]))
 
-    # Pause to give Solarwinds time to perform any actions on node creation
-    if (waitTime > 0):
-        print(" ".join(["Wait",str(waitTime),"seconds while Solarwinds executes new node tasks"]))
-        time.sleep(waitTime)
+    return targetNodeURI
+
+def wait_for_node(swis:object, targetNodeName:str, targetNodeURI:str, waitTime:int=0, readyQuery:str=None, readyTimeout:int=300, swisSlot:object=None) -> None:
+
+    # Give Solarwinds time to perform any actions on node creation.
+    # With a readiness query, poll it with exponential backoff until it returns a row or the timeout passes.
+    # The query may use @uri, @caption and @nodeId. Without one, fall back to the fixed wait.
+    if readyQuery is None:
+        if (waitTime > 0):
+            print(" ".join(["Wait",str(waitTime),"seconds while Solarwinds executes new node tasks"]))
+            time.sleep(waitTime)
+        return
+
+    if swisSlot is None:
+        swisSlot = contextlib.nullcontext()
+
+    match = re.search(r"NodeID=(\d+)", targetNodeURI)
+    params = {"uri": targetNodeURI, "caption": targetNodeName, "nodeId": int(match.group(1)) if match else None}
+
+    print(" ".join(["Wait up to",str(readyTimeout),"seconds for new node",targetNodeName,"to be ready"]))
+    deadline = time.monotonic() + readyTimeout
+    delay = 1.0
+    while True:
+        try:
+            with swisSlot:
+                response = swis.query(readyQuery, **params)
+            if len(response["results"]) > 0:
+                return
+        except Exception as e:
+            print(" ".join(["Readiness query for new node", targetNodeName, "failed. Details:", str(e.args)]))
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            print(" ".join(["New node", targetNodeName, "not ready after", str(readyTimeout), "seconds, continuing anyway"]))
+            return
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, maxReadyDelay)
+
+def create_pollers(swis:object, pollers:list, concurrency:int=defaultPollerConcurrency) -> list:
+
+    # SWIS has no bulk create for Orion.Pollers, so create them in parallel with a bounded pool.
+    # Returns one error string per poller that could not be created.
+    def create_one(poller:dict) -> str:
+        try:
+            swis.create('Orion.Pollers', **poller)
+            return None
+        except Exception as e:
+            return " ".join([poller["PollerType"], str(e.args)])
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(pollers) or 1))) as executor:
+        errors = list(executor.map(create_one, pollers))
+
+    return [error for error in errors if error is not None]
+
+def finish_target_node(swis:object, sourceNodeIP:str, targetNodeName:str, targetNodeURI:str, sourceSnapshot:dict, pollerConcurrency:int=defaultPollerConcurrency, cache:object=None, existingPollers:set=None, updateCustomProps:bool=True) -> dict:
+
+    # Pollers whose type is in existingPollers are already on the node and aren't created again.
+    # Without updateCustomProps the caller sets the custom properties, see update_custom_properties.
 
     # Get the new node so we can refer to its properties and its NodeID
     try:
@@ -93,61 +462,420 @@ def copy_node(swis:object, sourceNodeIP:str, targetNodeName:str, waitTime:int=0)
     except Exception as e:
         raise Exception(" ".join(["SWIS error reading properties of new node", targetNodeName ,". Details:", str(e.args)]))
 
+    if cache is not None:
+        cache.add_nodes([targetNode])
+
     print(" ".join(["New node",targetNodeName,"created with Node ID",str(targetNode["NodeID"])]))
 
-    # Get the set of custom properties values from the source node
-    # Populate a dict with custom properties from the source node. Some members of this structure should not be copied.
     # Update the custom properties on the new node.
-    try:
-        sourceNodeCustomProps = swis.read(sourceNodeURI + "/CustomProperties")
-    except Exception as e:
-        raise Exception(" ".join(["SWIS error reading custom properties from source node",sourceNodeIP,". Details:", str(e.args)]))
+    if updateCustomProps:
+        try:
+            swis.update(targetNodeURI + "/CustomProperties", **sourceSnapshot["CustomProps"])
+        except Exception as e:
+            print("SWIS error updating custom properties for node %s (nodeID %s). Details: %s", targetNodeName, targetNode["NodeID"], str(e.args))
 
-    nodePropsNoCopy = ["NodeID", "DisplayName", "InstanceSiteId", "Uri", "InstanceType", "Description"]
-    targetNodeCustomProps = {}
+    # Create pollers on the new node
+    pollers = target_node_pollers(targetNode["NodeID"], sourceSnapshot, existingPollers)
+    pollerErrors = create_pollers(swis, pollers, pollerConcurrency)
+    for error in pollerErrors:
+        print(" ".join(["SWIS error creating pollers for node", targetNodeName, "(nodeID", "".join([str(targetNode["NodeID"]), "). Details:"]), error]))
+
+    return {"NodeID": targetNode["NodeID"], "Uri": targetNodeURI, "PollersAttempted": len(pollers), "PollerErrors": pollerErrors}
+
+def manifest_custom_props(row:dict) -> dict:
+
+    # The custom properties a manifest row sets for its target, from its cp.<Name> columns.
+    # Empty cells keep the source node's value.
+    return dict([(column[len(customPropColumnPrefix):], value) for column, value in row.items() if column.startswith(customPropColumnPrefix) and value not in (None, "")])
+
+def update_custom_properties(swis:object, nodes:list, sharedProps:dict, overrides:dict=None, chunkSize:int=customPropsChunkSize) -> dict:
+
+    # Set the custom properties of many nodes with one BulkUpdate per chunk of nodes that get the same values.
+    # nodes is a list of (target, node URI). Every node gets sharedProps, updated with overrides[target] if there is one.
+    # If a chunk fails, its nodes are updated one at a time so one bad node doesn't fail the rest.
+    # Returns an error message for every target whose custom properties could not be set.
+    groups = {}
+    for target, uri in nodes:
+        props = dict(sharedProps)
+        props.update((overrides or {}).get(target, {}))
+        if len(props) > 0:
+            groups.setdefault(tuple(sorted(props.items(), key=lambda item: item[0])), []).append((target, uri))
+
+    errors = {}
+    for props, members in groups.items():
+        props = dict(props)
+        for start in range(0, len(members), chunkSize):
+            chunk = members[start:start + chunkSize]
+            try:
+                swis.bulkupdate([uri + "/CustomProperties" for target, uri in chunk], **props)
+                print(" ".join(["Updated custom properties of", str(len(chunk)), "nodes in one request"]))
+                continue
+            except Exception as e:
+                print(" ".join(["Bulk update of custom properties of", str(len(chunk)), "nodes failed, updating them one at a time. Details:", str(e.args)]))
+
+            for target, uri in chunk:
+                try:
+                    swis.update(uri + "/CustomProperties", **props)
+                except Exception as e:
+                    errors[target] = " ".join(["SWIS error updating custom properties. Details:", str(e.args)])
+
+    return errors
+
+def copy_node(swis:object, sourceNodeIP:str, targetNodeName:str, waitTime:int=0, sourceSnapshot:dict=None, engineID:int=None, readyQuery:str=None, readyTimeout:int=300, pollerConcurrency:int=defaultPollerConcurrency, cache:object=None) -> dict:
+
+    # Read the source node unless the caller already has it
+    if sourceSnapshot is None:
+        sourceSnapshot = get_source_snapshot(swis, sourceNodeIP, cache)
+
+    # With an inventory cache, pick the engine from the cached loads instead of asking SWIS
+    if engineID is None and cache is not None:
+        nodeLoad = projected_node_load(sourceSnapshot)
+        engineID = plan_engine_placement(get_engines(swis, None, cache), [targetNodeName], nodeLoad)[0]
+        cache.add_engine_load(engineID, nodeLoad)
+
+    targetNodeURI = create_target_node(swis, sourceNodeIP, targetNodeName, sourceSnapshot, engineID)
+    wait_for_node(swis, targetNodeName, targetNodeURI, waitTime, readyQuery, readyTimeout)
+    return finish_target_node(swis, sourceNodeIP, targetNodeName, targetNodeURI, sourceSnapshot, pollerConcurrency, cache)
+
+def plan_copy_nodes(swis:object, sourceNodeIP:str, targets:list, sourceSnapshot:dict=None, excludeEngines:list=None, targetIPs:dict=None, journal:object=None, dnsTimeout:int=defaultDnsTimeout, cache:object=None, preflight:bool=True) -> dict:
+
+    # Everything copy_nodes works out before copying anything, as a dict:
+    # results for targets that need no copy, resumed and existing URIs of nodes that aren't created,
+    # existingPollers on those nodes, engineIDs planned for the ones that are, pending targets,
+    # and the source snapshot and target addresses. All indexes are positions in targets.
+    plan = {"results": {}, "resumed": {}, "existing": {}, "existingPollers": {}, "engineIDs": {}, "pending": [], "sourceSnapshot": sourceSnapshot, "targetIPs": targetIPs}
+    results = plan["results"]
+    resumed = plan["resumed"]
+    for index, target in enumerate(targets):
+        if journal is not None and journal.done(target, "finished"):
+            results[index] = {"target": target, "status": "skipped", "NodeID": journal.get(target, "finished").get("NodeID"), "seconds": 0.0, "details": "Already copied according to the journal"}
+        elif journal is not None and journal.done(target, "created"):
+            resumed[index] = journal.get(target, "created")["Uri"]
+
+    # Targets are resolved in DNS first, unless the caller already did, and unresolvable ones fail without SWIS work.
+    toCreate = [index for index in range(len(targets)) if index not in results and index not in resumed]
+    if targetIPs is None:
+        targetIPs, problems = resolve_hostnames([targets[index] for index in toCreate], timeout=dnsTimeout)
+        print_dns_problems(problems)
+        plan["targetIPs"] = targetIPs
+
+    for index in toCreate:
+        if targets[index] not in targetIPs:
+            results[index] = {"target": targets[index], "status": "failed", "NodeID": None, "seconds": 0.0, "details": "Unable resolve IP for target FQDN"}
+    toCreate = [index for index in toCreate if index not in results]
+
+    # Targets Orion already has are found with a query per chunk of targets, not one per target
+    existing = plan["existing"]
+    if preflight and len(toCreate) > 0:
+        found, conflicts = find_existing_nodes(swis, [targets[index] for index in toCreate], targetIPs)
+        for index in toCreate:
+            if targets[index] in conflicts:
+                results[index] = {"target": targets[index], "status": "failed", "NodeID": None, "seconds": 0.0, "details": conflicts[targets[index]]}
+            elif targets[index] in found:
+                existing[index] = found[targets[index]]
+                resumed[index] = found[targets[index]]["Uri"]
+        toCreate = [index for index in toCreate if index not in results and index not in resumed]
+
+    plan["pending"] = [index for index in range(len(targets)) if index not in results]
+    if len(plan["pending"]) == 0:
+        return plan
+
+    # The source node is read once up front and shared by all the copies.
+    if sourceSnapshot is None:
+        sourceSnapshot = get_source_snapshot(swis, sourceNodeIP, cache)
+        plan["sourceSnapshot"] = sourceSnapshot
+
+    # Nodes that already exist only need the pollers they lack, and nothing at all if they have every one.
+    # Nodes resumed from the journal are checked even without the pre-flight check, as the earlier run may have made some.
+    existingPollers = plan["existingPollers"]
+    if len(resumed) > 0:
+        nodeIDs = {}
+        for index in resumed:
+            match = re.search(r"NodeID=(\d+)", resumed[index])
+            if match:
+                nodeIDs[index] = int(match.group(1))
+        pollers = find_existing_pollers(swis, list(dict.fromkeys(nodeIDs.values())))
+        sourceTypes = set([poller["PollerType"] for poller in sourceSnapshot["Pollers"]])
+        for index in nodeIDs:
+            existingPollers[index] = pollers.get(nodeIDs[index], set())
+            if index in existing and sourceTypes <= existingPollers[index]:
+                results[index] = {"target": targets[index], "status": "skipped", "NodeID": nodeIDs[index], "seconds": 0.0, "details": "Already in Solarwinds with every poller"}
+                print(" ".join(["Node", targets[index], "already in Solarwinds as Node ID", str(nodeIDs[index]), "with every poller, skipping"]))
+        plan["pending"] = [index for index in plan["pending"] if index not in results]
+
+    # Spread the whole batch across the polling engines before creating anything
+    placement = []
+    if len(toCreate) > 0:
+        nodeLoad = projected_node_load(sourceSnapshot)
+        engines = get_engines(swis, excludeEngines, cache)
+        placement = plan_engine_placement(engines, toCreate, nodeLoad)
+        print_placement(engines, placement, nodeLoad)
+        if cache is not None:
+            for engineID in set(placement):
+                cache.add_engine_load(engineID, placement.count(engineID) * nodeLoad)
+    plan["engineIDs"] = dict(zip(toCreate, placement))
+
+    return plan
+
+def node_copy_result(sourceNodeIP:str, target:str, result:dict, newNode:dict) -> None:
+
+    # Fill in the result of a node copy once the node has its pollers.
+    # Failures are counted against the pollers attempted, which leaves out any the node already had.
+    result["NodeID"] = newNode["NodeID"]
+    if len(newNode["PollerErrors"]) > 0:
+        result["status"] = "partial"
+        result["details"] = " ".join([str(len(newNode["PollerErrors"])), "of", str(newNode["PollersAttempted"]), "pollers failed:", "; ".join(newNode["PollerErrors"])])
+        print(" ".join(["Copy node from",sourceNodeIP,"to",target,"completed with errors.",result["details"]]))
+    else:
+        result["status"] = "succeeded"
+        print(" ".join(["Copy node from",sourceNodeIP,"to",target,"succeeded"]))
+
+def finish_copy_nodes(swis:object, targets:list, results:dict, finished:dict, sourceSnapshot:dict, customProps:dict=None, journal:object=None) -> list:
+
+    # The deferred custom property stage. Nodes are only finished in the journal once it has run,
+    # so a node whose custom properties failed is picked up again by the next run.
+    # Nodes found by the pre-flight check match their target by name, so they get the same custom properties.
+    errors = update_custom_properties(swis, [(targets[index], finished[index]["Uri"]) for index in sorted(finished)], sourceSnapshot["CustomProps"], customProps)
+    for index in sorted(finished):
+        target = targets[index]
+        if target in errors:
+            results[index]["status"] = "partial"
+            results[index]["details"] = "; ".join([detail for detail in (results[index]["details"], errors[target]) if detail != ""])
+            print(" ".join(["Custom properties of node", target, "could not be set. Details:", errors[target]]))
+        elif journal is not None:
+            journal.record(target, "finished", NodeID=finished[index]["NodeID"], PollerErrors=finished[index]["PollerErrors"])
+
+    return [results[index] for index in sorted(results)]
+
+def copy_nodes(swis:object, sourceNodeIP:str, targets:list, waitTime:int=0, concurrency:int=1, sourceSnapshot:dict=None, excludeEngines:list=None, readyQuery:str=None, readyTimeout:int=300, pollerConcurrency:int=defaultPollerConcurrency, targetIPs:dict=None, journal:object=None, dnsTimeout:int=defaultDnsTimeout, cache:object=None, preflight:bool=True, customProps:dict=None, onFinished:object=None) -> list:
+
+    # Copy the source node to every target, with at most `concurrency` copies talking to SWIS at once.
+    # Each target gets a result dict; results are returned in the order the targets were given.
+    # With a journal, targets finished by an earlier run are skipped, and nodes it created
+    # but didn't finish are picked up after the creation step.
+    # With an inventory cache, the source node and engine loads come from it and new nodes are added to it.
+    # The pre-flight check finds targets Orion already has; they aren't created again, and only get
+    # the pollers they lack, not the source node's custom properties. Resumed nodes are checked for pollers the same way.
+    # Custom properties are set once every node is done, with a BulkUpdate per group of nodes getting the same
+    # values, instead of one update per node. customProps maps targets to values that replace the source node's.
+    # With onFinished, each node's custom properties are instead set by its own worker as soon as it has its
+    # pollers, and onFinished(target, newNode, created) is then called from that worker, so callers can start
+    # later stages on the node while the rest of the batch is still being copied.
+    plan = plan_copy_nodes(swis, sourceNodeIP, targets, sourceSnapshot, excludeEngines, targetIPs, journal, dnsTimeout, cache, preflight)
+    results = plan["results"]
+    pending = plan["pending"]
+    if len(pending) == 0:
+        return [results[index] for index in sorted(results)]
+    sourceSnapshot = plan["sourceSnapshot"]
+    targetIPs = plan["targetIPs"]
+    resumed = plan["resumed"]
+    existing = plan["existing"]
+    engineIDs = plan["engineIDs"]
+
+    # A node waiting to become ready gives up its slot, so other targets are created meanwhile
+    swisSlot = threading.BoundedSemaphore(max(1, concurrency))
+
+    def run_one(index:int) -> dict:
+        target = targets[index]
+        result = {"target": target, "status": "failed", "NodeID": None, "seconds": 0.0, "details": ""}
+        start = time.monotonic()
+        try:
+            if index in existing:
+                targetNodeURI = resumed[index]
+                print(" ".join(["Node",target,"already in Solarwinds as Node ID",str(existing[index]["NodeID"]),"adding only the pollers it lacks"]))
+            elif index in resumed:
+                targetNodeURI = resumed[index]
+                print(" ".join(["Resuming node",target,"created by an earlier run"]))
+            else:
+                with swisSlot:
+                    targetNodeURI = create_target_node(swis, sourceNodeIP, target, sourceSnapshot, engineIDs[index], targetIPs[target])
+                if journal is not None:
+                    journal.record(target, "created", Uri=targetNodeURI)
+                wait_for_node(swis, target, targetNodeURI, waitTime, readyQuery, readyTimeout, swisSlot)
+            with swisSlot:
+                newNode = finish_target_node(swis, sourceNodeIP, target, targetNodeURI, sourceSnapshot, pollerConcurrency, cache, plan["existingPollers"].get(index), False)
+            node_copy_result(sourceNodeIP, target, result, newNode)
+            if onFinished is not None:
+                with swisSlot:
+                    finish_copy_nodes(swis, targets, {index: result}, {index: newNode}, sourceSnapshot, customProps, journal)
+                onFinished(target, newNode, index in engineIDs)
+            else:
+                finished[index] = newNode
+        except Exception as e:
+            result["details"] = str(e.args)
+            print(" ".join(["Copy node", target, "from", sourceNodeIP,"failed. Details:", str(e.args)]))
+        result["seconds"] = time.monotonic() - start
+        return result
+
+    # Only spend extra threads when there is a wait to overlap
+    workers = max(1, concurrency)
+    if readyQuery is not None or waitTime > 0:
+        workers = max(workers, min(len(pending), maxWaitingNodes))
+
+    finished = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_one, index): index for index in pending}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+
+    return finish_copy_nodes(swis, targets, results, finished, sourceSnapshot, customProps, journal)
+
+async def create_target_node_async(swis:object, targetNodeName:str, sourceSnapshot:dict, engineID:int, targetNodeIP:str) -> str:
+
+    # create_target_node for an AsyncSwisClient. The caller resolves the target and picks the engine.
     try:
-        for prop in sourceNodeCustomProps:
-            if prop not in nodePropsNoCopy:
-                targetNodeCustomProps[prop]=sourceNodeCustomProps[prop]
-        
-        swis.update(targetNodeURI + "/CustomProperties", **targetNodeCustomProps)
+        targetNodeURI = await swis.create('Orion.Nodes', **target_node_props(targetNodeName, targetNodeIP, engineID, sourceSnapshot))
     except Exception as e:
-        print("SWIS error updating custom properties for node %s (nodeID %s). Details: %s", targetNodeName, targetNode["NodeID"], str(e.args))
+        raise Exception(" ".join(["SWIS error creating new node", targetNodeName ,". Details:", str(e.args)]))
 
-    # Get the set of pollers assigned the source node
-    # Create a list of poller info
-    # Create pollers on the new node
+    print(" ".join(["Created new node",targetNodeName]))
+
+    return targetNodeURI
+
+async def wait_for_node_async(swis:object, targetNodeName:str, targetNodeURI:str, waitTime:int=0, readyQuery:str=None, readyTimeout:int=300) -> None:
+
+    # wait_for_node for an AsyncSwisClient. A waiting node holds nothing but its coroutine.
+    if readyQuery is None:
+        if (waitTime > 0):
+            print(" ".join(["Wait",str(waitTime),"seconds while Solarwinds executes new node tasks"]))
+            await asyncio.sleep(waitTime)
+        return
+
+    match = re.search(r"NodeID=(\d+)", targetNodeURI)
+    params = {"uri": targetNodeURI, "caption": targetNodeName, "nodeId": int(match.group(1)) if match else None}
+
+    print(" ".join(["Wait up to",str(readyTimeout),"seconds for new node",targetNodeName,"to be ready"]))
+    deadline = time.monotonic() + readyTimeout
+    delay = 1.0
+    while True:
+        try:
+            response = await swis.query(readyQuery, **params)
+            if len(response["results"]) > 0:
+                return
+        except Exception as e:
+            print(" ".join(["Readiness query for new node", targetNodeName, "failed. Details:", str(e.args)]))
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            print(" ".join(["New node", targetNodeName, "not ready after", str(readyTimeout), "seconds, continuing anyway"]))
+            return
+        await asyncio.sleep(min(delay, remaining))
+        delay = min(delay * 2, maxReadyDelay)
+
+async def finish_target_node_async(swis:object, targetNodeName:str, targetNodeURI:str, sourceSnapshot:dict, cache:object=None, existingPollers:set=None) -> dict:
+
+    # finish_target_node for an AsyncSwisClient, all pollers created at once.
+    # Custom properties are left to the caller.
     try:
-        response = swis.query("".join(["SELECT PollerType, Enabled from Orion.Pollers where NetObjectID ='",str(sourceNode["NodeID"]),"'"]))
-        sourceNodePollers = response["results"]
+        targetNode = await swis.read(targetNodeURI)
     except Exception as e:
-        raise Exception(" ".join(["SWIS error reading pollers from source node",sourceNodeIP,". Details:", str(e.args)]))
+        raise Exception(" ".join(["SWIS error reading properties of new node", targetNodeName ,". Details:", str(e.args)]))
 
-    targetNodePollers = []
-    for poller in sourceNodePollers:
-        targetNodePollers.append(
-            {
-                'PollerType': poller["PollerType"],
-                'NetObject': "".join(["N:",str(targetNode["NodeID"]) ]),
-                'NetObjectType': "N",
-                'NetObjectID': targetNode["NodeID"],
-                'Enabled': poller["Enabled"]
-            }
-        )
+    if cache is not None:
+        cache.add_nodes([targetNode])
+
+    print(" ".join(["New node",targetNodeName,"created with Node ID",str(targetNode["NodeID"])]))
+
+    pollers = target_node_pollers(targetNode["NodeID"], sourceSnapshot, existingPollers)
+    outcomes = await asyncio.gather(*[swis.create('Orion.Pollers', **poller) for poller in pollers], return_exceptions=True)
+    pollerErrors = [" ".join([poller["PollerType"], str(outcome.args)]) for poller, outcome in zip(pollers, outcomes) if isinstance(outcome, Exception)]
+    for error in pollerErrors:
+        print(" ".join(["SWIS error creating pollers for node", targetNodeName, "(nodeID", "".join([str(targetNode["NodeID"]), "). Details:"]), error]))
+
+    return {"NodeID": targetNode["NodeID"], "Uri": targetNodeURI, "PollersAttempted": len(pollers), "PollerErrors": pollerErrors}
+
+async def copy_nodes_async(asyncSwis:object, swis:object, sourceNodeIP:str, targets:list, waitTime:int=0, sourceSnapshot:dict=None, excludeEngines:list=None, readyQuery:str=None, readyTimeout:int=300, targetIPs:dict=None, journal:object=None, dnsTimeout:int=defaultDnsTimeout, cache:object=None, preflight:bool=True, customProps:dict=None) -> list:
+
+    # copy_nodes with every pending target copied at once on the event loop, limited only by the calls
+    # in flight allowed by the open AsyncSwisClient asyncSwis. Planning and the bulk custom property stage
+    # are a few calls per batch and use the blocking client swis, exactly as copy_nodes does.
+    plan = plan_copy_nodes(swis, sourceNodeIP, targets, sourceSnapshot, excludeEngines, targetIPs, journal, dnsTimeout, cache, preflight)
+    results = plan["results"]
+    if len(plan["pending"]) == 0:
+        return [results[index] for index in sorted(results)]
+    sourceSnapshot = plan["sourceSnapshot"]
+    finished = {}
 
-    for poller in targetNodePollers:
+    async def run_one(index:int) -> dict:
+        target = targets[index]
+        result = {"target": target, "status": "failed", "NodeID": None, "seconds": 0.0, "details": ""}
+        start = time.monotonic()
         try:
-            response = swis.create('Orion.Pollers', **poller)
+            if index in plan["existing"]:
+                targetNodeURI = plan["resumed"][index]
+                print(" ".join(["Node",target,"already in Solarwinds as Node ID",str(plan["existing"][index]["NodeID"]),"adding only the pollers it lacks"]))
+            elif index in plan["resumed"]:
+                targetNodeURI = plan["resumed"][index]
+                print(" ".join(["Resuming node",target,"created by an earlier run"]))
+            else:
+                targetNodeURI = await create_target_node_async(asyncSwis, target, sourceSnapshot, plan["engineIDs"][index], plan["targetIPs"][target])
+                if journal is not None:
+                    journal.record(target, "created", Uri=targetNodeURI)
+                await wait_for_node_async(asyncSwis, target, targetNodeURI, waitTime, readyQuery, readyTimeout)
+            newNode = await finish_target_node_async(asyncSwis, target, targetNodeURI, sourceSnapshot, cache, plan["existingPollers"].get(index))
+            finished[index] = newNode
+            node_copy_result(sourceNodeIP, target, result, newNode)
         except Exception as e:
-            print("SWIS error creating pollers for node %s (nodeID %s). Details: %s", targetNodeName, targetNode["NodeID"], str(e.args))
+            result["details"] = str(e.args)
+            print(" ".join(["Copy node", target, "from", sourceNodeIP,"failed. Details:", str(e.args)]))
+        result["seconds"] = time.monotonic() - start
+        return result
+
+    outcomes = await asyncio.gather(*[run_one(index) for index in plan["pending"]])
+    results.update(zip(plan["pending"], outcomes))
+
+    return finish_copy_nodes(swis, targets, results, finished, sourceSnapshot, customProps, journal)
+
+def print_dns_problems(problems:dict) -> None:
+    if len(problems) > 0:
+        print(" ".join([str(len(problems)), "target names could not be resolved and will be skipped:"]))
+        for hostname in problems:
+            print(" ".join(["   ", problems[hostname]]))
+
+def print_summary(results:list) -> None:
+
+    # One line per target, then the totals
+    width = max([len("Target")] + [len(result["target"]) for result in results])
+    print("")
+    print("  ".join(["Target".ljust(width), "Status".ljust(9), "NodeID".rjust(8), "Seconds".rjust(8), "Details"]))
+    for result in results:
+        nodeID = "" if result["NodeID"] is None else str(result["NodeID"])
+        print("  ".join([result["target"].ljust(width), result["status"].ljust(9), nodeID.rjust(8), "{:.1f}".format(result["seconds"]).rjust(8), result["details"]]))
+
+    counts = [" ".join([str(len([result for result in results if result["status"] == status])), status]) for status in ("succeeded", "partial", "skipped", "failed")]
+    print(" ".join([str(len(results)), "node copies:", ", ".join(counts)]))
 
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(description="Copy a Solarwinds node")
     parser.add_argument("-s", "--sourceNodeIP", metavar="SOURCE_NODE_IP", action="store", type=str, dest="sourceNodeIP", required=True, help="Source node IP in Solarwinds")
     parser.add_argument("-S", "--server", metavar="SW_SERVER", action="store", type=str, dest="swisInfo", default="localhost", help="IP or FQDN of Solarwinds server")
-    parser.add_argument("-t", "--targetNodeName", metavar="TARGET_NODE", action="append", type=str, dest="targets", required=True, help="FQDN of new node")
+    parser.add_argument("-t", "--targetNodeName", metavar="TARGET_NODE", action="append", type=str, dest="targets", default=[], required=False, help="FQDN of new node")
+    parser.add_argument("-m", "--manifest", metavar="MANIFEST", action="store", type=str, dest="manifest", default=None, required=False, help="CSV or JSON Lines file with a 'target' column naming the new nodes, read as the run goes. Columns named cp.<Name> set that custom property of the row's node instead of copying it. Use - for standard input")
+    parser.add_argument("-j", "--journal", metavar="JOURNAL", action="store", type=str, dest="journal", default=None, required=False, help="Journal file recording each completed step. Rerunning with the same journal resumes where the last run stopped")
+    parser.add_argument("--batch-size", metavar="N", action="store", type=int, dest="batchSize", default=defaultBatchSize, required=False, help="Number of manifest targets planned and copied together")
     parser.add_argument("-w", "--wait", metavar="WAIT_TIME", action="store", type=int, dest="waitTime", default=0, required=False, help="Seconds to wait between creating each node and setting custom properties")
+    parser.add_argument("-r", "--ready-query", metavar="SWQL", action="store", type=str, dest="readyQuery", default=None, required=False, help="SWQL query that returns a row once a new node is ready for its custom properties, e.g. SELECT NodeID FROM Orion.Nodes WHERE Uri=@uri AND CustomProperties.Department IS NOT NULL. May use @uri, @caption and @nodeId. Replaces the fixed --wait")
+    parser.add_argument("--ready-timeout", metavar="SECONDS", action="store", type=int, dest="readyTimeout", default=300, required=False, help="Longest time to poll --ready-query for each new node")
+    parser.add_argument("-c", "--concurrency", metavar="N", action="store", type=int, dest="concurrency", default=1, required=False, help="Number of nodes to copy in parallel")
+    parser.add_argument("-x", "--exclude-engine", metavar="PATTERN", action="append", type=str, dest="excludeEngines", default=None, required=False, help="".join(["SWQL LIKE pattern for polling engine names that must not get new nodes. May be repeated. Default: ", " ".join(defaultEngineExcludes).replace("%", "%%")]))
+    parser.add_argument("--poller-concurrency", metavar="N", action="store", type=int, dest="pollerConcurrency", default=defaultPollerConcurrency, required=False, help="Number of pollers to create in parallel on each new node")
+    parser.add_argument("--dns-timeout", metavar="SECONDS", action="store", type=int, dest="dnsTimeout", default=defaultDnsTimeout, required=False, help="Longest time to wait for each target name to resolve")
+    parser.add_argument("--allow-duplicates", action="store_false", dest="preflight", default=True, required=False, help="Create every target even if Solarwinds already has a node with its name or address")
+    parser.add_argument("--snapshot", metavar="SNAPSHOT_FILE", action="store", type=str, dest="snapshotFile", default=None, required=False, help="JSON file caching the source node's properties, custom properties and pollers between runs")
+    parser.add_argument("--snapshot-max-age", metavar="SECONDS", action="store", type=int, dest="snapshotMaxAge", default=defaultSnapshotMaxAge, required=False, help="Age after which the snapshot file is read from the source node again")
+    parser.add_argument("--refresh-snapshot", action="store_true", dest="refreshSnapshot", default=False, required=False, help="Re-read the source node even if the snapshot file exists")
+    parser.add_argument("--cache", metavar="CACHE_FILE", action="store", type=str, dest="cache", default=None, required=False, help="SQLite file caching Orion nodes, polling engines and application templates between runs")
+    parser.add_argument("--cache-ttl", metavar="SECONDS", action="store", type=int, dest="cacheTTL", default=defaultCacheTTL, required=False, help="Age after which the cache is pulled from Orion in full again")
+    parser.add_argument("--refresh", action="store_true", dest="refresh", default=False, required=False, help="Pull the whole cache from Orion again now")
+    parser.add_argument("--ca-bundle", metavar="PEM", action="store", type=str, dest="caBundle", default=None, required=False, help="Verify the SWIS server certificate against this CA bundle. Without it the certificate is not checked")
+    parser.add_argument("--retries", metavar="N", action="store", type=int, dest="retries", default=defaultRetries, required=False, help="Times to repeat a SWIS call that failed with a transient error. Queries, reads and updates are repeated after any transient error, creates only when SWIS never started on them")
+    parser.add_argument("--adaptive", action="store_true", dest="adaptive", default=False, required=False, help="Start with few SWIS calls in flight and add more while Orion keeps up, backing off when it slows down or fails. Concurrency from -c and --poller-concurrency sets the most calls in flight")
+    parser.add_argument("--latency-target", metavar="MS", action="store", type=int, dest="latencyTarget", default=int(defaultLatencyTarget * 1000), required=False, help="Mean SWIS latency above which --adaptive cuts the calls in flight")
+    parser.add_argument("--async", action="store_true", dest="asyncMode", default=False, required=False, help="Copy every node of a batch at once on one asyncio event loop instead of in threads. Needs the aiohttp package. -c and --poller-concurrency don't apply; --async-limit bounds the SWIS calls in flight")
+    parser.add_argument("--async-limit", metavar="N", action="store", type=int, dest="asyncLimit", default=defaultAsyncLimit, required=False, help="Most SWIS calls in flight with --async")
+    parser.add_argument("--timeout", metavar="SECONDS", action="store", type=int, dest="timeout", default=defaultSwisTimeout, required=False, help="Longest time to wait for each SWIS response")
+    parser.add_argument("--metrics-file", metavar="PROM_FILE", action="store", type=str, dest="metricsFile", default=None, required=False, help="Write SWIS call counts and latencies to this Prometheus textfile at the end of the run")
     args = parser.parse_args()
 
     # Sanity test for the command line
@@ -160,31 +888,111 @@ if __name__ == '__main__':
         validate_ip(args.sourceNodeIP)
         for target in args.targets:
             validate_fqdn(target)
+
+        if len(args.targets) == 0 and args.manifest is None:
+            raise Exception("Give the new nodes with -t or a manifest with -m")
+
+        if args.batchSize < 1:
+            raise Exception(" ".join(["Batch size must be at least 1, got", str(args.batchSize)]))
+
+        if args.concurrency < 1 or args.pollerConcurrency < 1 or args.asyncLimit < 1:
+            raise Exception(" ".join(["Concurrency must be at least 1, got", str(min(args.concurrency, args.pollerConcurrency, args.asyncLimit))]))
+
+        if args.asyncMode and args.adaptive:
+            raise Exception("--adaptive works with the threaded copy only, not with --async")
     except Exception as e:
         print(" ".join(["Illegal value on command line. Details:", str(e.args)]))
         quit()
 
+    try:
+        journal = Journal(args.journal) if args.journal else None
+    except Exception as e:
+        print(" ".join(["Unable to open journal. Details:", str(e.args)]))
+        quit()
+
+    # Resolve every target an earlier run didn't get to before connecting to Solarwinds,
+    # so bad names show up straight away
+    unstarted = [target for target in args.targets if journal is None or not (journal.done(target, "finished") or journal.done(target, "created"))]
+    targetIPs, problems = resolve_hostnames(unstarted, timeout=args.dnsTimeout)
+    print_dns_problems(problems)
+    if len(targetIPs) == 0 and len(unstarted) == len(args.targets) and args.manifest is None:
+        print("No target names could be resolved")
+        quit()
+
     username = input("Username: ")
     password = getpass.getpass("Password: ")
     
-    # Allow swis to ignore certificate warnings
-    verify = False
-    if not verify:
-        import urllib3
-        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
-    # Create the SWIS connection and run a simple test
+    # Create the SWIS connection, pooled for every worker, and run a simple test
+    workers = args.concurrency * args.pollerConcurrency
+    limiter = AdaptiveLimiter(workers, latencyTarget=args.latencyTarget / 1000) if args.adaptive else None
     try:
-        swis = SwisClient(args.swisInfo, username, password)
-        response = swis.query("SELECT Top 1 NodeID from Orion.Nodes")
+        swis = InstrumentedSwisClient(make_swis_client(args.swisInfo, username, password, workers, args.caBundle, args.timeout), retryPolicy=RetryPolicy(args.retries), limiter=limiter)
+        response = run_query(swis, "probe")
     except Exception as e:
         print(" ".join(["Unable to connect to SWIS server", args.swisInfo, "Details:", str(e.args)]))
         quit()
+
+    # With --async the nodes are copied by an asyncio client counted in the same metrics
+    asyncSwis = None
+    if args.asyncMode:
+        try:
+            asyncSwis = AsyncSwisClient(args.swisInfo, username, password, args.caBundle, args.timeout, args.asyncLimit, metrics=swis.metrics, retryPolicy=swis.retryPolicy)
+        except Exception as e:
+            print(" ".join(["Unable to use --async. Details:", str(e.args)]))
+            quit()
+
+    cache = open_inventory_cache(args.cache, args.swisInfo, swis, args.cacheTTL, args.refresh)
         
+    # Read the source node once, or reuse the snapshot saved by an earlier run
+    try:
+        sourceSnapshot = None
+        if args.snapshotFile and os.path.exists(args.snapshotFile) and not args.refreshSnapshot:
+            sourceSnapshot = load_source_snapshot(args.snapshotFile, args.sourceNodeIP, args.swisInfo, args.snapshotMaxAge)
+            if sourceSnapshot is None:
+                print(" ".join(["Source node snapshot", args.snapshotFile, "is older than", str(args.snapshotMaxAge), "seconds, reading the source node again"]))
+            else:
+                print(" ".join(["Using source node snapshot", args.snapshotFile]))
+        if sourceSnapshot is None:
+            sourceSnapshot = get_source_snapshot(swis, args.sourceNodeIP, cache)
+            if args.snapshotFile:
+                save_source_snapshot(sourceSnapshot, args.snapshotFile, args.swisInfo)
+    except Exception as e:
+        print(" ".join(["Unable to read source node", args.sourceNodeIP, "Details:", str(e.args)]))
+        quit()
+
     # Create new nodes
-    for target in args.targets:
+    results = []
+    if len(args.targets) > 0 and asyncSwis is not None:
+        results += run_async(asyncSwis, copy_nodes_async, swis=swis, sourceNodeIP=args.sourceNodeIP, targets=args.targets, waitTime=args.waitTime, sourceSnapshot=sourceSnapshot, excludeEngines=args.excludeEngines, readyQuery=args.readyQuery, readyTimeout=args.readyTimeout, targetIPs=targetIPs, journal=journal, cache=cache, preflight=args.preflight)
+    elif len(args.targets) > 0:
+        results += copy_nodes(swis=swis, sourceNodeIP=args.sourceNodeIP, targets=args.targets, waitTime=args.waitTime, concurrency=args.concurrency, sourceSnapshot=sourceSnapshot, excludeEngines=args.excludeEngines, readyQuery=args.readyQuery, readyTimeout=args.readyTimeout, pollerConcurrency=args.pollerConcurrency, targetIPs=targetIPs, journal=journal, cache=cache, preflight=args.preflight)
+
+    # Then the manifest, a batch at a time so huge manifests are never read in full
+    if args.manifest is not None:
         try:
-            copy_node(swis=swis, sourceNodeIP=args.sourceNodeIP, targetNodeName=target, waitTime=args.waitTime)
-            print(" ".join(["Copy node from",args.sourceNodeIP,"to",target,"succeeded"]))
+            # cp.<Name> columns give a target its own value for a custom property
+            for batch in iter_batches(read_manifest(args.manifest, "target"), args.batchSize):
+                valid = []
+                customProps = {}
+                for row in batch:
+                    target = row["target"]
+                    try:
+                        validate_fqdn(target)
+                        valid.append(target)
+                        customProps[target] = manifest_custom_props(row)
+                    except Exception as e:
+                        results.append({"target": target, "status": "failed", "NodeID": None, "seconds": 0.0, "details": str(e.args)})
+                if asyncSwis is not None:
+                    results += run_async(asyncSwis, copy_nodes_async, swis=swis, sourceNodeIP=args.sourceNodeIP, targets=valid, waitTime=args.waitTime, sourceSnapshot=sourceSnapshot, excludeEngines=args.excludeEngines, readyQuery=args.readyQuery, readyTimeout=args.readyTimeout, journal=journal, dnsTimeout=args.dnsTimeout, cache=cache, preflight=args.preflight, customProps=customProps)
+                else:
+                    results += copy_nodes(swis=swis, sourceNodeIP=args.sourceNodeIP, targets=valid, waitTime=args.waitTime, concurrency=args.concurrency, sourceSnapshot=sourceSnapshot, excludeEngines=args.excludeEngines, readyQuery=args.readyQuery, readyTimeout=args.readyTimeout, pollerConcurrency=args.pollerConcurrency, journal=journal, dnsTimeout=args.dnsTimeout, cache=cache, preflight=args.preflight, customProps=customProps)
         except Exception as e:
-            print(" ".join(["Copy node", target, "from", args.sourceNodeIP,"failed. Details:", str(e.args)]))
\ No newline at end of file
+            print(" ".join(["Reading manifest", args.manifest, "failed. Details:", str(e.args)]))
+
+    if journal is not None:
+        journal.close()
+    if cache is not None:
+        cache.close()
+    print_summary(results)
+
+    report_metrics(swis, args.metricsFile, "copy-solarwinds-node")
@@ -0,0 +1,769 @@
+import argparse
+import json
+import random
+import re
+import ssl
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+# A stand-in for the SolarWinds Information Service JSON API, backed by a synthetic in-memory
+# inventory, so the scripts can be tested and benchmarked without a live Orion server.
+# It understands the subset of SWQL the scripts use: SELECT [TOP n] ... FROM ... [INNER JOIN ... ON ...]
+# [WHERE ...] [ORDER BY ...], with AND/OR/NOT, comparisons, LIKE, IN, IS NULL, COUNT() and @parameters.
+
+apiPath = "/SolarWinds/InformationService/v3/Json/"
+
+# Key column of every entity the mock knows about
+entityKeys = {
+    "Orion.Nodes": "NodeID",
+    "Orion.NodesCustomProperties": "NodeID",
+    "Orion.Pollers": "PollerID",
+    "Orion.Engines": "EngineID",
+    "Orion.APM.ApplicationTemplate": "ApplicationTemplateID",
+    "Orion.APM.ComponentTemplate": "ID",
+    "Orion.APM.Application": "ApplicationID",
+    "Orion.APM.Component": "ComponentID",
+    "Orion.APM.ComponentSetting": "ID"
+}
+
+pollerTypes = [
+    "N.Status.ICMP.Native",
+    "N.ResponseTime.ICMP.Native",
+    "N.Details.SNMP.Generic",
+    "N.Uptime.SNMP.Generic",
+    "N.Cpu.SNMP.HrProcessorLoad",
+    "N.Memory.SNMP.NetSnmpReal",
+    "N.AssetInventory.Snmp.Generic",
+    "N.Topology_Layer3.SNMP.ipNetToMedia",
+    "N.Routing.SNMP.Ipv4RoutingTable",
+    "N.HardwareHealthMonitoring.SNMP.NPM.Cisco"
+]
+
+vendors = ["Cisco", "Net-SNMP", "Windows"]
+
+class SwqlError(Exception):
+    pass
+
+class MockError(Exception):
+    pass
+
+# ----------------------------------------------------------------------------
+# SWQL parsing
+
+tokenPattern = re.compile(r"""\s+|('(?:[^']|'')*')|(\[[^\]]+\])|(@[A-Za-z_][A-Za-z0-9_]*)|(\d+(?:\.\d+)?)|([A-Za-z_][A-Za-z0-9_]*)|(<>|!=|<=|>=|=|<|>|\(|\)|,|\.|\*)""")
+
+keywords = {"SELECT", "TOP", "FROM", "WHERE", "AND", "OR", "NOT", "LIKE", "IN", "IS", "NULL", "AS", "INNER", "LEFT", "JOIN", "ON", "ORDER", "BY", "ASC", "DESC"}
+
+def tokenize(text:str) -> list:
+    tokens = []
+    position = 0
+    while position < len(text):
+        match = tokenPattern.match(text, position)
+        if match is None:
+            raise SwqlError(" ".join(["Unexpected character in query at", str(position), ":", text[position:position + 20]]))
+        position = match.end()
+        string, bracketed, param, number, ident, op = match.groups()
+        if string is not None:
+            tokens.append(("str", string[1:-1].replace("''", "'")))
+        elif bracketed is not None:
+            tokens.append(("name", bracketed[1:-1]))
+        elif param is not None:
+            tokens.append(("param", param[1:]))
+        elif number is not None:
+            tokens.append(("num", float(number) if "." in number else int(number)))
+        elif ident is not None:
+            tokens.append(("kw", ident.upper()) if ident.upper() in keywords else ("name", ident))
+        elif op is not None:
+            tokens.append(("op", op))
+    tokens.append(("end", None))
+    return tokens
+
+class SwqlParser:
+
+    def __init__(self, text:str):
+        self.tokens = tokenize(text)
+        self.position = 0
+
+    def peek(self, offset:int=0) -> tuple:
+        return self.tokens[min(self.position + offset, len(self.tokens) - 1)]
+
+    def next(self) -> tuple:
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def accept(self, kind:str, value:object=None) -> bool:
+        token = self.peek()
+        if token[0] == kind and (value is None or token[1] == value):
+            self.position += 1
+            return True
+        return False
+
+    def expect(self, kind:str, value:object=None) -> tuple:
+        token = self.next()
+        if token[0] != kind or (value is not None and token[1] != value):
+            raise SwqlError(" ".join(["Expected", str(value or kind), "but found", str(token[1])]))
+        return token
+
+    def parse_query(self) -> dict:
+        query = {"top": None, "items": [], "sources": [], "joins": [], "where": None, "order": []}
+        self.expect("kw", "SELECT")
+        if self.accept("kw", "TOP"):
+            query["top"] = int(self.expect("num")[1])
+
+        query["items"].append(self.parse_select_item())
+        while self.accept("op", ","):
+            query["items"].append(self.parse_select_item())
+
+        self.expect("kw", "FROM")
+        query["sources"].append(self.parse_source())
+        while self.peek() == ("kw", "INNER") or self.peek() == ("kw", "JOIN"):
+            self.accept("kw", "INNER")
+            self.expect("kw", "JOIN")
+            source = self.parse_source()
+            self.expect("kw", "ON")
+            query["joins"].append((source, self.parse_or()))
+
+        if self.accept("kw", "WHERE"):
+            query["where"] = self.parse_or()
+
+        if self.accept("kw", "ORDER"):
+            self.expect("kw", "BY")
+            while True:
+                expression = self.parse_value()
+                descending = self.accept("kw", "DESC")
+                if not descending:
+                    self.accept("kw", "ASC")
+                query["order"].append((expression, descending))
+                if not self.accept("op", ","):
+                    break
+
+        self.expect("end")
+        return query
+
+    def parse_dotted_name(self) -> list:
+        names = [self.expect("name")[1]]
+        while self.peek() == ("op", ".") and self.peek(1)[0] == "name":
+            self.next()
+            names.append(self.next()[1])
+        return names
+
+    def parse_source(self) -> tuple:
+        entity = ".".join(self.parse_dotted_name())
+        alias = entity
+        if self.peek()[0] == "name":
+            alias = self.next()[1]
+        return (entity, alias)
+
+    def parse_select_item(self) -> tuple:
+        if self.accept("op", "*"):
+            return (("star",), None)
+
+        if self.peek()[0] == "name" and self.peek()[1].upper() == "COUNT" and self.peek(1) == ("op", "("):
+            self.next()
+            self.next()
+            expression = ("star",) if self.accept("op", "*") else self.parse_value()
+            self.expect("op", ")")
+            expression = ("count", expression)
+        else:
+            expression = self.parse_value()
+
+        name = None
+        if self.accept("kw", "AS"):
+            name = self.expect("name")[1]
+        elif self.peek()[0] == "name":
+            name = self.next()[1]
+        if name is None:
+            name = expression[1][-1] if expression[0] == "column" else "Expr"
+        return (expression, name)
+
+    def parse_value(self) -> tuple:
+        token = self.peek()
+        if token[0] == "str" or token[0] == "num":
+            self.next()
+            return ("literal", token[1])
+        if token[0] == "param":
+            self.next()
+            return ("param", token[1])
+        if token == ("kw", "NULL"):
+            self.next()
+            return ("literal", None)
+        if token[0] == "name":
+            return ("column", self.parse_dotted_name())
+        raise SwqlError(" ".join(["Unexpected", str(token[1]), "in query"]))
+
+    def parse_or(self) -> tuple:
+        left = self.parse_and()
+        while self.accept("kw", "OR"):
+            left = ("or", left, self.parse_and())
+        return left
+
+    def parse_and(self) -> tuple:
+        left = self.parse_not()
+        while self.accept("kw", "AND"):
+            left = ("and", left, self.parse_not())
+        return left
+
+    def parse_not(self) -> tuple:
+        if self.accept("kw", "NOT"):
+            return ("not", self.parse_not())
+        return self.parse_predicate()
+
+    def parse_predicate(self) -> tuple:
+        if self.accept("op", "("):
+            condition = self.parse_or()
+            self.expect("op", ")")
+            return condition
+
+        left = self.parse_value()
+        if self.accept("kw", "IS"):
+            negated = self.accept("kw", "NOT")
+            self.expect("kw", "NULL")
+            return ("isnull", left, negated)
+
+        negated = self.accept("kw", "NOT")
+        if self.accept("kw", "LIKE"):
+            return ("like", left, self.parse_value(), negated)
+        if self.accept("kw", "IN"):
+            self.expect("op", "(")
+            values = [self.parse_value()]
+            while self.accept("op", ","):
+                values.append(self.parse_value())
+            self.expect("op", ")")
+            return ("in", left, values, negated)
+
+        operator = self.expect("op")[1]
+        if operator not in ("=", "<>", "!=", "<", ">", "<=", ">="):
+            raise SwqlError(" ".join(["Unexpected operator", operator]))
+        return ("compare", operator, left, self.parse_value())
+
+# ----------------------------------------------------------------------------
+# SWQL evaluation
+
+def comparable(left:object, right:object) -> tuple:
+    # SQL Server converts between numbers and numeric strings, and compares strings without case
+    if isinstance(left, bool):
+        left = int(left)
+    if isinstance(right, bool):
+        right = int(right)
+    if isinstance(left, (int, float)) and isinstance(right, str):
+        try:
+            right = float(right)
+        except ValueError:
+            left = str(left)
+    elif isinstance(right, (int, float)) and isinstance(left, str):
+        try:
+            left = float(left)
+        except ValueError:
+            right = str(right)
+    if isinstance(left, str) and isinstance(right, str):
+        return left.casefold(), right.casefold()
+    return left, right
+
+def like_pattern(pattern:str) -> object:
+    expression = "".join([".*" if c == "%" else "." if c == "_" else re.escape(c) for c in pattern])
+    return re.compile("".join(["^", expression, "$"]), re.IGNORECASE | re.DOTALL)
+
+class SwqlEvaluator:
+
+    def __init__(self, inventory:object, query:dict, params:dict):
+        self.inventory = inventory
+        self.query = query
+        self.params = dict([(name.lower(), value) for name, value in params.items()])
+        self.aliases = [query["sources"][0]] + [join[0] for join in query["joins"]]
+        self.aliasNames = dict([(alias.lower(), alias) for entity, alias in self.aliases])
+        self.aliasEntities = dict([(alias, entity) for entity, alias in self.aliases])
+
+    def column(self, context:dict, names:list) -> object:
+        if len(names) > 1 and names[0].lower() in self.aliasNames:
+            alias = self.aliasNames[names[0].lower()]
+            names = names[1:]
+        else:
+            alias = self.aliases[0][1]
+        entity = self.aliasEntities[alias]
+        row = context.get(alias)
+        if row is None:
+            return None
+
+        # Navigate CustomProperties the way SWQL does
+        for name in names[:-1]:
+            if name.lower() == "customproperties":
+                row = self.inventory.custom_properties(row.get("NodeID"))
+                entity = "Orion.NodesCustomProperties"
+                if row is None:
+                    return None
+            else:
+                raise SwqlError(" ".join(["Unknown navigation property", name, "on", entity]))
+        return get_property(row, names[-1])
+
+    def value(self, context:dict, expression:tuple) -> object:
+        if expression[0] == "literal":
+            return expression[1]
+        if expression[0] == "param":
+            if expression[1].lower() not in self.params:
+                raise SwqlError(" ".join(["No value for parameter", "".join(["@", expression[1]])]))
+            return self.params[expression[1].lower()]
+        if expression[0] == "column":
+            return self.column(context, expression[1])
+        raise SwqlError(" ".join(["Cannot evaluate", str(expression[0])]))
+
+    def test(self, context:dict, condition:tuple) -> bool:
+        kind = condition[0]
+        if kind == "or":
+            return self.test(context, condition[1]) or self.test(context, condition[2])
+        if kind == "and":
+            return self.test(context, condition[1]) and self.test(context, condition[2])
+        if kind == "not":
+            return not self.test(context, condition[1])
+        if kind == "isnull":
+            return (self.value(context, condition[1]) is None) != condition[2]
+        if kind == "like":
+            value = self.value(context, condition[1])
+            pattern = self.value(context, condition[2])
+            if value is None or pattern is None:
+                return False
+            return (like_pattern(str(pattern)).match(str(value)) is not None) != condition[3]
+        if kind == "in":
+            value = self.value(context, condition[1])
+            if value is None:
+                return False
+            found = False
+            for item in condition[2]:
+                left, right = comparable(value, self.value(context, item))
+                if left == right:
+                    found = True
+                    break
+            return found != condition[3]
+        if kind == "compare":
+            left = self.value(context, condition[2])
+            right = self.value(context, condition[3])
+            if left is None or right is None:
+                return False
+            left, right = comparable(left, right)
+            operator = condition[1]
+            try:
+                if operator == "=":
+                    return left == right
+                if operator in ("<>", "!="):
+                    return left != right
+                if operator == "<":
+                    return left < right
+                if operator == ">":
+                    return left > right
+                if operator == "<=":
+                    return left <= right
+                if operator == ">=":
+                    return left >= right
+            except TypeError:
+                return False
+        raise SwqlError(" ".join(["Cannot evaluate condition", str(kind)]))
+
+    def join(self, contexts:list, source:tuple, condition:tuple) -> list:
+        entity, alias = source
+        rows = self.inventory.rows(entity)
+
+        # Equality joins use a hash of the joined entity, everything else a nested loop
+        if condition[0] == "compare" and condition[1] == "=" and condition[2][0] == "column" and condition[3][0] == "column":
+            sides = [condition[2][1], condition[3][1]]
+            inner = [names for names in sides if len(names) == 2 and names[0].lower() == alias.lower()]
+            outer = [names for names in sides if not (len(names) == 2 and names[0].lower() == alias.lower())]
+            if len(inner) == 1 and len(outer) == 1:
+                index = {}
+                for row in rows:
+                    key = get_property(row, inner[0][1])
+                    index.setdefault(comparable(key, 0)[0] if isinstance(key, str) else key, []).append(row)
+                joined = []
+                for context in contexts:
+                    key = self.column(context, outer[0])
+                    key = comparable(key, 0)[0] if isinstance(key, str) else key
+                    for row in index.get(key, []):
+                        joined.append(dict(context, **{alias: row}))
+                return joined
+
+        joined = []
+        for context in contexts:
+            for row in rows:
+                candidate = dict(context, **{alias: row})
+                if self.test(candidate, condition):
+                    joined.append(candidate)
+        return joined
+
+    def run(self) -> list:
+        entity, alias = self.query["sources"][0]
+        contexts = [{alias: row} for row in self.inventory.rows(entity)]
+        for source, condition in self.query["joins"]:
+            contexts = self.join(contexts, source, condition)
+
+        if self.query["where"] is not None:
+            contexts = [context for context in contexts if self.test(context, self.query["where"])]
+
+        for expression, descending in reversed(self.query["order"]):
+            contexts.sort(key=lambda context: sort_key(self.value(context, expression)), reverse=descending)
+
+        # A COUNT() without GROUP BY gives one row over everything selected
+        if any([expression[0] == "count" for expression, name in self.query["items"]]):
+            row = {}
+            for expression, name in self.query["items"]:
+                if expression[0] == "count":
+                    if expression[1][0] == "star":
+                        row[name] = len(contexts)
+                    else:
+                        row[name] = len([context for context in contexts if self.value(context, expression[1]) is not None])
+                else:
+                    row[name] = self.value(contexts[0], expression) if len(contexts) > 0 else None
+            return [row]
+
+        if self.query["top"] is not None:
+            contexts = contexts[:self.query["top"]]
+
+        results = []
+        for context in contexts:
+            row = {}
+            for expression, name in self.query["items"]:
+                if expression[0] == "star":
+                    row.update(context[alias])
+                else:
+                    row[name] = self.value(context, expression)
+            results.append(row)
+        return results
+
+def sort_key(value:object) -> tuple:
+    if value is None:
+        return (0, 0)
+    if isinstance(value, str):
+        return (2, value.casefold())
+    return (1, value)
+
+def get_property(row:dict, name:str) -> object:
+    if name in row:
+        return row[name]
+    for key in row:
+        if key.lower() == name.lower():
+            return row[key]
+    return None
+
+# ----------------------------------------------------------------------------
+# Inventory
+
+class MockInventory:
+
+    def __init__(self, host:str="mock-swis"):
+        self.host = host
+        self.lock = threading.RLock()
+        self.tables = dict([(entity, {}) for entity in entityKeys])
+        self.nextIDs = dict([(entity, 1) for entity in entityKeys])
+
+    def uri(self, entity:str, key:object) -> str:
+        if entity == "Orion.NodesCustomProperties":
+            return "".join(["swis://", self.host, "/Orion/Orion.Nodes/NodeID=", str(key), "/CustomProperties"])
+        return "".join(["swis://", self.host, "/Orion/", entity, "/", entityKeys[entity], "=", str(key)])
+
+    def rows(self, entity:str) -> list:
+        for known in self.tables:
+            if known.lower() == entity.lower():
+                with self.lock:
+                    return list(self.tables[known].values())
+        raise SwqlError(" ".join(["Source entity", entity, "not found"]))
+
+    def custom_properties(self, nodeID:object) -> dict:
+        with self.lock:
+            return self.tables["Orion.NodesCustomProperties"].get(nodeID)
+
+    def insert(self, entity:str, properties:dict) -> dict:
+        with self.lock:
+            key = entityKeys[entity]
+            if properties.get(key) is None:
+                properties[key] = self.nextIDs[entity]
+            self.nextIDs[entity] = max(self.nextIDs[entity], properties[key] + 1)
+            properties["Uri"] = self.uri(entity, properties[key])
+            self.tables[entity][properties[key]] = properties
+            return properties
+
+    def resolve(self, uri:str) -> tuple:
+
+        # Find the row a swis:// URI points at, as (entity, row)
+        match = re.match(r"^swis://[^/]+/[^/]+/([^/]+)/([A-Za-z]+)=(\d+)(/CustomProperties)?$", uri)
+        if match is None:
+            raise MockError(" ".join(["Malformed URI", uri]))
+        entity = match.group(1)
+        if entity not in entityKeys:
+            raise MockError(" ".join(["Unknown entity", entity]))
+        if match.group(4) is not None:
+            entity = "Orion.NodesCustomProperties"
+        with self.lock:
+            row = self.tables[entity].get(int(match.group(3)))
+        if row is None:
+            raise MockError(" ".join(["No", entity, "with", match.group(2), "=", match.group(3)]))
+        return entity, row
+
+    def query(self, text:str, params:dict) -> list:
+        return SwqlEvaluator(self, SwqlParser(text).parse_query(), params or {}).run()
+
+    def read(self, uri:str) -> dict:
+        entity, row = self.resolve(uri)
+        with self.lock:
+            return dict(row)
+
+    def create(self, entity:str, properties:dict) -> str:
+        if entity not in entityKeys or entity == "Orion.NodesCustomProperties":
+            raise MockError(" ".join(["Cannot create", entity]))
+        properties = dict(properties)
+        with self.lock:
+            if entity == "Orion.Nodes":
+                if "IP" in properties:
+                    properties["IPAddress"] = properties.pop("IP")
+                properties.setdefault("Status", 1)
+                row = self.insert(entity, properties)
+                self.create_custom_properties(row["NodeID"], {})
+                return row["Uri"]
+            return self.insert(entity, properties)["Uri"]
+
+    def create_custom_properties(self, nodeID:int, values:dict) -> None:
+        with self.lock:
+            columns = set()
+            for existing in self.tables["Orion.NodesCustomProperties"].values():
+                columns.update([column for column in existing if column not in ("NodeID", "Uri", "InstanceSiteId", "DisplayName", "Description", "InstanceType")])
+            row = dict([(column, None) for column in columns])
+            row.update(values)
+            row.update({"NodeID": nodeID, "InstanceSiteId": 0, "DisplayName": None, "Description": None, "InstanceType": "Orion.NodesCustomProperties"})
+            self.insert("Orion.NodesCustomProperties", row)
+
+    def update(self, uri:str, properties:dict) -> None:
+        entity, row = self.resolve(uri)
+        with self.lock:
+            for name in properties:
+                existing = [key for key in row if key.lower() == name.lower()]
+                row[existing[0] if existing else name] = properties[name]
+
+    def delete(self, uri:str) -> None:
+        entity, row = self.resolve(uri)
+        with self.lock:
+            del self.tables[entity][row[entityKeys[entity]]]
+
+    def invoke(self, entity:str, verb:str, args:list) -> object:
+        if entity == "Orion.APM.Application" and verb == "CreateApplication":
+            return self.create_application(*args)
+        raise MockError(" ".join(["Verb", "".join([entity, ".", verb]), "is not implemented by the mock"]))
+
+    def create_application(self, nodeID:int, templateID:int, credentialSetID:int=-4, skipIfDuplicate:bool=True) -> int:
+        with self.lock:
+            template = self.tables["Orion.APM.ApplicationTemplate"].get(int(templateID))
+            if template is None:
+                raise MockError(" ".join(["No application template", str(templateID)]))
+            if int(nodeID) not in self.tables["Orion.Nodes"]:
+                raise MockError(" ".join(["No node", str(nodeID)]))
+            if skipIfDuplicate:
+                for app in self.tables["Orion.APM.Application"].values():
+                    if app["NodeID"] == int(nodeID) and app["ApplicationTemplateID"] == int(templateID):
+                        return -1
+
+            app = self.insert("Orion.APM.Application", {"Name": template["Name"], "NodeID": int(nodeID), "ApplicationTemplateID": int(templateID)})
+            for componentTemplate in self.tables["Orion.APM.ComponentTemplate"].values():
+                if componentTemplate["ApplicationTemplateID"] == int(templateID):
+                    self.insert("Orion.APM.Component", {"ApplicationID": app["ApplicationID"], "TemplateID": componentTemplate["ID"], "Name": componentTemplate["Name"]})
+            return app["ApplicationID"]
+
+def build_inventory(nodes:int=100, pollersPerNode:int=8, appsPerNode:int=3, engines:int=4, templates:int=10, componentsPerTemplate:int=3, host:str="mock-swis") -> MockInventory:
+
+    # Synthetic estate. Node 1 (10.0.0.1, golden.example.com) is the golden node the scripts copy from;
+    # it has component overrides on its applications. Template 1 is the HTTP template.
+    inventory = MockInventory(host)
+
+    inventory.insert("Orion.Engines", {"EngineID": 1, "DisplayName": "orion-primary", "ServerType": "Primary", "Elements": 0})
+    for number in range(1, engines + 1):
+        inventory.insert("Orion.Engines", {"EngineID": number + 1, "DisplayName": "swpoller%02d" % number, "ServerType": "Additional", "Elements": 0})
+
+    for number in range(1, templates + 1):
+        inventory.insert("Orion.APM.ApplicationTemplate", {"ApplicationTemplateID": number, "Name": "HTTP" if number == 1 else "Template %d" % number})
+        for component in range(1, componentsPerTemplate + 1):
+            inventory.insert("Orion.APM.ComponentTemplate", {"ApplicationTemplateID": number, "Name": "Component %d" % component})
+
+    for number in range(1, nodes + 1):
+        caption = "golden.example.com" if number == 1 else "node%d.example.com" % number
+        ipAddress = "10.0.0.1" if number == 1 else "10.%d.%d.%d" % (1 + number // 65536, (number // 256) % 256, number % 256)
+        engineID = 2 + (number % engines) if engines > 0 else 1
+        node = inventory.insert("Orion.Nodes", {
+            "NodeID": number,
+            "Caption": caption,
+            "DNS": caption,
+            "IPAddress": ipAddress,
+            "EngineID": engineID,
+            "Vendor": vendors[number % len(vendors)],
+            "MachineType": "net-snmp - Linux",
+            "ObjectSubType": "SNMP",
+            "SNMPVersion": 2,
+            "Community": "public",
+            "Status": 1
+        })
+        inventory.create_custom_properties(node["NodeID"], {"Department": "Networking", "City": "Evanston", "Comments": "synthetic node %d" % number})
+        inventory.tables["Orion.Engines"][engineID]["Elements"] += 1
+
+        for pollerType in pollerTypes[:pollersPerNode]:
+            inventory.insert("Orion.Pollers", {"PollerType": pollerType, "NetObject": "N:%d" % number, "NetObjectType": "N", "NetObjectID": number, "Enabled": True})
+            inventory.tables["Orion.Engines"][engineID]["Elements"] += 1
+
+        for app in range(appsPerNode):
+            if templates > 0:
+                templateID = 1 + (number + app) % templates
+                appID = inventory.create_application(number, templateID, -4, False)
+                if number == 1:
+                    for component in inventory.rows("Orion.APM.Component"):
+                        if component["ApplicationID"] == appID:
+                            inventory.insert("Orion.APM.ComponentSetting", {"ComponentID": component["ComponentID"], "Key": "Timeout", "Value": "30", "ValueType": 0, "Required": True})
+
+    return inventory
+
+# ----------------------------------------------------------------------------
+# HTTP front end
+
+class MockSwisHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    # Headers and body go out in separate writes; without this every response waits on a delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status:int, body:object) -> None:
+        data = json.dumps(body, default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def handle_verb(self, method:str) -> None:
+        server = self.server
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or "null") if length > 0 else None
+
+        if not self.path.startswith(apiPath):
+            self.send_json(404, {"Message": " ".join(["Not a SWIS path:", self.path])})
+            return
+        fragment = unquote(self.path[len(apiPath):])
+
+        # Simulated server behaviour
+        if server.latency > 0 or server.jitter > 0:
+            time.sleep(server.latency + random.uniform(0, server.jitter))
+        with server.statsLock:
+            server.requests += 1
+        if server.errorRate > 0 and random.random() < server.errorRate:
+            with server.statsLock:
+                server.injectedErrors += 1
+            self.send_json(503, {"Message": "Injected error from mock SWIS server"})
+            return
+
+        inventory = server.inventory
+        try:
+            if method == "POST" and fragment == "Query":
+                self.send_json(200, {"results": inventory.query(body["query"], body.get("parameters") or {})})
+            elif method == "POST" and fragment.startswith("Invoke/"):
+                parts = fragment.split("/")
+                self.send_json(200, inventory.invoke("/".join(parts[1:-1]), parts[-1], body or []))
+            elif method == "POST" and fragment.startswith("Create/"):
+                self.send_json(200, inventory.create(fragment[len("Create/"):], body or {}))
+            elif method == "POST" and fragment == "BulkUpdate":
+                for uri in body["uris"]:
+                    inventory.update(uri, body["properties"])
+                self.send_json(200, None)
+            elif method == "POST" and fragment == "BulkDelete":
+                for uri in body["uris"]:
+                    inventory.delete(uri)
+                self.send_json(200, None)
+            elif method == "GET" and fragment.startswith("swis://"):
+                self.send_json(200, inventory.read(fragment))
+            elif method == "POST" and fragment.startswith("swis://"):
+                inventory.update(fragment, body or {})
+                self.send_json(200, None)
+            elif method == "DELETE" and fragment.startswith("swis://"):
+                inventory.delete(fragment)
+                self.send_json(200, None)
+            else:
+                self.send_json(404, {"Message": " ".join(["Unknown SWIS operation", method, fragment])})
+        except (SwqlError, MockError) as e:
+            self.send_json(400, {"Message": str(e)})
+        except Exception as e:
+            self.send_json(500, {"Message": " ".join(["Mock SWIS server error:", repr(e)])})
+
+    def do_GET(self):
+        self.handle_verb("GET")
+
+    def do_POST(self):
+        self.handle_verb("POST")
+
+    def do_DELETE(self):
+        self.handle_verb("DELETE")
+
+class MockSwisServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    # The asyncio client opens all its connections at once; the default backlog of 5 drops
+    # the rest of them and makes each wait a second for the SYN to be sent again
+    request_queue_size = 128
+
+    def __init__(self, address:tuple, inventory:MockInventory, latency:float=0.0, jitter:float=0.0, errorRate:float=0.0):
+        super().__init__(address, MockSwisHandler)
+        self.inventory = inventory
+        self.latency = latency
+        self.jitter = jitter
+        self.errorRate = errorRate
+        self.statsLock = threading.Lock()
+        self.requests = 0
+        self.injectedErrors = 0
+
+def start_mock_server(inventory:MockInventory, port:int=0, latency:float=0.0, jitter:float=0.0, errorRate:float=0.0) -> MockSwisServer:
+    # Serve plain HTTP on localhost from a background thread. Port 0 picks a free port.
+    server = MockSwisServer(("127.0.0.1", port), inventory, latency, jitter, errorRate)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+def mock_swis_client(server:MockSwisServer, username:str="mock", password:str="mock", workers:int=1) -> object:
+    # A real orionsdk SwisClient, set up like the scripts' own, pointed at the mock.
+    # SwisClient only speaks HTTPS, so point its URL at plain HTTP.
+    from solarwinds_common import make_swis_client
+    swis = make_swis_client("127.0.0.1", username, password, workers, port=server.server_address[1])
+    swis.url = "".join(["http://127.0.0.1:", str(server.server_address[1]), apiPath])
+    return swis
+
+def mock_async_swis_client(server:MockSwisServer, username:str="mock", password:str="mock", limit:int=None, metrics:object=None, retryPolicy:object=None) -> object:
+    # An AsyncSwisClient, set up like the scripts' own, pointed at the mock over plain HTTP
+    from solarwinds_common import AsyncSwisClient, defaultAsyncLimit
+    swis = AsyncSwisClient("127.0.0.1", username, password, limit=limit or defaultAsyncLimit, port=server.server_address[1], metrics=metrics, retryPolicy=retryPolicy)
+    swis.url = "".join(["http://127.0.0.1:", str(server.server_address[1]), apiPath])
+    return swis
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Run a mock SolarWinds Information Service backed by a synthetic inventory")
+    parser.add_argument("-p", "--port", metavar="PORT", action="store", type=int, dest="port", default=17774, help="Port to listen on")
+    parser.add_argument("--bind", metavar="ADDRESS", action="store", type=str, dest="bind", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--nodes", metavar="N", action="store", type=int, dest="nodes", default=100, help="Number of synthetic nodes")
+    parser.add_argument("--pollers-per-node", metavar="N", action="store", type=int, dest="pollersPerNode", default=8, help="Pollers on each node")
+    parser.add_argument("--apps-per-node", metavar="N", action="store", type=int, dest="appsPerNode", default=3, help="Application monitors on each node")
+    parser.add_argument("--engines", metavar="N", action="store", type=int, dest="engines", default=4, help="Number of additional polling engines")
+    parser.add_argument("--templates", metavar="N", action="store", type=int, dest="templates", default=10, help="Number of application templates")
+    parser.add_argument("--latency", metavar="MS", action="store", type=float, dest="latency", default=0.0, help="Milliseconds added to every request")
+    parser.add_argument("--jitter", metavar="MS", action="store", type=float, dest="jitter", default=0.0, help="Up to this many random milliseconds added to every request")
+    parser.add_argument("--error-rate", metavar="FRACTION", action="store", type=float, dest="errorRate", default=0.0, help="Fraction of requests answered with an injected 503 error")
+    parser.add_argument("--certfile", metavar="PEM", action="store", type=str, dest="certfile", default=None, help="Certificate for serving HTTPS, as orionsdk.SwisClient expects")
+    parser.add_argument("--keyfile", metavar="PEM", action="store", type=str, dest="keyfile", default=None, help="Private key for --certfile")
+    args = parser.parse_args()
+
+    inventory = build_inventory(args.nodes, args.pollersPerNode, args.appsPerNode, args.engines, args.templates)
+    server = MockSwisServer((args.bind, args.port), inventory, args.latency / 1000, args.jitter / 1000, args.errorRate)
+    if args.certfile is not None:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(args.certfile, args.keyfile)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+
+    print(" ".join(["Mock SWIS serving", str(args.nodes), "nodes on", "".join(["https" if args.certfile else "http", "://", args.bind, ":", str(args.port), apiPath])]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,287 @@
+import argparse
+import getpass
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from solarwinds_common import load_script, read_manifest, iter_batches, Journal, defaultBatchSize, InstrumentedSwisClient, report_metrics, make_swis_client, defaultSwisTimeout, RetryPolicy, defaultRetries, AdaptiveLimiter, defaultLatencyTarget, open_inventory_cache, defaultCacheTTL, run_query
+
+# Onboard servers in one run: every target flows through node creation, pollers and custom
+# properties (copy-solarwinds-node), application monitors (copy-solarwinds-apps) and HTTP monitors
+# (bulk-create-solarwinds-apps). Each stage has its own pool and a node is handed to the next
+# stage, with its NodeID, as soon as its own custom properties are set, so the application copy
+# for the first node runs while later nodes are still being created and nothing is looked up twice.
+# Custom properties are written per node for this, not in one bulk update per batch.
+
+copyNode = load_script("copy-solarwinds-node")
+copyApps = load_script("copy-solarwinds-apps")
+bulkCreateApps = load_script("bulk-create-solarwinds-apps")
+
+# Nodes whose application monitors are copied at once
+defaultAppConcurrency = 2
+
+# HTTP monitors created at once, across all nodes
+defaultMonitorConcurrency = 4
+
+stages = ["node", "apps", "monitors"]
+
+class JournalSection:
+
+    # The steps of one stage in the shared journal. Keys get the stage name in front,
+    # so the node and application stages can both record a "finished" step for a target.
+    def __init__(self, journal:object, stage:str):
+        self.journal = journal
+        self.stage = stage
+
+    def key(self, key:str) -> str:
+        return ":".join([self.stage, key])
+
+    def done(self, key:str, step:str) -> bool:
+        return self.journal.done(self.key(key), step)
+
+    def get(self, key:str, step:str) -> dict:
+        return self.journal.get(self.key(key), step)
+
+    def record(self, key:str, step:str, **details) -> None:
+        self.journal.record(self.key(key), step, **details)
+
+def onboard_nodes(swis:object, sourceNodeIP:str, targets:list, hostnames:dict, sourceSnapshot:dict, sourceApps:dict, applicationTemplateID:int, appStage:object, monitorStage:object, results:dict, resultsLock:object, concurrency:int=1, pollerConcurrency:int=copyNode.defaultPollerConcurrency, settingConcurrency:int=copyApps.defaultSettingConcurrency, targetIPs:dict=None, customProps:dict=None, journal:object=None, cache:object=None, preflight:bool=True, **nodeOptions) -> None:
+
+    # Run a batch of targets through the node stage and hand each node to the application stage
+    # the moment it has its pollers and custom properties; the application stage hands it on to the HTTP monitor stage.
+    # appStage and monitorStage are executors shared by every batch, so a batch's applications and
+    # monitors are still being created while the next batch's nodes are. hostnames maps targets to
+    # the hostnames they get HTTP monitors for. Every target's stage outcomes go into results.
+    nodeJournal = JournalSection(journal, "node") if journal is not None else None
+    appJournal = JournalSection(journal, "apps") if journal is not None else None
+
+    def set_stage(target:str, stage:str, status:str, details:str="") -> None:
+        with resultsLock:
+            result = results[target]
+            result[stage] = status
+            if details != "":
+                result["details"].append(" ".join([stage, details]))
+            if all([result[name] not in ("pending", "running") for name in stages]):
+                result["seconds"] = time.monotonic() - result["started"]
+
+    def run_monitor(target:str, nodeID:int, hostname:str, remaining:list) -> None:
+        try:
+            bulkCreateApps.create_apps(swis=swis, targetNodeName=target, hostname=hostname, targetNodeID=nodeID, applicationTemplateID=applicationTemplateID, journal=journal)
+            print(" ".join(["Create application monitor for",hostname,"on",target,"succeeded"]))
+            failed = None
+        except Exception as e:
+            failed = " ".join([hostname, str(e.args)])
+        with resultsLock:
+            if failed is not None:
+                results[target]["monitorErrors"].append(failed)
+            remaining.remove(hostname)
+            last = len(remaining) == 0
+            errors = list(results[target]["monitorErrors"])
+        if last:
+            if len(errors) > 0:
+                set_stage(target, "monitors", "failed", "; ".join(errors))
+            else:
+                set_stage(target, "monitors", "succeeded")
+
+    def run_monitors(target:str, nodeID:int, created:bool) -> None:
+        # A node this run created has no monitors yet, so only existing nodes are checked
+        wanted = list(dict.fromkeys(hostnames.get(target, [])))
+        if journal is not None:
+            wanted = [hostname for hostname in wanted if not journal.done("/".join([target, hostname]), "finished")]
+        try:
+            if preflight and not created and len(wanted) > 0:
+                existing = bulkCreateApps.get_existing_monitors(swis, nodeID, applicationTemplateID)
+                wanted = [hostname for hostname in wanted if hostname.lower() not in existing or (journal is not None and journal.done("/".join([target, hostname]), "created"))]
+        except Exception as e:
+            set_stage(target, "monitors", "failed", str(e.args))
+            return
+        if len(wanted) == 0:
+            set_stage(target, "monitors", "skipped")
+            return
+        set_stage(target, "monitors", "running")
+        remaining = list(wanted)
+        for hostname in wanted:
+            monitorStage.submit(run_monitor, target, nodeID, hostname, remaining)
+
+    def run_apps(target:str, nodeID:int, created:bool) -> None:
+        set_stage(target, "apps", "running")
+        try:
+            if appJournal is not None and appJournal.done(target, "finished"):
+                set_stage(target, "apps", "skipped", "already copied according to the journal")
+            else:
+                existingApps = {}
+                if preflight and not created:
+                    existingApps = copyApps.get_existing_apps(swis, [nodeID]).get(nodeID, {})
+                # Apps an earlier run created may still need their settings, so those nodes aren't skipped
+                resuming = appJournal is not None and any([appJournal.done(target, "".join(["app:", str(app["ApplicationID"])])) for app in sourceApps["Applications"]])
+                if preflight and not resuming and len(copyApps.match_existing_apps(sourceApps["Applications"], existingApps)) == len(sourceApps["Applications"]):
+                    set_stage(target, "apps", "skipped", "every application monitor is already on the node")
+                else:
+                    copyApps.copy_apps(swis=swis, sourceNodeIP=sourceNodeIP, targetNode=target, settingConcurrency=settingConcurrency, sourceApps=sourceApps, targetNodeID=nodeID, journal=appJournal, existingApps=existingApps if preflight else None)
+                    print(" ".join(["Copy application monitors from",sourceNodeIP,"to",target,"succeeded"]))
+                    set_stage(target, "apps", "succeeded")
+        except Exception as e:
+            print(" ".join(["Copy application monitors", target, "from", sourceNodeIP,"failed. Details:", str(e.args)]))
+            set_stage(target, "apps", "failed", str(e.args))
+        run_monitors(target, nodeID, created)
+
+    def node_finished(target:str, newNode:dict, created:bool) -> None:
+        with resultsLock:
+            results[target]["NodeID"] = newNode["NodeID"]
+        appStage.submit(run_apps, target, newNode["NodeID"], created)
+
+    with resultsLock:
+        for target in targets:
+            results[target] = {"target": target, "NodeID": None, "node": "running", "apps": "pending", "monitors": "pending", "monitorErrors": [], "details": [], "started": time.monotonic(), "seconds": 0.0}
+
+    nodeResults = copyNode.copy_nodes(swis=swis, sourceNodeIP=sourceNodeIP, targets=targets, concurrency=concurrency, sourceSnapshot=sourceSnapshot, pollerConcurrency=pollerConcurrency, targetIPs=targetIPs, journal=nodeJournal, cache=cache, preflight=preflight, customProps=customProps, onFinished=node_finished, **nodeOptions)
+
+    # Nodes the node stage had nothing to do for still go through the later stages
+    for nodeResult in nodeResults:
+        target = nodeResult["target"]
+        with resultsLock:
+            handedOver = results[target]["NodeID"] is not None
+        set_stage(target, "node", nodeResult["status"], nodeResult["details"])
+        if handedOver:
+            continue
+        if nodeResult["status"] == "skipped" and nodeResult["NodeID"] is not None:
+            node_finished(target, {"NodeID": nodeResult["NodeID"]}, False)
+        else:
+            set_stage(target, "apps", "skipped")
+            set_stage(target, "monitors", "skipped")
+
+def print_pipeline_summary(results:list) -> None:
+
+    # One line per target with the outcome of every stage, then the totals
+    width = max([len("Target")] + [len(result["target"]) for result in results])
+    print("")
+    print("  ".join(["Target".ljust(width), "NodeID".rjust(8), "Node".ljust(9), "Apps".ljust(9), "Monitors".ljust(9), "Seconds".rjust(8), "Details"]))
+    for result in results:
+        nodeID = "" if result["NodeID"] is None else str(result["NodeID"])
+        print("  ".join([result["target"].ljust(width), nodeID.rjust(8), result["node"].ljust(9), result["apps"].ljust(9), result["monitors"].ljust(9), "{:.1f}".format(result["seconds"]).rjust(8), "; ".join(result["details"])]))
+
+    complete = [result for result in results if all([result[stage] in ("succeeded", "skipped") for stage in stages]) and result["NodeID"] is not None]
+    print(" ".join([str(len(results)), "targets onboarded:", str(len(complete)), "complete,", str(len(results) - len(complete)), "with failures"]))
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Onboard servers into Solarwinds: copy a node, its pollers and application monitors, and add HTTP monitors, streaming each target through every stage")
+    parser.add_argument("-s", "--sourceNodeIP", metavar="SOURCE_NODE_IP", action="store", type=str, dest="sourceNodeIP", required=True, help="Source node IP in Solarwinds")
+    parser.add_argument("-S", "--server", metavar="SW_SERVER", action="store", type=str, dest="swisInfo", default="localhost", help="IP or FQDN of Solarwinds server")
+    parser.add_argument("-t", "--targetNodeName", metavar="TARGET_NODE", action="append", type=str, dest="targets", default=[], required=False, help="FQDN of new node")
+    parser.add_argument("-H", "--hostname", metavar="HOSTNAME", action="append", type=str, dest="hostnames", default=[], required=False, help="Hostname to give an HTTP monitor on every -t target. May be repeated")
+    parser.add_argument("-m", "--manifest", metavar="MANIFEST", action="store", type=str, dest="manifest", default=None, required=False, help="CSV or JSON Lines file with a 'target' column naming the new nodes, read as the run goes. An optional 'hostnames' column lists, separated by spaces, the hostnames the node gets HTTP monitors for. Columns named cp.<Name> set that custom property of the row's node. Use - for standard input")
+    parser.add_argument("-j", "--journal", metavar="JOURNAL", action="store", type=str, dest="journal", default=None, required=False, help="Journal file recording each completed step of every stage. Rerunning with the same journal resumes where the last run stopped")
+    parser.add_argument("--batch-size", metavar="N", action="store", type=int, dest="batchSize", default=defaultBatchSize, required=False, help="Number of manifest targets planned and created together")
+    parser.add_argument("-r", "--ready-query", metavar="SWQL", action="store", type=str, dest="readyQuery", default=None, required=False, help="SWQL query that returns a row once a new node is ready for its custom properties. May use @uri, @caption and @nodeId")
+    parser.add_argument("--ready-timeout", metavar="SECONDS", action="store", type=int, dest="readyTimeout", default=300, required=False, help="Longest time to poll --ready-query for each new node")
+    parser.add_argument("-c", "--concurrency", metavar="N", action="store", type=int, dest="concurrency", default=1, required=False, help="Number of nodes to create in parallel")
+    parser.add_argument("-x", "--exclude-engine", metavar="PATTERN", action="append", type=str, dest="excludeEngines", default=None, required=False, help="".join(["SWQL LIKE pattern for polling engines that must not get new nodes. May be repeated. Default: ", " ".join(copyNode.defaultEngineExcludes).replace("%", "%%")]))
+    parser.add_argument("--poller-concurrency", metavar="N", action="store", type=int, dest="pollerConcurrency", default=copyNode.defaultPollerConcurrency, required=False, help="Number of pollers to create in parallel on each new node")
+    parser.add_argument("--app-concurrency", metavar="N", action="store", type=int, dest="appConcurrency", default=defaultAppConcurrency, required=False, help="Number of nodes whose application monitors are copied in parallel")
+    parser.add_argument("--setting-concurrency", metavar="N", action="store", type=int, dest="settingConcurrency", default=copyApps.defaultSettingConcurrency, required=False, help="Number of component settings to create in parallel on each node")
+    parser.add_argument("--monitor-concurrency", metavar="N", action="store", type=int, dest="monitorConcurrency", default=defaultMonitorConcurrency, required=False, help="Number of HTTP monitors to create in parallel")
+    parser.add_argument("--dns-timeout", metavar="SECONDS", action="store", type=int, dest="dnsTimeout", default=copyNode.defaultDnsTimeout, required=False, help="Longest time to wait for each target name to resolve")
+    parser.add_argument("--allow-duplicates", action="store_false", dest="preflight", default=True, required=False, help="Create every node, application and HTTP monitor even if Solarwinds already has it")
+    parser.add_argument("--cache", metavar="CACHE_FILE", action="store", type=str, dest="cache", default=None, required=False, help="SQLite file caching Orion nodes, polling engines and application templates between runs")
+    parser.add_argument("--cache-ttl", metavar="SECONDS", action="store", type=int, dest="cacheTTL", default=defaultCacheTTL, required=False, help="Age after which the cache is pulled from Orion in full again")
+    parser.add_argument("--refresh", action="store_true", dest="refresh", default=False, required=False, help="Pull the whole cache from Orion again now")
+    parser.add_argument("--ca-bundle", metavar="PEM", action="store", type=str, dest="caBundle", default=None, required=False, help="Verify the SWIS server certificate against this CA bundle. Without it the certificate is not checked")
+    parser.add_argument("--retries", metavar="N", action="store", type=int, dest="retries", default=defaultRetries, required=False, help="Times to repeat a SWIS call that failed with a transient error. Queries, reads and updates are repeated after any transient error, creates only when SWIS never started on them")
+    parser.add_argument("--adaptive", action="store_true", dest="adaptive", default=False, required=False, help="Start with few SWIS calls in flight and add more while Orion keeps up, backing off when it slows down or fails. The concurrency of the stages sets the most calls in flight")
+    parser.add_argument("--latency-target", metavar="MS", action="store", type=int, dest="latencyTarget", default=int(defaultLatencyTarget * 1000), required=False, help="Mean SWIS latency above which --adaptive cuts the calls in flight")
+    parser.add_argument("--timeout", metavar="SECONDS", action="store", type=int, dest="timeout", default=defaultSwisTimeout, required=False, help="Longest time to wait for each SWIS response")
+    parser.add_argument("--metrics-file", metavar="PROM_FILE", action="store", type=str, dest="metricsFile", default=None, required=False, help="Write SWIS call counts and latencies to this Prometheus textfile at the end of the run")
+    args = parser.parse_args()
+
+    # Sanity test for the command line
+    try:
+        try:
+            copyNode.validate_ip(args.swisInfo)
+        except:
+            copyNode.validate_fqdn(args.swisInfo)
+
+        copyNode.validate_ip(args.sourceNodeIP)
+        for target in args.targets:
+            copyNode.validate_fqdn(target)
+        for hostname in args.hostnames:
+            copyNode.validate_fqdn(hostname)
+
+        if len(args.targets) == 0 and args.manifest is None:
+            raise Exception("Give the new nodes with -t or a manifest with -m")
+
+        if min(args.batchSize, args.concurrency, args.pollerConcurrency, args.appConcurrency, args.settingConcurrency, args.monitorConcurrency) < 1:
+            raise Exception("Batch size and concurrency must be at least 1")
+    except Exception as e:
+        print(" ".join(["Illegal value on command line. Details:", str(e.args)]))
+        quit()
+
+    try:
+        journal = Journal(args.journal) if args.journal else None
+    except Exception as e:
+        print(" ".join(["Unable to open journal. Details:", str(e.args)]))
+        quit()
+
+    username = input("Username: ")
+    password = getpass.getpass("Password: ")
+
+    # Create the SWIS connection, pooled for the workers of every stage, and run a simple test
+    workers = args.concurrency * args.pollerConcurrency + args.appConcurrency * args.settingConcurrency + args.monitorConcurrency
+    limiter = AdaptiveLimiter(workers, latencyTarget=args.latencyTarget / 1000) if args.adaptive else None
+    try:
+        swis = InstrumentedSwisClient(make_swis_client(args.swisInfo, username, password, workers, args.caBundle, args.timeout), retryPolicy=RetryPolicy(args.retries), limiter=limiter)
+        response = run_query(swis, "probe")
+    except Exception as e:
+        print(" ".join(["Unable to connect to SWIS server", args.swisInfo, "Details:", str(e.args)]))
+        quit()
+
+    cache = open_inventory_cache(args.cache, args.swisInfo, swis, args.cacheTTL, args.refresh)
+
+    # Everything the stages read from the source node and the HTTP template, read once
+    try:
+        sourceSnapshot = copyNode.get_source_snapshot(swis, args.sourceNodeIP, cache)
+        sourceApps = copyApps.get_source_apps(swis, args.sourceNodeIP, cache)
+        applicationTemplateID = bulkCreateApps.get_http_template_id(swis, cache)
+    except Exception as e:
+        print(" ".join(["Unable to read source node", args.sourceNodeIP, "Details:", str(e.args)]))
+        quit()
+
+    # Each batch is a list of (target, hostnames, custom properties), from -t or from the manifest
+    if args.manifest is not None:
+        def manifest_targets():
+            for row in read_manifest(args.manifest, "target"):
+                yield (row["target"], str(row.get("hostnames") or "").split(), copyNode.manifest_custom_props(row))
+        batches = iter_batches(manifest_targets(), args.batchSize)
+    else:
+        batches = [[(target, args.hostnames, {}) for target in dict.fromkeys(args.targets)]]
+
+    results = {}
+    resultsLock = threading.Lock()
+    nodeOptions = {"excludeEngines": args.excludeEngines, "readyQuery": args.readyQuery, "readyTimeout": args.readyTimeout, "dnsTimeout": args.dnsTimeout}
+    appStage = ThreadPoolExecutor(max_workers=args.appConcurrency)
+    monitorStage = ThreadPoolExecutor(max_workers=args.monitorConcurrency)
+    try:
+        for batch in batches:
+            valid = []
+            for target, hostnames, customProps in batch:
+                try:
+                    copyNode.validate_fqdn(target)
+                    for hostname in hostnames:
+                        copyNode.validate_fqdn(hostname)
+                    valid.append((target, hostnames, customProps))
+                except Exception as e:
+                    results[target] = {"target": target, "NodeID": None, "node": "failed", "apps": "skipped", "monitors": "skipped", "details": [str(e.args)], "seconds": 0.0}
+            onboard_nodes(swis=swis, sourceNodeIP=args.sourceNodeIP, targets=[item[0] for item in valid], hostnames=dict([(item[0], item[1]) for item in valid]), sourceSnapshot=sourceSnapshot, sourceApps=sourceApps, applicationTemplateID=applicationTemplateID, appStage=appStage, monitorStage=monitorStage, results=results, resultsLock=resultsLock, concurrency=args.concurrency, pollerConcurrency=args.pollerConcurrency, settingConcurrency=args.settingConcurrency, customProps=dict([(item[0], item[2]) for item in valid]), journal=journal, cache=cache, preflight=args.preflight, **nodeOptions)
+    except Exception as e:
+        print(" ".join(["Reading manifest", args.manifest, "failed. Details:", str(e.args)]))
+
+    # The application stage hands nodes to the monitor stage, so it has to drain first
+    appStage.shutdown(wait=True)
+    monitorStage.shutdown(wait=True)
+
+    if journal is not None:
+        journal.close()
+    if cache is not None:
+        cache.close()
+    print_pipeline_summary(list(results.values()))
+
+    report_metrics(swis, args.metricsFile, "onboard-solarwinds-nodes")
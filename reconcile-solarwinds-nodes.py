@@ -0,0 +1,424 @@
+import argparse
+import getpass
+import hashlib
+import json
+import re
+from solarwinds_common import load_script, read_manifest, iter_batches, defaultBatchSize, InstrumentedSwisClient, report_metrics, make_swis_client, defaultSwisTimeout, RetryPolicy, defaultRetries, open_inventory_cache, defaultCacheTTL, run_query, run_swql
+
+# Bring clones back in line with the golden node they were copied from. Every clone's custom
+# properties, pollers, application monitors and component overrides are read in bulk, a batch
+# of clones per query, and reduced to one short fingerprint per section. Only the sections whose
+# fingerprint differs from the golden node's are written, so a pass over clones that haven't
+# drifted costs a handful of queries per batch and no writes at all.
+
+copyNode = load_script("copy-solarwinds-node")
+copyApps = load_script("copy-solarwinds-apps")
+
+sections = ["customprops", "pollers", "apps", "overrides"]
+
+# Hex digits kept of each section's SHA-256
+fingerprintLength = 16
+
+# Application IDs per query when reading component overrides
+settingsChunkSize = 100
+
+# Custom property names are put in the query text, so they must be plain identifiers
+customPropName = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+def fingerprint(items:list) -> str:
+    # Short digest of a section's canonical form, the same for equal sections on any node
+    return hashlib.sha256(json.dumps(items, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:fingerprintLength]
+
+def setting_value(setting:dict) -> list:
+    return [str(setting["Value"]), int(setting["ValueType"]), bool(setting["Required"])]
+
+def ranked_apps(applications:list) -> dict:
+
+    # Applications keyed by (ApplicationTemplateID, rank), the rank counting apps from the same template
+    # in the order given. Golden and clone apps with the same key are paired, as match_existing_apps pairs them.
+    apps = {}
+    for app in applications:
+        rank = len([key for key in apps if key[0] == app["ApplicationTemplateID"]])
+        apps[(app["ApplicationTemplateID"], rank)] = app
+    return apps
+
+def coerce_custom_prop(value:object, goldenValue:object) -> object:
+
+    # Manifest values are text, so give them the type of the golden node's value to compare and write like it
+    if not isinstance(value, str) or goldenValue is None or isinstance(goldenValue, str):
+        return value
+    try:
+        if isinstance(goldenValue, bool):
+            return {"true": True, "1": True, "yes": True, "false": False, "0": False, "no": False}.get(value.strip().lower(), value)
+        if isinstance(goldenValue, int):
+            return int(value)
+        if isinstance(goldenValue, float):
+            return float(value)
+    except ValueError:
+        pass
+    return value
+
+def golden_state(swis:object, sourceNodeIP:str, ignoreProps:list=None, cache:object=None) -> dict:
+
+    # The golden node in the shape read_clone_states gives clones, plus what the fixes need
+    snapshot = copyNode.get_source_snapshot(swis, sourceNodeIP, cache)
+    sourceApps = copyApps.get_source_apps(swis, sourceNodeIP, cache)
+    for name in snapshot["CustomProps"]:
+        if customPropName.match(name) is None:
+            raise Exception(" ".join(["Custom property", name, "of the golden node is not a plain name"]))
+
+    apps = ranked_apps(sourceApps["Applications"])
+    settings = {}
+    for appKey, app in apps.items():
+        for setting in sourceApps["Settings"].get(app["ApplicationID"], []):
+            settings[appKey + (setting["TemplateID"], setting["Key"])] = setting
+
+    return {
+        "NodeID": snapshot["NodeID"],
+        "Snapshot": snapshot,
+        "SourceApps": sourceApps,
+        "CustomProps": dict([(name, value) for name, value in snapshot["CustomProps"].items() if name not in (ignoreProps or [])]),
+        "Pollers": dict([(poller["PollerType"], bool(poller["Enabled"])) for poller in snapshot["Pollers"]]),
+        "Templates": set([appKey[0] for appKey in apps]),
+        "Apps": apps,
+        "Settings": settings
+    }
+
+def read_clone_states(swis:object, nodeIDs:list, propNames:list, appTemplates:set) -> dict:
+
+    # Custom properties, pollers, application monitors and component overrides of a batch of clones,
+    # with one query per section (and per chunk of applications for the overrides).
+    # Apps are keyed like the golden node's, ranked by ApplicationID within each template.
+    states = dict([(nodeID, {"Uri": None, "CustomProps": {}, "Pollers": {}, "PollerUris": {}, "Applications": {}, "Apps": {}, "Settings": {}}) for nodeID in nodeIDs])
+    try:
+        query = "".join(["SELECT N.NodeID, N.Uri", "".join([", CP." + name for name in propNames]), " FROM Orion.Nodes N INNER JOIN Orion.NodesCustomProperties CP on N.NodeID = CP.NodeID where N.NodeID in (@nodeIds)"])
+        for row in run_swql(swis, query, nodeIds=nodeIDs):
+            states[row["NodeID"]]["Uri"] = row["Uri"]
+            states[row["NodeID"]]["CustomProps"] = dict([(name, row.get(name)) for name in propNames])
+
+        for poller in run_query(swis, "poller_details_of_nodes", nodeIds=nodeIDs):
+            states[poller["NetObjectID"]]["Pollers"][poller["PollerType"]] = bool(poller["Enabled"])
+            states[poller["NetObjectID"]]["PollerUris"].setdefault(poller["PollerType"], []).append(poller["Uri"])
+
+        for app in sorted(run_query(swis, "applications_of_nodes", nodeIds=nodeIDs), key=lambda app: app["ApplicationID"]):
+            states[app["NodeID"]]["Applications"].setdefault(app["ApplicationTemplateID"], []).append(app)
+        applications = {}
+        for state in states.values():
+            state["Apps"] = ranked_apps([app for apps in state["Applications"].values() for app in apps])
+            for appKey, app in state["Apps"].items():
+                if appKey[0] in appTemplates:
+                    applications[app["ApplicationID"]] = (state, appKey)
+
+        # Only the overrides of applications the golden node also has are compared
+        applicationIDs = sorted(applications)
+        for start in range(0, len(applicationIDs), settingsChunkSize):
+            for setting in run_query(swis, "component_setting_details", applicationIds=applicationIDs[start:start + settingsChunkSize]):
+                state, appKey = applications[setting["ApplicationID"]]
+                state["Settings"][appKey + (setting["TemplateID"], setting["Key"])] = setting
+    except Exception as e:
+        raise Exception(" ".join(["Unable to read the state of clone nodes from Solarwinds. Details:", str(e.args)]))
+
+    return states
+
+def golden_items(section:str, golden:dict) -> list:
+
+    # A section of the golden node in the canonical form that is fingerprinted
+    if section == "customprops":
+        return sorted([[name, value] for name, value in golden["CustomProps"].items()])
+    if section == "pollers":
+        return sorted([[pollerType, enabled] for pollerType, enabled in golden["Pollers"].items()])
+    if section == "apps":
+        return sorted([list(appKey) for appKey in golden["Apps"]])
+    return sorted([list(key) + setting_value(setting) for key, setting in golden["Settings"].items()])
+
+def wanted_items(section:str, clone:dict, golden:dict, expectedProps:dict) -> list:
+
+    # What a clone's section should be: the golden node's, with the custom properties the clone keeps
+    # applied, and only the overrides of applications the clone has (the apps section creates the rest with theirs)
+    if section == "customprops":
+        return sorted([[name, expectedProps[name]] for name in golden["CustomProps"]])
+    if section == "overrides":
+        return sorted([list(key) + setting_value(setting) for key, setting in golden["Settings"].items() if key[:2] in clone["Apps"]])
+    return golden_items(section, golden)
+
+def clone_items(section:str, clone:dict, golden:dict, prune:bool=False) -> list:
+
+    # A clone's section in the same form. Without prune, what the golden node doesn't have is left
+    # out, since it won't be removed and so isn't drift to fix.
+    if section == "customprops":
+        return sorted([[name, clone["CustomProps"].get(name)] for name in golden["CustomProps"]])
+    if section == "pollers":
+        return sorted([[pollerType, enabled] for pollerType, enabled in clone["Pollers"].items() if prune or pollerType in golden["Pollers"]])
+    if section == "apps":
+        return sorted([list(appKey) for appKey in clone["Apps"] if prune or appKey in golden["Apps"]])
+    return sorted([list(key) + setting_value(setting) for key, setting in clone["Settings"].items() if key[:2] in golden["Apps"] and (prune or key in golden["Settings"])])
+
+def kept_custom_props(golden:dict, overrides:dict=None) -> dict:
+    # The custom property values a clone keeps instead of the golden node's, typed like the golden node's.
+    # Properties the golden node doesn't have, or that --ignore-property leaves out, are neither compared nor written.
+    return dict([(name, coerce_custom_prop(value, golden["CustomProps"][name])) for name, value in (overrides or {}).items() if name in golden["CustomProps"]])
+
+def expected_custom_props(golden:dict, overrides:dict=None) -> dict:
+    # The golden node's custom properties with the values a clone keeps instead
+    props = dict(golden["CustomProps"])
+    props.update(kept_custom_props(golden, overrides))
+    return props
+
+def reconcile_pollers(swis:object, nodeID:int, clone:dict, golden:dict, prune:bool=False, pollerConcurrency:int=copyNode.defaultPollerConcurrency) -> list:
+
+    # Create the pollers the clone lacks and enable or disable the ones that differ, with one
+    # BulkUpdate per state. Pollers the golden node doesn't have are only removed with prune.
+    # Returns an error message for every change that failed.
+    errors = copyNode.create_pollers(swis, copyNode.target_node_pollers(nodeID, golden["Snapshot"], set(clone["Pollers"])), pollerConcurrency)
+    for enabled in (True, False):
+        uris = [uri for pollerType in clone["Pollers"] if pollerType in golden["Pollers"] and golden["Pollers"][pollerType] == enabled and clone["Pollers"][pollerType] != enabled for uri in clone["PollerUris"][pollerType]]
+        if len(uris) > 0:
+            try:
+                swis.bulkupdate(uris, Enabled=enabled)
+            except Exception as e:
+                errors.append(" ".join(["Unable to set Enabled on", str(len(uris)), "pollers. Details:", str(e.args)]))
+    if prune:
+        uris = [uri for pollerType in clone["Pollers"] if pollerType not in golden["Pollers"] for uri in clone["PollerUris"][pollerType]]
+        if len(uris) > 0:
+            try:
+                swis.bulkdelete(uris)
+            except Exception as e:
+                errors.append(" ".join(["Unable to delete", str(len(uris)), "pollers. Details:", str(e.args)]))
+    return errors
+
+def reconcile_apps(swis:object, sourceNodeIP:str, target:str, nodeID:int, clone:dict, golden:dict, prune:bool=False, settingConcurrency:int=copyApps.defaultSettingConcurrency) -> list:
+
+    # Create the application monitors the clone lacks, with their overrides, as copy_apps does.
+    # Monitors the golden node doesn't have, from other templates or beyond its number of apps
+    # from a template, are only removed with prune.
+    errors = []
+    existingApps = dict([(templateID, [app["ApplicationID"] for app in apps]) for templateID, apps in clone["Applications"].items()])
+    if not set(golden["Apps"]) <= set(clone["Apps"]):
+        try:
+            copyApps.copy_apps(swis=swis, sourceNodeIP=sourceNodeIP, targetNode=target, settingConcurrency=settingConcurrency, sourceApps=golden["SourceApps"], targetNodeID=nodeID, existingApps=existingApps)
+        except Exception as e:
+            errors.append(str(e.args))
+    if prune:
+        for appKey, app in clone["Apps"].items():
+            if appKey in golden["Apps"]:
+                continue
+            try:
+                swis.delete(app["Uri"])
+                print(" ".join(["Deleted application ID", str(app["ApplicationID"]), "from template", str(appKey[0]), "on", target]))
+            except Exception as e:
+                errors.append(" ".join(["Unable to delete application ID", str(app["ApplicationID"]), ". Details:", str(e.args)]))
+    return errors
+
+def reconcile_overrides(swis:object, target:str, clone:dict, golden:dict, prune:bool=False) -> list:
+
+    # Set the component overrides that differ from the golden node's on the clone's existing
+    # applications: change the ones with another value, create the missing ones and, with prune,
+    # delete the ones the golden node doesn't have.
+    errors = []
+    changed = [key for key in golden["Settings"] if key in clone["Settings"] and setting_value(golden["Settings"][key]) != setting_value(clone["Settings"][key])]
+    missing = [key for key in golden["Settings"] if key not in clone["Settings"] and key[:2] in clone["Apps"]]
+    extra = [key for key in clone["Settings"] if key not in golden["Settings"] and key[:2] in golden["Apps"]] if prune else []
+
+    for key in changed:
+        setting = golden["Settings"][key]
+        try:
+            swis.update(clone["Settings"][key]["Uri"], Value=setting["Value"], ValueType=setting["ValueType"], Required=setting["Required"])
+        except Exception as e:
+            errors.append(" ".join(["Unable to change override", key[3], "of component template", str(key[2]), ". Details:", str(e.args)]))
+
+    if len(missing) > 0:
+        applicationIDs = [app["ApplicationID"] for appKey, app in clone["Apps"].items() if appKey in golden["Apps"]]
+        try:
+            components = copyApps.get_component_map(swis, applicationIDs)
+        except Exception as e:
+            return errors + [str(e.args)]
+        properties = []
+        for key in missing:
+            component = components.get((clone["Apps"][key[:2]]["ApplicationID"], key[2]))
+            if component is None:
+                continue
+            setting = golden["Settings"][key]
+            properties.append({"ComponentID": component, "Key": setting["Key"], "Required": setting["Required"], "Value": setting["Value"], "ValueType": setting["ValueType"]})
+        for outcome in copyApps.create_component_settings(swis, properties):
+            if isinstance(outcome, Exception):
+                errors.append(" ".join(["Unable to create override. Details:", str(outcome.args)]))
+
+    for key in extra:
+        try:
+            swis.delete(clone["Settings"][key]["Uri"])
+        except Exception as e:
+            errors.append(" ".join(["Unable to delete override", key[3], "of component template", str(key[2]), ". Details:", str(e.args)]))
+
+    if len(changed) + len(missing) + len(extra) > 0:
+        print(" ".join(["Overrides on", "".join([target, ":"]), str(len(changed)), "changed,", str(len(missing)), "created,", str(len(extra)), "deleted"]))
+    return errors
+
+def reconcile_nodes(swis:object, sourceNodeIP:str, targets:list, golden:dict, fixSections:list=None, overrides:dict=None, prune:bool=False, dryRun:bool=False, pollerConcurrency:int=copyNode.defaultPollerConcurrency, settingConcurrency:int=copyApps.defaultSettingConcurrency, cache:object=None) -> list:
+
+    # Compare a batch of clones with the golden node and fix the sections that differ.
+    # overrides maps targets to custom property values they keep instead of the golden node's.
+    # Each target gets a result with its NodeID and, per section, "same", "drifted" (dry run),
+    # "fixed" or "failed"; results are returned in the order the targets were given.
+    fixSections = fixSections or sections
+    results = dict([(target, {"target": target, "NodeID": None, "status": "failed", "details": []}) for target in targets])
+
+    resolved, problems = copyApps.resolve_targets(swis, targets, cache=cache)
+    for target in problems:
+        results[target]["details"].append(problems[target])
+    for target in resolved:
+        if resolved[target] == golden["NodeID"]:
+            results[target]["status"] = "skipped"
+            results[target]["details"].append("is the golden node")
+    clones = dict([(target, nodeID) for target, nodeID in resolved.items() if nodeID != golden["NodeID"]])
+    if len(clones) == 0:
+        return [results[target] for target in targets]
+
+    states = read_clone_states(swis, list(dict.fromkeys(clones.values())), sorted(golden["CustomProps"]), golden["Templates"])
+
+    # Custom properties are written in bulk for the whole batch once every clone has been compared,
+    # with the same values a clone keeps as the comparison used
+    propsToFix = []
+    keptProps = dict([(target, kept_custom_props(golden, (overrides or {}).get(target))) for target in clones])
+    for target, nodeID in clones.items():
+        result = results[target]
+        result["NodeID"] = nodeID
+        clone = states[nodeID]
+        expected = expected_custom_props(golden, (overrides or {}).get(target))
+        drifted = [section for section in fixSections if fingerprint(clone_items(section, clone, golden, prune)) != fingerprint(wanted_items(section, clone, golden, expected))]
+        if not prune:
+            extras = dict([(section, len(clone_items(section, clone, golden, True)) - len(clone_items(section, clone, golden))) for section in fixSections])
+            result["details"] += [" ".join([str(extras[section]), "extra", section, "kept"]) for section in fixSections if extras[section] > 0]
+        for section in fixSections:
+            result[section] = "drifted" if section in drifted else "same"
+        result["status"] = "drifted" if len(drifted) > 0 else "same"
+        if dryRun or len(drifted) == 0:
+            continue
+
+        errors = {}
+        if "pollers" in drifted:
+            errors["pollers"] = reconcile_pollers(swis, nodeID, clone, golden, prune, pollerConcurrency)
+        if "apps" in drifted:
+            errors["apps"] = reconcile_apps(swis, sourceNodeIP, target, nodeID, clone, golden, prune, settingConcurrency)
+        if "overrides" in drifted:
+            errors["overrides"] = reconcile_overrides(swis, target, clone, golden, prune)
+        if "customprops" in drifted:
+            propsToFix.append((target, clone["Uri"]))
+        for section in errors:
+            result[section] = "failed" if len(errors[section]) > 0 else "fixed"
+            result["details"] += [" ".join([section, error]) for error in errors[section]]
+
+    if len(propsToFix) > 0:
+        errors = copyNode.update_custom_properties(swis, propsToFix, golden["CustomProps"], keptProps)
+        for target, uri in propsToFix:
+            results[target]["customprops"] = "failed" if target in errors else "fixed"
+            if target in errors:
+                results[target]["details"].append(" ".join(["customprops", errors[target]]))
+
+    for target in clones:
+        result = results[target]
+        if result["status"] == "drifted" and not dryRun:
+            result["status"] = "failed" if any([result.get(section) == "failed" for section in fixSections]) else "fixed"
+    return [results[target] for target in targets]
+
+def print_reconcile_summary(results:list, fixSections:list) -> None:
+
+    # One line per clone with the state of every section, then the totals
+    width = max([len("Target")] + [len(result["target"]) for result in results])
+    print("")
+    print("  ".join(["Target".ljust(width), "NodeID".rjust(8), "Status".ljust(8)] + [section.ljust(11) for section in fixSections] + ["Details"]))
+    for result in results:
+        nodeID = "" if result["NodeID"] is None else str(result["NodeID"])
+        print("  ".join([result["target"].ljust(width), nodeID.rjust(8), result["status"].ljust(8)] + [result.get(section, "").ljust(11) for section in fixSections] + ["; ".join(result["details"])]))
+
+    counts = dict([(status, len([result for result in results if result["status"] == status])) for status in ("same", "drifted", "fixed", "failed", "skipped")])
+    print(" ".join([str(len(results)), "clones compared:", str(counts["same"]), "in sync,", str(counts["drifted"]), "drifted,", str(counts["fixed"]), "fixed,", str(counts["failed"]), "failed,", str(counts["skipped"]), "skipped"]))
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Compare clone nodes with the golden node they were copied from and write only the sections that drifted: custom properties, pollers, application monitors and component overrides")
+    parser.add_argument("-s", "--sourceNodeIP", metavar="SOURCE_NODE_IP", action="store", type=str, dest="sourceNodeIP", required=True, help="IP of the golden node in Solarwinds")
+    parser.add_argument("-S", "--server", metavar="SW_SERVER", action="store", type=str, dest="swisInfo", default="localhost", help="IP or FQDN of Solarwinds server")
+    parser.add_argument("-t", "--targetNodeName", metavar="TARGET_NODE", action="append", type=str, dest="targets", default=[], required=False, help="Caption or IP of a clone node. May be repeated")
+    parser.add_argument("-m", "--manifest", metavar="MANIFEST", action="store", type=str, dest="manifest", default=None, required=False, help="CSV or JSON Lines file with a 'target' column naming the clone nodes, read as the run goes. Columns named cp.<Name> give custom property values the row's clone keeps instead of the golden node's. Use - for standard input")
+    parser.add_argument("--section", metavar="SECTION", action="append", type=str, dest="sections", choices=sections, default=None, required=False, help="".join(["Section to compare and fix. May be repeated. Default: all of ", " ".join(sections)]))
+    parser.add_argument("--ignore-property", metavar="NAME", action="append", type=str, dest="ignoreProps", default=None, required=False, help="Custom property that is allowed to differ from the golden node. May be repeated")
+    parser.add_argument("--prune", action="store_true", dest="prune", default=False, required=False, help="Also delete pollers, application monitors and overrides the golden node doesn't have. Without it they are counted in the details but kept")
+    parser.add_argument("-n", "--dry-run", action="store_true", dest="dryRun", default=False, required=False, help="Report the sections that drifted without changing anything")
+    parser.add_argument("--batch-size", metavar="N", action="store", type=int, dest="batchSize", default=defaultBatchSize, required=False, help="Number of clones read per query")
+    parser.add_argument("--poller-concurrency", metavar="N", action="store", type=int, dest="pollerConcurrency", default=copyNode.defaultPollerConcurrency, required=False, help="Number of pollers to create in parallel on each clone")
+    parser.add_argument("--setting-concurrency", metavar="N", action="store", type=int, dest="settingConcurrency", default=copyApps.defaultSettingConcurrency, required=False, help="Number of component settings to create in parallel on each clone")
+    parser.add_argument("--cache", metavar="CACHE_FILE", action="store", type=str, dest="cache", default=None, required=False, help="SQLite file caching Orion nodes, polling engines and application templates between runs")
+    parser.add_argument("--cache-ttl", metavar="SECONDS", action="store", type=int, dest="cacheTTL", default=defaultCacheTTL, required=False, help="Age after which the cache is pulled from Orion in full again")
+    parser.add_argument("--refresh", action="store_true", dest="refresh", default=False, required=False, help="Pull the whole cache from Orion again now")
+    parser.add_argument("--ca-bundle", metavar="PEM", action="store", type=str, dest="caBundle", default=None, required=False, help="Verify the SWIS server certificate against this CA bundle. Without it the certificate is not checked")
+    parser.add_argument("--retries", metavar="N", action="store", type=int, dest="retries", default=defaultRetries, required=False, help="Times to repeat a SWIS call that failed with a transient error. Queries, reads and updates are repeated after any transient error, creates only when SWIS never started on them")
+    parser.add_argument("--timeout", metavar="SECONDS", action="store", type=int, dest="timeout", default=defaultSwisTimeout, required=False, help="Longest time to wait for each SWIS response")
+    parser.add_argument("--metrics-file", metavar="PROM_FILE", action="store", type=str, dest="metricsFile", default=None, required=False, help="Write SWIS call counts and latencies to this Prometheus textfile at the end of the run")
+    args = parser.parse_args()
+
+    # Sanity test for the command line
+    try:
+        try:
+            copyNode.validate_ip(args.swisInfo)
+        except:
+            copyNode.validate_fqdn(args.swisInfo)
+
+        copyNode.validate_ip(args.sourceNodeIP)
+
+        if len(args.targets) == 0 and args.manifest is None:
+            raise Exception("Give the clone nodes with -t or a manifest with -m")
+
+        if min(args.batchSize, args.pollerConcurrency, args.settingConcurrency) < 1:
+            raise Exception("Batch size and concurrency must be at least 1")
+    except Exception as e:
+        print(" ".join(["Illegal value on command line. Details:", str(e.args)]))
+        quit()
+
+    fixSections = [section for section in sections if section in (args.sections or sections)]
+
+    username = input("Username: ")
+    password = getpass.getpass("Password: ")
+
+    # Create the SWIS connection, pooled for the poller and setting workers, and run a simple test
+    try:
+        swis = InstrumentedSwisClient(make_swis_client(args.swisInfo, username, password, max(args.pollerConcurrency, args.settingConcurrency), args.caBundle, args.timeout), retryPolicy=RetryPolicy(args.retries))
+        response = run_query(swis, "probe")
+    except Exception as e:
+        print(" ".join(["Unable to connect to SWIS server", args.swisInfo, "Details:", str(e.args)]))
+        quit()
+
+    cache = open_inventory_cache(args.cache, args.swisInfo, swis, args.cacheTTL, args.refresh)
+
+    try:
+        golden = golden_state(swis, args.sourceNodeIP, args.ignoreProps, cache)
+    except Exception as e:
+        print(" ".join(["Unable to read golden node", args.sourceNodeIP, "Details:", str(e.args)]))
+        quit()
+    print(" ".join(["Golden node", args.sourceNodeIP, "fingerprints:"] + ["=".join([section, fingerprint(golden_items(section, golden))]) for section in fixSections]))
+
+    # Each batch is a list of (target, custom properties it keeps), from -t or from the manifest
+    if args.manifest is not None:
+        def manifest_targets():
+            for row in read_manifest(args.manifest, "target"):
+                yield (row["target"], copyNode.manifest_custom_props(row))
+        batches = iter_batches(manifest_targets(), args.batchSize)
+    else:
+        batches = iter_batches([(target, {}) for target in dict.fromkeys(args.targets)], args.batchSize)
+
+    results = []
+    try:
+        for batch in batches:
+            targets = list(dict.fromkeys([item[0] for item in batch]))
+            try:
+                results += reconcile_nodes(swis, args.sourceNodeIP, targets, golden, fixSections, dict(batch), args.prune, args.dryRun, args.pollerConcurrency, args.settingConcurrency, cache)
+            except Exception as e:
+                print(" ".join(["Reconciling", str(len(targets)), "clones failed. Details:", str(e.args)]))
+                results += [{"target": target, "NodeID": None, "status": "failed", "details": [str(e.args)]} for target in targets]
+    except Exception as e:
+        print(" ".join(["Reading manifest", args.manifest, "failed. Details:", str(e.args)]))
+
+    if cache is not None:
+        cache.close()
+    print_reconcile_summary(results, fixSections)
+
+    report_metrics(swis, args.metricsFile, "reconcile-solarwinds-nodes")
@@ -0,0 +1,447 @@
+import argparse
+import getpass
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+from solarwinds_common import load_script, Journal, InstrumentedSwisClient, report_metrics, make_swis_client, defaultSwisTimeout, RetryPolicy, defaultRetries, open_inventory_cache, defaultCacheTTL, run_query
+
+# Keep one authenticated SWIS session pool, the inventory cache and a pool of job workers warm,
+# and take copy-node, copy-apps, create-apps and update-pollers jobs from solarwinds-job.py over
+# HTTP on a Unix socket. Each job then costs only its own SWIS calls: no interpreter start,
+# no password prompt, no TLS handshake and no probe query.
+
+copyNode = load_script("copy-solarwinds-node")
+copyApps = load_script("copy-solarwinds-apps")
+bulkCreateApps = load_script("bulk-create-solarwinds-apps")
+bulkUpdatePoller = load_script("bulk-update-solarwinds-memory-poller")
+onboardNodes = load_script("onboard-solarwinds-nodes")
+
+# Socket the daemon listens on; solarwinds-job.py uses the same default
+defaultSocket = os.path.join(os.path.expanduser("~"), ".solarwinds-daemon.sock")
+
+# Jobs run at once
+defaultJobWorkers = 4
+
+# Seconds a source node read by one job is reused by later jobs before it is read again
+defaultSourceTTL = 300
+
+# Seconds between incremental refreshes of the inventory cache, which also keep the SWIS connections alive
+defaultRefreshInterval = 60
+
+# Finished jobs kept for solarwinds-job.py to fetch; older ones are forgotten
+finishedJobsKept = 1000
+
+# Longest a client may wait for a job in one request
+maxJobWait = 60
+
+jobTypes = ["copy-node", "copy-apps", "create-apps", "update-pollers"]
+
+# Concurrency of a job that doesn't give its own and wasn't given on the daemon's command line
+jobDefaults = {"concurrency": 1, "pollerConcurrency": copyNode.defaultPollerConcurrency, "settingConcurrency": copyApps.defaultSettingConcurrency, "monitorConcurrency": bulkCreateApps.defaultConcurrency}
+
+class JobOutput:
+
+    # Stands in for sys.stdout. What a job's own thread prints goes to that job, everything else,
+    # including the threads the scripts start for pollers and settings, to the daemon's console.
+    def __init__(self, console:object):
+        self.console = console
+        self.local = threading.local()
+
+    def capture(self, buffer:object) -> None:
+        self.local.buffer = buffer
+
+    def write(self, text:str) -> int:
+        buffer = getattr(self.local, "buffer", None)
+        if buffer is None:
+            return self.console.write(text)
+        return buffer.write(text)
+
+    def flush(self) -> None:
+        self.console.flush()
+
+class SolarwindsDaemon:
+
+    # The warm state shared by every job and the jobs themselves.
+    # Jobs naming a target another job is still working on wait for it, so a retried
+    # request can't create the same node or monitor twice at the same time.
+    def __init__(self, swis:object, cache:object=None, journal:object=None, workers:int=defaultJobWorkers, sourceTTL:int=defaultSourceTTL, defaults:dict=None, metricsFile:str=None):
+        self.swis = swis
+        self.cache = cache
+        self.journal = journal
+        self.sourceTTL = sourceTTL
+        self.defaults = dict(jobDefaults, **(defaults or {}))
+        self.metricsFile = metricsFile
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.busy = threading.Condition(self.lock)
+        self.busyKeys = set()
+        self.jobs = {}
+        self.lastJobID = 0
+        self.sources = {}
+        self.started = time.time()
+
+    def submit(self, jobType:str, params:dict) -> dict:
+        if jobType not in jobTypes:
+            raise Exception(" ".join(["Unknown job type", str(jobType), "- use one of", ", ".join(jobTypes)]))
+        keys = self.validate(jobType, params)
+        with self.lock:
+            self.lastJobID += 1
+            job = {"id": self.lastJobID, "type": jobType, "params": params, "status": "queued", "submitted": time.time(), "seconds": 0.0, "result": None, "problems": 0, "error": None, "output": [], "done": threading.Event()}
+            self.jobs[job["id"]] = job
+            finishedJobs = [jobID for jobID in sorted(self.jobs) if self.jobs[jobID]["status"] in ("succeeded", "failed")]
+            for jobID in finishedJobs[:max(0, len(finishedJobs) - finishedJobsKept)]:
+                del self.jobs[jobID]
+        self.executor.submit(self.run_job, job, keys)
+        return self.describe(job)
+
+    def validate(self, jobType:str, params:dict) -> list:
+
+        # Check a job's parameters before queuing it and return the targets or pollers it works on
+        if jobType in ("copy-node", "copy-apps"):
+            if params.get("sourceNodeIP") is None:
+                raise Exception(" ".join(["A", jobType, "job needs the sourceNodeIP"]))
+            copyNode.validate_ip(params["sourceNodeIP"])
+        if jobType == "update-pollers":
+            if not isinstance(params.get("uris"), list) or len(params["uris"]) == 0:
+                raise Exception("An update-pollers job needs a list of poller uris")
+            return list(params["uris"])
+        if not isinstance(params.get("targets"), list) or len(params["targets"]) == 0:
+            raise Exception(" ".join(["A", jobType, "job needs a list of targets"]))
+        for target in params["targets"]:
+            copyNode.validate_fqdn(target)
+        if jobType == "create-apps" and (not isinstance(params.get("hostnames"), list) or len(params["hostnames"]) == 0):
+            raise Exception("A create-apps job needs a list of hostnames")
+        for hostname in params.get("hostnames") or []:
+            copyNode.validate_fqdn(hostname)
+        return [target.lower() for target in params["targets"]]
+
+    def run_job(self, job:dict, keys:list) -> None:
+        with self.busy:
+            self.busy.wait_for(lambda: self.busyKeys.isdisjoint(keys))
+            self.busyKeys.update(keys)
+            job["status"] = "running"
+        buffer = io.StringIO()
+        if isinstance(sys.stdout, JobOutput):
+            sys.stdout.capture(buffer)
+        started = time.monotonic()
+        try:
+            handler = getattr(self, "".join(["job_", job["type"].replace("-", "_")]))
+            job["result"], job["problems"] = handler(job["params"])
+            job["status"] = "succeeded"
+        except Exception as e:
+            job["error"] = str(e.args)
+            job["status"] = "failed"
+            print(" ".join(["Job", str(job["id"]), "failed. Details:", str(e.args)]))
+        finally:
+            if isinstance(sys.stdout, JobOutput):
+                sys.stdout.capture(None)
+            job["seconds"] = time.monotonic() - started
+            job["output"] = buffer.getvalue().splitlines()
+            with self.busy:
+                self.busyKeys.difference_update(keys)
+                self.busy.notify_all()
+            job["done"].set()
+        print(" ".join(["Job", str(job["id"]), job["type"], job["status"], "in", "{:.1f}".format(job["seconds"]), "seconds with", str(job["problems"]), "problems"]))
+        if self.metricsFile is not None:
+            try:
+                self.swis.metrics.write_prometheus(self.metricsFile, "solarwinds-daemon")
+            except Exception as e:
+                print(str(e.args))
+
+    def describe(self, job:dict) -> dict:
+        return dict([(name, value) for name, value in job.items() if name != "done"])
+
+    def wait(self, jobID:int, timeout:float) -> dict:
+        with self.lock:
+            job = self.jobs.get(jobID)
+        if job is None:
+            return None
+        job["done"].wait(max(0, min(timeout, maxJobWait)))
+        return self.describe(job)
+
+    def status(self) -> dict:
+        with self.lock:
+            counts = {}
+            for job in self.jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+        retryPolicy = self.swis.retryPolicy
+        return {
+            "uptime": time.time() - self.started,
+            "jobs": counts,
+            "swis": self.swis.metrics.totals(),
+            "retried": retryPolicy.retried if retryPolicy is not None else 0,
+            "breakerTrips": retryPolicy.trips if retryPolicy is not None else 0,
+            "cache": self.cache.path if self.cache is not None else None,
+            "sources": sorted(set([key[1] for key in self.sources]))
+        }
+
+    def source(self, kind:str, sourceNodeIP:str) -> dict:
+
+        # The source node as the scripts read it, shared by the jobs copying it until it is sourceTTL old
+        key = (kind, sourceNodeIP)
+        with self.lock:
+            cached = self.sources.get(key)
+        if cached is not None and time.monotonic() - cached[0] < self.sourceTTL:
+            return cached[1]
+        if kind == "snapshot":
+            value = copyNode.get_source_snapshot(self.swis, sourceNodeIP, self.cache)
+        else:
+            value = copyApps.get_source_apps(self.swis, sourceNodeIP, self.cache)
+        with self.lock:
+            self.sources[key] = (time.monotonic(), value)
+        return value
+
+    def option(self, params:dict, name:str) -> object:
+        return params.get(name, self.defaults.get(name))
+
+    def job_copy_node(self, params:dict) -> tuple:
+        sourceNodeIP = params["sourceNodeIP"]
+        nodeJournal = onboardNodes.JournalSection(self.journal, "node") if self.journal is not None else None
+        results = copyNode.copy_nodes(
+            swis=self.swis,
+            sourceNodeIP=sourceNodeIP,
+            targets=list(dict.fromkeys(params["targets"])),
+            waitTime=params.get("waitTime", 0),
+            concurrency=self.option(params, "concurrency"),
+            sourceSnapshot=self.source("snapshot", sourceNodeIP),
+            excludeEngines=params.get("excludeEngines"),
+            readyQuery=params.get("readyQuery"),
+            readyTimeout=params.get("readyTimeout", 300),
+            pollerConcurrency=self.option(params, "pollerConcurrency"),
+            targetIPs=params.get("targetIPs"),
+            journal=nodeJournal,
+            cache=self.cache,
+            preflight=params.get("preflight", True),
+            customProps=params.get("customProps")
+        )
+        return results, len([result for result in results if result["status"] in ("failed", "partial")])
+
+    def job_copy_apps(self, params:dict) -> tuple:
+        sourceNodeIP = params["sourceNodeIP"]
+        targets = list(dict.fromkeys(params["targets"]))
+        sourceApps = self.source("apps", sourceNodeIP)
+        appJournal = onboardNodes.JournalSection(self.journal, "apps") if self.journal is not None else None
+
+        # Targets left out of the plan were skipped, with the reason in the job output.
+        # Unless the job says otherwise, a target that can't be found fails the job before anything is changed.
+        results = dict([(target, {"target": target, "NodeID": None, "status": "skipped", "details": ""}) for target in targets])
+        for target, targetNodeID, existingApps in copyApps.plan_apps_batch(self.swis, sourceNodeIP, targets, sourceApps, params.get("strict", True), appJournal, self.cache, params.get("preflight", True)):
+            results[target]["NodeID"] = targetNodeID
+            try:
+                copyApps.copy_apps(swis=self.swis, sourceNodeIP=sourceNodeIP, targetNode=target, settingConcurrency=self.option(params, "settingConcurrency"), sourceApps=sourceApps, targetNodeID=targetNodeID, journal=appJournal, existingApps=existingApps)
+                print(" ".join(["Copy application monitors from",sourceNodeIP,"to",target,"succeeded"]))
+                results[target]["status"] = "succeeded"
+            except Exception as e:
+                print(" ".join(["Copy application monitors", target, "from", sourceNodeIP,"failed. Details:", str(e.args)]))
+                results[target]["status"] = "failed"
+                results[target]["details"] = str(e.args)
+        return list(results.values()), len([result for result in results.values() if result["status"] == "failed"])
+
+    def job_create_apps(self, params:dict) -> tuple:
+        hostnames = list(dict.fromkeys(params["hostnames"]))
+        results = []
+        for target in dict.fromkeys(params["targets"]):
+            try:
+                errors = bulkCreateApps.create_apps_bulk(swis=self.swis, targetNodeName=target, hostnames=hostnames, concurrency=self.option(params, "monitorConcurrency"), journal=self.journal, cache=self.cache, preflight=params.get("preflight", True))
+                results.append({"target": target, "status": "failed" if len(errors) > 0 else "succeeded", "errors": errors})
+            except Exception as e:
+                print(" ".join(["Create application monitor on", target, "failed. Details:", str(e.args)]))
+                results.append({"target": target, "status": "failed", "errors": {"": str(e.args)}})
+        return results, sum([len(result["errors"]) for result in results])
+
+    def job_update_pollers(self, params:dict) -> tuple:
+        pollerType = params.get("pollerType") or bulkUpdatePoller.defaultPollerType
+        uris = [uri for uri in dict.fromkeys(params["uris"]) if self.journal is None or not self.journal.done(uri, "updated")]
+        pending = bulkUpdatePoller.pollers_needing_update(self.swis, uris, pollerType)
+        if self.journal is not None:
+            for uri in uris:
+                if uri not in pending:
+                    self.journal.record(uri, "updated", PollerType=pollerType)
+        errors = bulkUpdatePoller.update_pollers(swis=self.swis, pollerUris=pending, pollerType=pollerType, journal=self.journal)
+        return {"listed": len(params["uris"]), "updated": len(pending) - len(errors), "errors": errors}, len(errors)
+
+    def refresh(self, interval:int, stop:object) -> None:
+
+        # Bring the inventory cache up to date every interval seconds. Without a cache the probe
+        # query does the same job of keeping the pooled connections from going idle.
+        while not stop.wait(interval):
+            try:
+                if self.cache is not None:
+                    self.cache.refresh(self.swis)
+                else:
+                    run_query(self.swis, "probe")
+            except Exception as e:
+                print(" ".join(["Refreshing the SWIS session failed. Details:", str(e.args)]))
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+        if self.journal is not None:
+            self.journal.close()
+        if self.cache is not None:
+            self.cache.close()
+
+class DaemonRequestHandler(BaseHTTPRequestHandler):
+
+    # POST /jobs with {"type": ..., "params": {...}} queues a job and answers with it.
+    # GET /jobs/<id>?wait=SECONDS answers once the job is finished or the wait is over.
+    # GET /status answers with the daemon's counters.
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status:int, body:object) -> None:
+        data = json.dumps(body, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        parts = [part for part in url.path.split("/") if part != ""]
+        daemon = self.server.daemon
+        if parts == ["status"]:
+            self.send_json(200, daemon.status())
+        elif len(parts) == 2 and parts[0] == "jobs" and parts[1].isdigit():
+            query = urllib.parse.parse_qs(url.query)
+            try:
+                timeout = float(query.get("wait", ["0"])[0])
+            except ValueError:
+                timeout = 0
+            job = daemon.wait(int(parts[1]), timeout)
+            if job is None:
+                self.send_json(404, {"error": " ".join(["No job", parts[1]])})
+            else:
+                self.send_json(200, job)
+        else:
+            self.send_json(404, {"error": " ".join(["No such resource", url.path])})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/jobs":
+            self.send_json(404, {"error": " ".join(["No such resource", self.path])})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            job = self.server.daemon.submit(body.get("type"), body.get("params") or {})
+        except Exception as e:
+            self.send_json(400, {"error": str(e.args)})
+            return
+        self.send_json(202, job)
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    # HTTP on a Unix socket only the daemon's user can connect to, since jobs run with the daemon's credentials
+    daemon_threads = True
+
+    def __init__(self, path:str, daemon:SolarwindsDaemon):
+        self.daemon = daemon
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+                raise Exception(" ".join(["Another daemon is already listening on", path]))
+            except OSError:
+                # Left behind by a daemon that didn't shut down cleanly
+                os.unlink(path)
+            finally:
+                probe.close()
+        umask = os.umask(0o077)
+        try:
+            super().__init__(path, DaemonRequestHandler)
+        finally:
+            os.umask(umask)
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Keep a SWIS session, the inventory cache and job workers warm, and run copy-node, copy-apps, create-apps and update-pollers jobs sent by solarwinds-job.py")
+    parser.add_argument("-S", "--server", metavar="SW_SERVER", action="store", type=str, dest="swisInfo", default="localhost", help="IP or FQDN of Solarwinds server")
+    parser.add_argument("--socket", metavar="PATH", action="store", type=str, dest="socket", default=defaultSocket, required=False, help="".join(["Unix socket to listen on. Default: ", defaultSocket]))
+    parser.add_argument("-w", "--workers", metavar="N", action="store", type=int, dest="workers", default=defaultJobWorkers, required=False, help="Number of jobs run in parallel")
+    parser.add_argument("-j", "--journal", metavar="JOURNAL", action="store", type=str, dest="journal", default=None, required=False, help="Journal file recording each completed step of every job, in the same form as onboard-solarwinds-nodes.py. Jobs repeated after a failure resume where the last one stopped")
+    parser.add_argument("-c", "--concurrency", metavar="N", action="store", type=int, dest="concurrency", default=1, required=False, help="Number of nodes a copy-node job creates in parallel, unless the job says otherwise")
+    parser.add_argument("--poller-concurrency", metavar="N", action="store", type=int, dest="pollerConcurrency", default=copyNode.defaultPollerConcurrency, required=False, help="Number of pollers to create in parallel on each new node, unless the job says otherwise")
+    parser.add_argument("--setting-concurrency", metavar="N", action="store", type=int, dest="settingConcurrency", default=copyApps.defaultSettingConcurrency, required=False, help="Number of component settings to create in parallel on each node, unless the job says otherwise")
+    parser.add_argument("--monitor-concurrency", metavar="N", action="store", type=int, dest="monitorConcurrency", default=bulkCreateApps.defaultConcurrency, required=False, help="Number of HTTP monitors to create in parallel on each node, unless the job says otherwise")
+    parser.add_argument("--source-ttl", metavar="SECONDS", action="store", type=int, dest="sourceTTL", default=defaultSourceTTL, required=False, help="Age after which a source node is read from SWIS again instead of reusing what an earlier job read")
+    parser.add_argument("--cache", metavar="CACHE_FILE", action="store", type=str, dest="cache", default=":memory:", required=False, help="SQLite file caching Orion nodes, polling engines and application templates. Default: kept in memory for the life of the daemon")
+    parser.add_argument("--cache-ttl", metavar="SECONDS", action="store", type=int, dest="cacheTTL", default=defaultCacheTTL, required=False, help="Age after which the cache is pulled from Orion in full again")
+    parser.add_argument("--refresh-interval", metavar="SECONDS", action="store", type=int, dest="refreshInterval", default=defaultRefreshInterval, required=False, help="Seconds between pulls of the nodes and templates added to Orion since the last one")
+    parser.add_argument("--ca-bundle", metavar="PEM", action="store", type=str, dest="caBundle", default=None, required=False, help="Verify the SWIS server certificate against this CA bundle. Without it the certificate is not checked")
+    parser.add_argument("--retries", metavar="N", action="store", type=int, dest="retries", default=defaultRetries, required=False, help="Times to repeat a SWIS call that failed with a transient error. Queries, reads and updates are repeated after any transient error, creates only when SWIS never started on them")
+    parser.add_argument("--timeout", metavar="SECONDS", action="store", type=int, dest="timeout", default=defaultSwisTimeout, required=False, help="Longest time to wait for each SWIS response")
+    parser.add_argument("--metrics-file", metavar="PROM_FILE", action="store", type=str, dest="metricsFile", default=None, required=False, help="Write SWIS call counts and latencies to this Prometheus textfile after every job")
+    args = parser.parse_args()
+
+    # Sanity test for the command line
+    try:
+        try:
+            copyNode.validate_ip(args.swisInfo)
+        except:
+            copyNode.validate_fqdn(args.swisInfo)
+
+        if min(args.workers, args.concurrency, args.pollerConcurrency, args.settingConcurrency, args.monitorConcurrency, args.refreshInterval) < 1:
+            raise Exception("Workers, concurrency and refresh interval must be at least 1")
+    except Exception as e:
+        print(" ".join(["Illegal value on command line. Details:", str(e.args)]))
+        quit()
+
+    try:
+        journal = Journal(args.journal) if args.journal else None
+    except Exception as e:
+        print(" ".join(["Unable to open journal. Details:", str(e.args)]))
+        quit()
+
+    # A daemon started by a service manager has no terminal to prompt on
+    username = os.environ.get("SOLARWINDS_USERNAME") or input("Username: ")
+    password = os.environ.get("SOLARWINDS_PASSWORD") or getpass.getpass("Password: ")
+
+    # Create the SWIS connection, pooled for the busiest stage of every job worker, and run a simple test
+    workers = args.workers * max(args.concurrency * args.pollerConcurrency, args.settingConcurrency, args.monitorConcurrency)
+    try:
+        swis = InstrumentedSwisClient(make_swis_client(args.swisInfo, username, password, workers, args.caBundle, args.timeout), retryPolicy=RetryPolicy(args.retries))
+        response = run_query(swis, "probe")
+    except Exception as e:
+        print(" ".join(["Unable to connect to SWIS server", args.swisInfo, "Details:", str(e.args)]))
+        quit()
+
+    cache = open_inventory_cache(args.cache, args.swisInfo, swis, args.cacheTTL)
+
+    defaults = {"concurrency": args.concurrency, "pollerConcurrency": args.pollerConcurrency, "settingConcurrency": args.settingConcurrency, "monitorConcurrency": args.monitorConcurrency}
+    daemon = SolarwindsDaemon(swis, cache, journal, args.workers, args.sourceTTL, defaults, args.metricsFile)
+    sys.stdout = JobOutput(sys.stdout)
+
+    try:
+        server = DaemonServer(args.socket, daemon)
+    except Exception as e:
+        print(" ".join(["Unable to listen on", args.socket, "Details:", str(e.args)]))
+        daemon.close()
+        quit()
+
+    stop = threading.Event()
+    threading.Thread(target=daemon.refresh, args=(args.refreshInterval, stop), daemon=True).start()
+
+    # A service manager stops the daemon with SIGTERM; jobs already running are finished first
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+
+    print(" ".join(["Listening on", args.socket, "with", str(args.workers), "job workers"]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+    stop.set()
+    server.server_close()
+    os.unlink(args.socket)
+    daemon.close()
+    sys.stdout = sys.stdout.console
+
+    report_metrics(swis, args.metricsFile, "solarwinds-daemon")
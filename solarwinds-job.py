@@ -0,0 +1,150 @@
+import argparse
+import http.client
+import json
+import os
+import socket
+import sys
+
+# Thin client for solarwinds-daemon.py: sends one job over the daemon's Unix socket and prints
+# what the job printed and its outcome. Only the standard library is imported, so a call costs
+# little more than the job itself.
+
+# Same default as solarwinds-daemon.py
+defaultSocket = os.path.join(os.path.expanduser("~"), ".solarwinds-daemon.sock")
+
+# Seconds each request waits for the job before asking again
+pollWait = 30
+
+actions = ["copy-node", "copy-apps", "create-apps", "update-pollers", "job", "status"]
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+
+    # HTTP to the daemon over its Unix socket
+    def __init__(self, socketPath:str, timeout:float=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socketPath = socketPath
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socketPath)
+
+def daemon_request(socketPath:str, method:str, path:str, body:object=None) -> dict:
+    connection = UnixHTTPConnection(socketPath, timeout=pollWait + 30)
+    try:
+        connection.request(method, path, body=json.dumps(body) if body is not None else None, headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        answer = json.loads(response.read() or b"{}")
+    except Exception as e:
+        raise Exception(" ".join(["Unable to reach the daemon on", socketPath, ". Details:", str(e.args)]))
+    finally:
+        connection.close()
+    if response.status >= 400:
+        raise Exception(answer.get("error", " ".join(["HTTP status", str(response.status)])))
+    return answer
+
+def wait_for_job(socketPath:str, jobID:int) -> dict:
+    while True:
+        job = daemon_request(socketPath, "GET", "".join(["/jobs/", str(jobID), "?wait=", str(pollWait)]))
+        if job["status"] in ("succeeded", "failed"):
+            return job
+
+def name_values(pairs:list) -> dict:
+    values = {}
+    for pair in pairs or []:
+        if "=" not in pair:
+            raise Exception(" ".join([pair, "is not in the form NAME=VALUE"]))
+        name, value = pair.split("=", 1)
+        values[name] = value
+    return values
+
+def print_job(job:dict) -> None:
+    for line in job["output"]:
+        print(line)
+    if isinstance(job["result"], list):
+        for result in job["result"]:
+            print("  ".join([str(result["target"]), str(result["status"]), str(result.get("details") or result.get("errors") or "")]))
+    elif isinstance(job["result"], dict):
+        for uri in job["result"]["errors"]:
+            print(" ".join(["Update poller with Uri", uri, "failed. Details:", job["result"]["errors"][uri]]))
+    if job["status"] == "failed":
+        print(" ".join(["Job", str(job["id"]), job["type"], "failed. Details:", str(job["error"])]))
+    else:
+        print(" ".join(["Job", str(job["id"]), job["type"], "finished in", "{:.1f}".format(job["seconds"]), "seconds with", str(job["problems"]), "problems"]))
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Send a job to solarwinds-daemon.py and wait for it, or ask the daemon about a job or itself")
+    parser.add_argument("action", metavar="ACTION", choices=actions, help="".join(["One of ", ", ".join(actions)]))
+    parser.add_argument("-s", "--sourceNodeIP", metavar="SOURCE_NODE_IP", action="store", type=str, dest="sourceNodeIP", default=None, required=False, help="Source node IP in Solarwinds, for copy-node and copy-apps")
+    parser.add_argument("-t", "--targetNodeName", metavar="TARGET_NODE", action="append", type=str, dest="targets", default=[], required=False, help="FQDN of a target node. May be repeated")
+    parser.add_argument("-i", "--target-ip", metavar="TARGET_NODE=IP", action="append", type=str, dest="targetIPs", default=None, required=False, help="IP address to give a new node instead of looking its name up, for copy-node. May be repeated")
+    parser.add_argument("--custom-property", metavar="NAME=VALUE", action="append", type=str, dest="customProperties", default=None, required=False, help="Custom property value replacing the source node's on every new node, for copy-node. May be repeated")
+    parser.add_argument("-H", "--hostname", metavar="HOSTNAME", action="append", type=str, dest="hostnames", default=[], required=False, help="Hostname to give an HTTP monitor on every target, for create-apps. May be repeated")
+    parser.add_argument("-u", "--uri", metavar="POLLER_URI", action="append", type=str, dest="uris", default=[], required=False, help="URI of a poller to change, for update-pollers. May be repeated")
+    parser.add_argument("-p", "--poller-type", metavar="POLLER_TYPE", action="store", type=str, dest="pollerType", default=None, required=False, help="Memory poller type to set, for update-pollers")
+    parser.add_argument("--allow-duplicates", action="store_false", dest="preflight", default=True, required=False, help="Create every node, application and HTTP monitor even if Solarwinds already has it")
+    parser.add_argument("--params", metavar="JSON", action="store", type=str, dest="params", default=None, required=False, help="JSON object of further job parameters, e.g. {\"concurrency\": 4, \"readyQuery\": \"...\"}")
+    parser.add_argument("--id", metavar="JOB_ID", action="store", type=int, dest="jobID", default=None, required=False, help="Job to show, for job")
+    parser.add_argument("--no-wait", action="store_false", dest="wait", default=True, required=False, help="Print the job ID and return at once instead of waiting for the job")
+    parser.add_argument("--json", action="store_true", dest="json", default=False, required=False, help="Print the daemon's answer as JSON")
+    parser.add_argument("--socket", metavar="PATH", action="store", type=str, dest="socket", default=defaultSocket, required=False, help="".join(["Unix socket of the daemon. Default: ", defaultSocket]))
+    args = parser.parse_args()
+
+    # Sanity test for the command line; the daemon checks the job itself
+    try:
+        params = json.loads(args.params) if args.params is not None else {}
+        if not isinstance(params, dict):
+            raise Exception("--params must be a JSON object")
+        if args.action == "job" and args.jobID is None:
+            raise Exception("Give the job to show with --id")
+        if args.sourceNodeIP is not None:
+            params["sourceNodeIP"] = args.sourceNodeIP
+        if len(args.targets) > 0:
+            params["targets"] = args.targets
+        if args.targetIPs is not None:
+            params["targetIPs"] = name_values(args.targetIPs)
+        if args.customProperties is not None:
+            customProps = name_values(args.customProperties)
+            params["customProps"] = dict([(target, customProps) for target in params.get("targets", [])])
+        if len(args.hostnames) > 0:
+            params["hostnames"] = args.hostnames
+        if len(args.uris) > 0:
+            params["uris"] = args.uris
+        if args.pollerType is not None:
+            params["pollerType"] = args.pollerType
+        if not args.preflight:
+            params["preflight"] = False
+    except Exception as e:
+        print(" ".join(["Illegal value on command line. Details:", str(e.args)]))
+        sys.exit(2)
+
+    job = None
+    try:
+        if args.action == "status":
+            print(json.dumps(daemon_request(args.socket, "GET", "/status"), indent=2))
+            sys.exit(0)
+        if args.action == "job":
+            job = daemon_request(args.socket, "GET", "".join(["/jobs/", str(args.jobID)]))
+        else:
+            job = daemon_request(args.socket, "POST", "/jobs", {"type": args.action, "params": params})
+        if args.wait and job["status"] not in ("succeeded", "failed"):
+            job = wait_for_job(args.socket, job["id"])
+    except KeyboardInterrupt:
+        if job is not None:
+            print(" ".join(["Stopped waiting; the job keeps running in the daemon. See it with: solarwinds-job.py job --id", str(job["id"])]))
+        sys.exit(1)
+    except Exception as e:
+        print(str(e.args[0]) if len(e.args) > 0 else str(e))
+        sys.exit(1)
+
+    if args.json:
+        print(json.dumps(job, indent=2))
+    elif job["status"] in ("succeeded", "failed"):
+        print_job(job)
+    else:
+        print(" ".join(["Job", str(job["id"]), job["type"], job["status"]]))
+
+    # Exit non-zero when the job failed or any of its targets or pollers did
+    if job["status"] == "failed" or job["problems"] > 0:
+        sys.exit(1)
@@ -0,0 +1,914 @@
+import asyncio
+import csv
+import datetime
+import importlib.util
+import json
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import requests
+
+# Manifest rows handed to the scripts at a time
+defaultBatchSize = 100
+
+# Seconds to wait for a connection to SWIS and for each response
+defaultConnectTimeout = 10
+defaultSwisTimeout = 30
+
+def make_swis_client(server:str, username:str, password:str, workers:int=1, caBundle:str=None, timeout:int=defaultSwisTimeout, port:int=17774) -> object:
+
+    # A SwisClient on its own requests.Session whose connection pool holds a connection per
+    # worker, so parallel calls reuse kept-alive TLS connections instead of each opening one.
+    # Workers beyond the pool wait for a free connection rather than opening throwaway ones.
+    # Nothing is retried here: RetryPolicy repeats failed connection attempts along with the other
+    # retryable failures, so its circuit breaker sees every one of them.
+    # Without a CA bundle the server certificate is not checked, as the scripts always did.
+    import urllib3
+    from requests.adapters import HTTPAdapter
+    from orionsdk import SwisClient
+
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, workers), max_retries=0, pool_block=True)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+
+    if caBundle is None:
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    return SwisClient(server, username, password, port=port, verify=caBundle if caBundle is not None else False, session=session, timeout=(defaultConnectTimeout, timeout))
+
+def load_script(name:str) -> object:
+
+    # Import one of the scripts next to this module, e.g. "copy-solarwinds-node", so its
+    # functions can be reused. The script's __main__ block does not run.
+    moduleName = name.replace("-", "_")
+    if moduleName in sys.modules:
+        return sys.modules[moduleName]
+
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), name + ".py")
+    spec = importlib.util.spec_from_file_location(moduleName, path)
+    if spec is None:
+        raise Exception(" ".join(["Unable to find script", path]))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[moduleName] = module
+    try:
+        spec.loader.exec_module(module)
+    except Exception:
+        del sys.modules[moduleName]
+        raise
+    return module
+
+def read_manifest(path:str, column:str):
+
+    # Yield one dict per row of a CSV (with a header row) or JSON Lines manifest, reading lazily.
+    # "-" reads standard input. A row must have `column`; other columns are passed through.
+    # Blank lines and lines starting with # are ignored.
+    if path == "-":
+        f = sys.stdin
+    else:
+        try:
+            f = open(path, newline="")
+        except Exception as e:
+            raise Exception(" ".join(["Unable to open manifest", path, ". Details:", str(e.args)]))
+
+    try:
+        lines = (line for line in f if line.strip() != "" and not line.lstrip().startswith("#"))
+        first = next(lines, None)
+        if first is None:
+            return
+
+        def all_lines():
+            yield first
+            yield from lines
+
+        if first.lstrip().startswith("{"):
+            rows = (json.loads(line) for line in all_lines())
+        else:
+            rows = csv.DictReader(all_lines())
+
+        for number, row in enumerate(rows, start=1):
+            if not isinstance(row, dict) or row.get(column) in (None, ""):
+                raise Exception(" ".join(["Manifest", path, "row", str(number), "has no", column]))
+            row[column] = str(row[column]).strip()
+            yield row
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def iter_batches(items, size:int=defaultBatchSize):
+
+    # Group any iterable into lists of at most `size` items without reading ahead further
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
+class Journal:
+
+    # Append-only record of the steps completed for each item, one JSON object per line.
+    # Reopening the same file gives back everything recorded so far, so an interrupted run
+    # can skip the steps that already happened.
+    def __init__(self, path:str):
+        self.path = path
+        self.steps = {}
+        self.lock = threading.Lock()
+
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            # A line cut short by a crash
+                            continue
+                        self.steps.setdefault(entry["key"], {})[entry["step"]] = entry.get("details", {})
+            except Exception as e:
+                raise Exception(" ".join(["Unable to read journal", path, ". Details:", str(e.args)]))
+
+        try:
+            self.file = open(path, "a")
+        except Exception as e:
+            raise Exception(" ".join(["Unable to open journal", path, ". Details:", str(e.args)]))
+
+    def done(self, key:str, step:str) -> bool:
+        with self.lock:
+            return step in self.steps.get(key, {})
+
+    def get(self, key:str, step:str) -> dict:
+        with self.lock:
+            return self.steps.get(key, {}).get(step)
+
+    def record(self, key:str, step:str, **details) -> None:
+        with self.lock:
+            self.steps.setdefault(key, {})[step] = details
+            self.file.write(json.dumps({"key": key, "step": step, "details": details}, default=str) + "\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self) -> None:
+        with self.lock:
+            self.file.close()
+
+# Orion.Nodes rows read per query when filling the inventory cache
+cachePageSize = 5000
+
+# Every fixed SWQL query the scripts make, by name. Values are always passed as @parameters, so
+# the query text is the same for every node and Orion's SQL server can reuse its plan, and
+# names with quotes in them need no escaping. A list parameter used as "in (@name)" is
+# expanded by run_swql.
+swqlQueries = {
+    "probe": "SELECT Top 1 NodeID from Orion.Nodes",
+    "node_uri_by_ip": "SELECT Uri FROM Orion.Nodes WHERE IPAddress = @ip",
+    "node_id_by_ip": "SELECT NodeID from Orion.Nodes where IPAddress = @ip",
+    "nodes_by_caption": "SELECT NodeID, Caption, IPAddress, EngineID, Uri from Orion.Nodes where Caption = @caption",
+    "nodes_by_name": "SELECT NodeID, Caption, IPAddress, EngineID, Uri from Orion.Nodes where Caption in (@names) or IPAddress in (@names)",
+    "nodes_after": "".join(["SELECT TOP ", str(cachePageSize), " NodeID, Caption, IPAddress, EngineID, Uri FROM Orion.Nodes where NodeID > @lastNodeID order by NodeID"]),
+    "nodes_by_name_or_ip": "SELECT NodeID, Caption, DNS, IPAddress, EngineID, Uri from Orion.Nodes where Caption in (@names) or DNS in (@names) or IPAddress in (@ips)",
+    "node_pollers": "SELECT PollerType, Enabled from Orion.Pollers where NetObjectID = @nodeId",
+    "pollers_of_nodes": "SELECT NetObjectID, PollerType from Orion.Pollers where NetObjectType = 'N' and NetObjectID in (@nodeIds)",
+    "poller_details_of_nodes": "SELECT NetObjectID, PollerType, Enabled, Uri from Orion.Pollers where NetObjectType = 'N' and NetObjectID in (@nodeIds)",
+    "applications_of_nodes": "SELECT NodeID, ApplicationID, ApplicationTemplateID, Uri from Orion.APM.Application where NodeID in (@nodeIds)",
+    "applications_by_template": "SELECT ApplicationID, Name from Orion.APM.Application where NodeID = @nodeId and ApplicationTemplateID = @templateId",
+    "node_application_count": "SELECT COUNT(ApplicationID) AS Applications from Orion.APM.Application where NodeID = @nodeId",
+    "node_applications": "SELECT Uri, ApplicationID, ApplicationTemplateID from Orion.APM.Application where NodeID = @nodeId",
+    "least_loaded_engine": "SELECT top 1 EngineID FROM Orion.Engines where ServerType='Additional' and DisplayName not like 'NUQ%' and DisplayName not like 'swpoller04%' order by Elements ASC",
+    "engines": "SELECT EngineID, DisplayName, ServerType, Elements FROM Orion.Engines",
+    "templates_after": "SELECT ApplicationTemplateID, Name FROM Orion.APM.ApplicationTemplate where ApplicationTemplateID > @lastTemplateID",
+    "template_by_name": "SELECT ApplicationTemplateID FROM Orion.APM.ApplicationTemplate where Name = @name",
+    "application_component": """SELECT A.Uri, C.ComponentID
+            FROM Orion.APM.Application A
+            INNER JOIN Orion.APM.Component C on A.ApplicationID = C.ApplicationID
+            where A.ApplicationID = @applicationId""",
+    "component_settings": """SELECT C.ApplicationID, C.TemplateID
+            , CS.Key, CS.Value, CS.ValueType, CS.Required
+            FROM Orion.APM.Component C
+            INNER JOIN Orion.APM.ComponentSetting CS on C.ComponentID=CS.ComponentID
+            where C.ApplicationID in (@applicationIds)""",
+    "component_setting_details": """SELECT C.ApplicationID, C.TemplateID, C.ComponentID
+            , CS.Key, CS.Value, CS.ValueType, CS.Required, CS.Uri
+            FROM Orion.APM.Component C
+            INNER JOIN Orion.APM.ComponentSetting CS on C.ComponentID=CS.ComponentID
+            where C.ApplicationID in (@applicationIds)""",
+    "component_map": """SELECT ApplicationID, TemplateID, ComponentID
+            FROM Orion.APM.Component
+            where ApplicationID in (@applicationIds)""",
+    "poller_types": "SELECT PollerID, PollerType from Orion.Pollers where PollerID in (@pollerIds)"
+}
+
+def expand_list_params(query:str, params:dict) -> tuple:
+
+    # SWIS has no array parameters, so a list value becomes @name0, @name1, ... in the query text.
+    # Lists are padded to a power of two by repeating their last value, which doesn't change what
+    # "in (...)" matches but keeps the number of distinct query texts small.
+    expanded = {}
+    for name, value in params.items():
+        if not isinstance(value, (list, tuple, set)):
+            expanded[name] = value
+            continue
+        values = list(value) or [None]
+        size = 1
+        while size < len(values):
+            size *= 2
+        values += [values[-1]] * (size - len(values))
+        names = ["".join([name, str(index)]) for index in range(size)]
+        query = re.sub("".join(["@", name, r"\b"]), ", ".join(["".join(["@", listName]) for listName in names]), query)
+        expanded.update(zip(names, values))
+    return query, expanded
+
+def run_swql(swis:object, queryText:str, **params) -> list:
+    # Run a parameterized SWQL query and return its rows
+    queryText, params = expand_list_params(queryText, params)
+    return swis.query(queryText, **params)["results"]
+
+def run_query(swis:object, queryName:str, **params) -> list:
+    # Run one of the named queries in swqlQueries and return its rows
+    return run_swql(swis, swqlQueries[queryName], **params)
+
+# Seconds a full pull into the inventory cache is trusted before everything is pulled again
+defaultCacheTTL = 3600
+
+class InventoryCache:
+
+    # Local SQLite copy of the Orion nodes, polling engines and application templates, indexed
+    # for the lookups the scripts make by IP address, Caption, NodeID and template name.
+    # The first run pulls everything; later runs within the TTL only fetch the nodes and templates
+    # added since, and once the TTL has passed (or with full=True) everything is pulled again.
+    # Nodes deleted or renamed in Orion stay in the cache until that next full pull.
+    def __init__(self, path:str, server:str, ttl:int=defaultCacheTTL):
+        self.path = path
+        self.server = server
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        try:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.executescript("""
+                CREATE TABLE IF NOT EXISTS meta (Name TEXT PRIMARY KEY, Value TEXT);
+                CREATE TABLE IF NOT EXISTS nodes (NodeID INTEGER PRIMARY KEY, Caption TEXT, IPAddress TEXT, EngineID INTEGER, Uri TEXT);
+                CREATE INDEX IF NOT EXISTS nodes_caption ON nodes (Caption COLLATE NOCASE);
+                CREATE INDEX IF NOT EXISTS nodes_ip ON nodes (IPAddress);
+                CREATE TABLE IF NOT EXISTS engines (EngineID INTEGER PRIMARY KEY, DisplayName TEXT, ServerType TEXT, Elements INTEGER);
+                CREATE TABLE IF NOT EXISTS templates (ApplicationTemplateID INTEGER PRIMARY KEY, Name TEXT);
+                CREATE INDEX IF NOT EXISTS templates_name ON templates (Name COLLATE NOCASE);
+            """)
+        except Exception as e:
+            raise Exception(" ".join(["Unable to open inventory cache", path, ". Details:", str(e.args)]))
+
+    def get_meta(self, name:str) -> str:
+        row = self.db.execute("SELECT Value FROM meta WHERE Name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, name:str, value:object) -> None:
+        self.db.execute("INSERT OR REPLACE INTO meta (Name, Value) VALUES (?, ?)", (name, str(value)))
+
+    def refresh(self, swis:object, full:bool=False) -> None:
+
+        # Bring the cache up to date with one bulk pull, or only the rows added since the last one
+        with self.lock:
+            pulled = self.get_meta("pulled")
+            if self.get_meta("server") != self.server or pulled is None or time.time() - float(pulled) > self.ttl:
+                full = True
+
+            started = time.time()
+            try:
+                if full:
+                    engines = run_query(swis, "engines")
+                    templates = run_query(swis, "templates_after", lastTemplateID=0)
+                    nodes = self.pull_nodes(swis, 0)
+                    with self.db:
+                        self.db.execute("DELETE FROM nodes")
+                        self.db.execute("DELETE FROM engines")
+                        self.db.execute("DELETE FROM templates")
+                        self.db.executemany("INSERT INTO engines VALUES (:EngineID, :DisplayName, :ServerType, :Elements)", engines)
+                        self.db.executemany("INSERT INTO templates VALUES (:ApplicationTemplateID, :Name)", templates)
+                        self.db.executemany("INSERT INTO nodes VALUES (:NodeID, :Caption, :IPAddress, :EngineID, :Uri)", nodes)
+                        self.set_meta("server", self.server)
+                        self.set_meta("pulled", started)
+                    print(" ".join(["Inventory cache", self.path, "loaded", str(len(nodes)), "nodes,", str(len(engines)), "engines and", str(len(templates)), "application templates"]))
+                else:
+                    lastNodeID = self.db.execute("SELECT COALESCE(MAX(NodeID), 0) FROM nodes").fetchone()[0]
+                    lastTemplateID = self.db.execute("SELECT COALESCE(MAX(ApplicationTemplateID), 0) FROM templates").fetchone()[0]
+                    nodes = self.pull_nodes(swis, lastNodeID)
+                    templates = run_query(swis, "templates_after", lastTemplateID=lastTemplateID)
+                    with self.db:
+                        self.db.executemany("INSERT OR REPLACE INTO templates VALUES (:ApplicationTemplateID, :Name)", templates)
+                        self.db.executemany("INSERT OR REPLACE INTO nodes VALUES (:NodeID, :Caption, :IPAddress, :EngineID, :Uri)", nodes)
+                    print(" ".join(["Inventory cache", self.path, "added", str(len(nodes)), "new nodes and", str(len(templates)), "new application templates"]))
+            except Exception as e:
+                raise Exception(" ".join(["Unable to refresh inventory cache", self.path, ". Details:", str(e.args)]))
+
+    def pull_nodes(self, swis:object, lastNodeID:int) -> list:
+        # Every node after lastNodeID, a page at a time in NodeID order
+        nodes = []
+        while True:
+            page = run_query(swis, "nodes_after", lastNodeID=lastNodeID)
+            nodes += page
+            if len(page) < cachePageSize:
+                return nodes
+            lastNodeID = page[-1]["NodeID"]
+
+    def find_nodes(self, caption:str=None, ipAddress:str=None) -> list:
+        # Cached nodes whose Caption (without regard to case) or IP address matches
+        with self.lock:
+            rows = self.db.execute("SELECT NodeID, Caption, IPAddress, EngineID, Uri FROM nodes WHERE Caption = ? COLLATE NOCASE OR IPAddress = ?", (caption, ipAddress)).fetchall()
+        return [dict(zip(("NodeID", "Caption", "IPAddress", "EngineID", "Uri"), row)) for row in rows]
+
+    def add_nodes(self, nodes:list) -> None:
+        # Remember nodes a script created or looked up in SWIS. Missing columns are stored as NULL.
+        rows = [dict([(column, node.get(column)) for column in ("NodeID", "Caption", "IPAddress", "EngineID", "Uri")]) for node in nodes]
+        with self.lock, self.db:
+            self.db.executemany("INSERT OR REPLACE INTO nodes VALUES (:NodeID, :Caption, :IPAddress, :EngineID, :Uri)", rows)
+
+    def get_engines(self, excludePatterns:list) -> list:
+        # Additional polling engines whose names match none of the SWQL LIKE patterns
+        query = "SELECT EngineID, DisplayName, Elements FROM engines WHERE ServerType = 'Additional'"
+        for pattern in excludePatterns:
+            query = " ".join([query, "AND DisplayName NOT LIKE ?"])
+        with self.lock:
+            rows = self.db.execute(query, list(excludePatterns)).fetchall()
+        return [dict(zip(("EngineID", "DisplayName", "Elements"), row)) for row in rows]
+
+    def add_engine_load(self, engineID:int, elements:int) -> None:
+        # Orion re-counts Elements on its own schedule; count the ones this run added meanwhile
+        with self.lock, self.db:
+            self.db.execute("UPDATE engines SET Elements = COALESCE(Elements, 0) + ? WHERE EngineID = ?", (elements, engineID))
+
+    def get_template_id(self, name:str) -> int:
+        with self.lock:
+            rows = self.db.execute("SELECT ApplicationTemplateID FROM templates WHERE Name = ? COLLATE NOCASE ORDER BY ApplicationTemplateID", (name,)).fetchall()
+        return rows[0][0] if len(rows) > 0 else None
+
+    def close(self) -> None:
+        with self.lock:
+            self.db.close()
+
+def open_inventory_cache(path:str, server:str, swis:object, ttl:int=defaultCacheTTL, refresh:bool=False) -> InventoryCache:
+    # The cache only saves time, so if it can't be used the scripts carry on with SWIS lookups
+    if path is None:
+        return None
+    try:
+        cache = InventoryCache(path, server, ttl)
+        cache.refresh(swis, full=refresh)
+        return cache
+    except Exception as e:
+        print(" ".join(["Not using the inventory cache. Details:", str(e.args)]))
+        return None
+
+# Upper bounds, in seconds, of the SWIS call latency histogram buckets
+latencyBuckets = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def swis_entity(verb:str, target:object) -> str:
+
+    # Work out which entity type a SWIS call is about, for grouping metrics.
+    # Queries use the first entity after FROM, reads and updates the entity in the URI.
+    if verb == "query":
+        match = re.search(r"\bfrom\s+([A-Za-z0-9_.]+)", str(target), re.IGNORECASE)
+        return match.group(1) if match else "unknown"
+    if verb in ("read", "update", "delete", "bulkupdate", "bulkdelete"):
+        if isinstance(target, (list, tuple)):
+            target = target[0] if len(target) > 0 else ""
+        match = re.search(r"^swis://[^/]+/[^/]+/([^/]+)(/.*)?$", str(target))
+        if match == None:
+            return "unknown"
+        # Custom properties hang off their entity's URI but are an entity of their own
+        if match.group(2) is not None and match.group(2).endswith("/CustomProperties"):
+            return match.group(1) + "CustomProperties"
+        return match.group(1)
+    return str(target)
+
+class SwisMetrics:
+
+    # Counts, errors and a latency histogram per SWIS verb and entity type
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def observe(self, verb:str, entity:str, seconds:float, failed:bool) -> None:
+        with self.lock:
+            series = self.series.get((verb, entity))
+            if series is None:
+                series = {"count": 0, "errors": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * len(latencyBuckets)}
+                self.series[(verb, entity)] = series
+            series["count"] += 1
+            series["sum"] += seconds
+            series["max"] = max(series["max"], seconds)
+            if failed:
+                series["errors"] += 1
+            for index, bound in enumerate(latencyBuckets):
+                if seconds <= bound:
+                    series["buckets"][index] += 1
+
+    def totals(self) -> dict:
+        with self.lock:
+            return {
+                "count": sum([series["count"] for series in self.series.values()]),
+                "errors": sum([series["errors"] for series in self.series.values()]),
+                "sum": sum([series["sum"] for series in self.series.values()])
+            }
+
+    def print_summary(self) -> None:
+        with self.lock:
+            keys = sorted(self.series)
+            if len(keys) == 0:
+                return
+            width = max([len("Entity")] + [len(key[1]) for key in keys])
+            print("")
+            print("  ".join(["Verb".ljust(10), "Entity".ljust(width), "Calls".rjust(7), "Errors".rjust(7), "Mean ms".rjust(9), "~p90 ms".rjust(9), "Max ms".rjust(9)]))
+            for key in keys:
+                series = self.series[key]
+                print("  ".join([
+                    key[0].ljust(10),
+                    key[1].ljust(width),
+                    str(series["count"]).rjust(7),
+                    str(series["errors"]).rjust(7),
+                    "{:.0f}".format(1000 * series["sum"] / series["count"]).rjust(9),
+                    histogram_quantile(series, 0.9).rjust(9),
+                    "{:.0f}".format(1000 * series["max"]).rjust(9)
+                ]))
+
+        totals = self.totals()
+        print(" ".join([str(totals["count"]), "SWIS calls,", str(totals["errors"]), "errors,", "{:.1f}".format(totals["sum"]), "seconds waiting on SWIS"]))
+
+    def write_prometheus(self, path:str, job:str) -> None:
+
+        # Write the metrics in the Prometheus text format for the node_exporter textfile collector.
+        # The file is replaced in one rename so the collector never reads half of it,
+        # and every write has its own temporary file so concurrent writers can't mix theirs.
+        # Every family's samples must follow its own HELP and TYPE lines.
+        with self.lock:
+            keys = sorted(self.series)
+            labels = dict([(key, "".join(['job="', job, '",verb="', key[0], '",entity="', key[1], '"'])) for key in keys])
+
+            lines = [
+                "# HELP swis_requests_total SWIS calls made, by verb and entity type.",
+                "# TYPE swis_requests_total counter"
+            ]
+            for key in keys:
+                lines.append("".join(["swis_requests_total{", labels[key], "} ", str(self.series[key]["count"])]))
+
+            lines += [
+                "# HELP swis_request_errors_total SWIS calls that raised an error, by verb and entity type.",
+                "# TYPE swis_request_errors_total counter"
+            ]
+            for key in keys:
+                lines.append("".join(["swis_request_errors_total{", labels[key], "} ", str(self.series[key]["errors"])]))
+
+            lines += [
+                "# HELP swis_request_duration_seconds SWIS call latency, by verb and entity type.",
+                "# TYPE swis_request_duration_seconds histogram"
+            ]
+            for key in keys:
+                series = self.series[key]
+                for bound, count in zip(latencyBuckets, series["buckets"]):
+                    lines.append("".join(["swis_request_duration_seconds_bucket{", labels[key], ',le="', str(bound), '"} ', str(count)]))
+                lines.append("".join(["swis_request_duration_seconds_bucket{", labels[key], ',le="+Inf"} ', str(series["count"])]))
+                lines.append("".join(["swis_request_duration_seconds_sum{", labels[key], "} ", repr(series["sum"])]))
+                lines.append("".join(["swis_request_duration_seconds_count{", labels[key], "} ", str(series["count"])]))
+
+        temporary = None
+        try:
+            descriptor, temporary = tempfile.mkstemp(suffix=".tmp", prefix=".".join(["", os.path.basename(path), ""]), dir=os.path.dirname(os.path.abspath(path)))
+            with os.fdopen(descriptor, "w") as f:
+                f.write("\n".join(lines) + "\n")
+            # mkstemp makes the file private, but the collector may run as another user
+            os.chmod(temporary, 0o644)
+            os.replace(temporary, path)
+        except Exception as e:
+            if temporary is not None and os.path.exists(temporary):
+                os.remove(temporary)
+            raise Exception(" ".join(["Unable to write metrics to", path, ". Details:", str(e.args)]))
+
+def histogram_quantile(series:dict, quantile:float) -> str:
+    # Upper bound of the bucket holding the given quantile, in milliseconds
+    rank = quantile * series["count"]
+    for bound, count in zip(latencyBuckets, series["buckets"]):
+        if count >= rank:
+            return "{:.0f}".format(1000 * bound)
+    return "".join([">", "{:.0f}".format(1000 * latencyBuckets[-1])])
+
+# Times a SWIS call that failed with a transient error is repeated, and the backoff limits in seconds
+defaultRetries = 4
+retryBaseDelay = 0.5
+retryMaxDelay = 30.0
+
+# Consecutive transient failures, counted across all workers, that pause every SWIS call, and for how many seconds
+breakerThreshold = 5
+breakerCooldown = 30.0
+
+# SWIS verbs that leave Orion in the same state however many times they run
+idempotentVerbs = ("query", "read", "update", "bulkupdate", "delete", "bulkdelete")
+
+# Words in SWIS error messages from failures that go away on their own, like SQL deadlocks and timeouts
+transientMessages = re.compile(r"deadlock|timeout|timed out|transport-level|try again|temporarily|unavailable", re.IGNORECASE)
+
+def classify_swis_error(e:Exception) -> str:
+
+    # "unsent": the request never reached SWIS, so any call can be repeated.
+    # "busy": SWIS turned the request away before doing anything (429, 503), so any call can be repeated.
+    # "transient": the call failed part way or SWIS hit a passing problem; only idempotent calls are repeated.
+    # "permanent": repeating the call would fail the same way.
+    if isinstance(e, requests.exceptions.ConnectTimeout):
+        return "unsent"
+    if isinstance(e, requests.exceptions.ConnectionError) and "NewConnectionError" in str(e):
+        return "unsent"
+    if isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return "transient"
+    if isinstance(e, requests.exceptions.HTTPError) and e.response is not None:
+        status = e.response.status_code
+        if status in (429, 503):
+            return "busy"
+        if status in (502, 504):
+            return "transient"
+        if status >= 500 and transientMessages.search(str(e.response.reason) + str(e)):
+            return "transient"
+    return "permanent"
+
+class RetryPolicy:
+
+    # Decides which failed SWIS calls to repeat and how long to back off first, with full jitter.
+    # It is also a circuit breaker shared by every worker: after enough transient failures in a row
+    # Orion is clearly struggling, so every call waits out a cooldown before going to SWIS again.
+    # One more failure straight after the cooldown trips it again.
+    def __init__(self, retries:int=defaultRetries, baseDelay:float=retryBaseDelay, maxDelay:float=retryMaxDelay, threshold:int=breakerThreshold, cooldown:float=breakerCooldown):
+        self.retries = retries
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.openUntil = 0.0
+        self.retried = 0
+        self.trips = 0
+
+    def wait_if_open(self) -> None:
+        while True:
+            with self.lock:
+                remaining = self.openUntil - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    def record(self, kind:str) -> None:
+        # Note the outcome of a call: None for success, otherwise what classify_swis_error said
+        with self.lock:
+            if kind is None or kind == "permanent":
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.failures >= self.threshold and time.monotonic() >= self.openUntil:
+                self.openUntil = time.monotonic() + self.cooldown
+                self.failures = self.threshold - 1
+                self.trips += 1
+                print(" ".join(["SWIS failed", str(self.threshold), "times in a row, pausing all SWIS calls for", str(self.cooldown), "seconds"]))
+
+    def should_retry(self, verb:str, kind:str, attempt:int) -> bool:
+        if attempt >= self.retries or kind == "permanent":
+            return False
+        return kind in ("unsent", "busy") or verb in idempotentVerbs
+
+    def backoff(self, attempt:int) -> float:
+        with self.lock:
+            self.retried += 1
+        return random.uniform(0, min(self.maxDelay, self.baseDelay * 2 ** attempt))
+
+# Mean SWIS latency, in seconds, and share of calls failing with transient errors above which
+# the adaptive limit on calls in flight is cut
+defaultLatencyTarget = 1.0
+defaultErrorTarget = 0.05
+
+# Least number of seconds between two reports of a new adaptive limit
+limiterReportInterval = 10
+
+class AdaptiveLimiter:
+
+    # AIMD limit on the number of SWIS calls in flight across all workers. Calls are judged a window
+    # at a time, a window being as many calls as the limit. If a window's mean latency and transient
+    # error rate were within the targets and the limit was actually reached, the limit goes up by one;
+    # if either target was missed it is halved. Calls started under an earlier limit don't count
+    # towards the next window, so one slow spell only halves the limit once.
+    # The limit is printed when it changes, at most every limiterReportInterval seconds.
+    def __init__(self, maximum:int, minimum:int=1, initial:int=None, latencyTarget:float=defaultLatencyTarget, errorTarget:float=defaultErrorTarget):
+        self.maximum = max(1, maximum)
+        self.minimum = max(1, min(minimum, self.maximum))
+        self.limit = initial if initial is not None else min(self.maximum, max(self.minimum, 2))
+        self.latencyTarget = latencyTarget
+        self.errorTarget = errorTarget
+        self.condition = threading.Condition()
+        self.inFlight = 0
+        self.peak = self.limit
+        self.generation = 0
+        self.reported = 0.0
+        self.reset_window()
+
+    def reset_window(self) -> None:
+        self.windowCalls = 0
+        self.windowErrors = 0
+        self.windowSeconds = 0.0
+        self.windowSaturated = False
+
+    def acquire(self) -> int:
+        # Wait for room under the limit. Hand the result back to release.
+        with self.condition:
+            while self.inFlight >= self.limit:
+                self.condition.wait()
+            self.inFlight += 1
+            if self.inFlight >= self.limit:
+                self.windowSaturated = True
+            return self.generation
+
+    def release(self, generation:int, seconds:float, failed:bool) -> None:
+        with self.condition:
+            self.inFlight -= 1
+            self.condition.notify_all()
+            if generation != self.generation:
+                return
+            self.windowCalls += 1
+            self.windowSeconds += seconds
+            if failed:
+                self.windowErrors += 1
+
+            if self.windowCalls >= self.limit:
+                meanLatency = self.windowSeconds / self.windowCalls
+                errorRate = self.windowErrors / self.windowCalls
+                limit = self.limit
+                if meanLatency > self.latencyTarget or errorRate > self.errorTarget:
+                    limit = max(self.minimum, self.limit // 2)
+                elif self.windowSaturated:
+                    limit = min(self.maximum, self.limit + 1)
+                if limit != self.limit:
+                    if time.monotonic() - self.reported >= limiterReportInterval:
+                        print(" ".join(["SWIS calls in flight", str(self.limit), "->", str(limit), "(mean", "{:.0f}".format(1000 * meanLatency), "ms,", "{:.0%}".format(errorRate), "errors)"]))
+                        self.reported = time.monotonic()
+                    self.limit = limit
+                    self.peak = max(self.peak, limit)
+                    self.generation += 1
+                self.reset_window()
+
+class InstrumentedSwisClient:
+
+    # Drop-in wrapper for SwisClient that times every call into a SwisMetrics. Given a RetryPolicy
+    # it repeats calls that failed with a transient error, and given an AdaptiveLimiter it holds
+    # calls back while the limiter's number of calls are in flight.
+    def __init__(self, swis:object, metrics:SwisMetrics=None, retryPolicy:RetryPolicy=None, limiter:AdaptiveLimiter=None):
+        self.swis = swis
+        self.metrics = metrics if metrics is not None else SwisMetrics()
+        self.retryPolicy = retryPolicy
+        self.limiter = limiter
+
+    def _call(self, verb:str, target:object, method, *args, **kwargs):
+        entity = swis_entity(verb, target)
+        attempt = 0
+        while True:
+            if self.retryPolicy is not None:
+                self.retryPolicy.wait_if_open()
+            if self.limiter is not None:
+                generation = self.limiter.acquire()
+            started = time.monotonic()
+            try:
+                result = method(*args, **kwargs)
+            except Exception as e:
+                seconds = time.monotonic() - started
+                kind = classify_swis_error(e)
+                if self.limiter is not None:
+                    self.limiter.release(generation, seconds, kind != "permanent")
+                self.metrics.observe(verb, entity, seconds, True)
+                if self.retryPolicy is None:
+                    raise
+                self.retryPolicy.record(kind)
+                if not self.retryPolicy.should_retry(verb, kind, attempt):
+                    raise
+                time.sleep(self.retryPolicy.backoff(attempt))
+                attempt += 1
+                continue
+            seconds = time.monotonic() - started
+            if self.limiter is not None:
+                self.limiter.release(generation, seconds, False)
+            self.metrics.observe(verb, entity, seconds, False)
+            if self.retryPolicy is not None:
+                self.retryPolicy.record(None)
+            return result
+
+    def query(self, query, **params):
+        return self._call("query", query, self.swis.query, query, **params)
+
+    def invoke(self, entity, verb, *args):
+        return self._call("invoke", entity, self.swis.invoke, entity, verb, *args)
+
+    def create(self, entity, **properties):
+        return self._call("create", entity, self.swis.create, entity, **properties)
+
+    def read(self, uri):
+        return self._call("read", uri, self.swis.read, uri)
+
+    def update(self, uri, **properties):
+        return self._call("update", uri, self.swis.update, uri, **properties)
+
+    def bulkupdate(self, uris, **properties):
+        return self._call("bulkupdate", uris, self.swis.bulkupdate, uris, **properties)
+
+    def delete(self, uri):
+        return self._call("delete", uri, self.swis.delete, uri)
+
+    def bulkdelete(self, uris):
+        return self._call("bulkdelete", uris, self.swis.bulkdelete, uris)
+
+# SWIS calls an AsyncSwisClient has in flight at once. Operations waiting for a turn are
+# coroutines, so thousands of them cost little; this only bounds what Orion sees.
+defaultAsyncLimit = 100
+
+# Path of the SWIS JSON API on the server
+swisApiPath = "/SolarWinds/InformationService/v3/Json/"
+
+class AsyncSwisError(Exception):
+
+    # SWIS answered an asyncio call with an HTTP error. status is the HTTP status and
+    # message what SWIS said went wrong, like the reason orionsdk puts on its HTTPError.
+    def __init__(self, status:int, message:str, method:str, fragment:str):
+        super().__init__(" ".join([str(status), "Error:", str(message), "for", method, fragment]))
+        self.status = status
+        self.message = message
+
+def classify_async_error(e:Exception) -> str:
+
+    # classify_swis_error for the failures of AsyncSwisClient
+    import aiohttp
+    if isinstance(e, aiohttp.ClientConnectorError):
+        return "unsent"
+    if isinstance(e, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError)):
+        return "transient"
+    if isinstance(e, AsyncSwisError):
+        if e.status in (429, 503):
+            return "busy"
+        if e.status in (502, 504):
+            return "transient"
+        if e.status >= 500 and transientMessages.search(str(e.message)):
+            return "transient"
+    return "permanent"
+
+def swis_json(value:object) -> object:
+    # Dates the way orionsdk sends them
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(" ".join(["Type", type(value).__name__, "is not JSON serializable"]))
+
+class AsyncSwisClient:
+
+    # SwisClient for asyncio, on aiohttp: the same JSON endpoints, basic authentication and
+    # certificate handling as make_swis_client, with every method a coroutine. One client on one event
+    # loop serves any number of concurrent operations, with at most `limit` calls in flight and as
+    # many kept-alive connections. Calls are timed into a SwisMetrics, so one can be shared with an
+    # InstrumentedSwisClient, and a RetryPolicy repeats them the same way.
+    # Use it as "async with client:", which opens the session on the running loop and closes it again.
+    def __init__(self, server:str, username:str, password:str, caBundle:str=None, timeout:int=defaultSwisTimeout, limit:int=defaultAsyncLimit, port:int=17774, metrics:SwisMetrics=None, retryPolicy:RetryPolicy=None):
+        try:
+            import aiohttp
+        except ImportError:
+            raise Exception("The asyncio SWIS client needs the aiohttp package. Install it with: pip install aiohttp")
+        self.url = "".join(["https://", server, ":", str(port), swisApiPath])
+        self.username = username
+        self.password = password
+        self.caBundle = caBundle
+        self.timeout = timeout
+        self.limit = max(1, limit)
+        self.metrics = metrics if metrics is not None else SwisMetrics()
+        self.retryPolicy = retryPolicy
+        self.session = None
+        self.slots = None
+
+    async def open(self) -> None:
+        import aiohttp
+        import ssl
+        if self.caBundle is not None:
+            sslContext = ssl.create_default_context(cafile=self.caBundle)
+        else:
+            sslContext = False
+        self.slots = asyncio.Semaphore(self.limit)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.limit, ssl=sslContext),
+            auth=aiohttp.BasicAuth(self.username, self.password),
+            timeout=aiohttp.ClientTimeout(connect=defaultConnectTimeout, sock_read=self.timeout),
+            headers={"Content-Type": "application/json", "Accept-Encoding": "gzip, deflate"}
+        )
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def _req(self, method:str, fragment:str, data:object=None) -> object:
+        body = json.dumps(data, default=swis_json) if data is not None else None
+        async with self.session.request(method, self.url + fragment, data=body) as response:
+            text = await response.text()
+            if response.status >= 400:
+                try:
+                    message = json.loads(text)["Message"]
+                except Exception:
+                    message = response.reason
+                raise AsyncSwisError(response.status, message, method, fragment)
+            return json.loads(text) if text.strip() != "" else None
+
+    async def wait_if_open(self) -> None:
+        # RetryPolicy.wait_if_open without blocking the event loop
+        while True:
+            with self.retryPolicy.lock:
+                remaining = self.retryPolicy.openUntil - time.monotonic()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(remaining)
+
+    async def _call(self, verb:str, target:object, method:str, fragment:str, data:object=None) -> object:
+        entity = swis_entity(verb, target)
+        attempt = 0
+        while True:
+            if self.retryPolicy is not None:
+                await self.wait_if_open()
+            async with self.slots:
+                started = time.monotonic()
+                try:
+                    result = await self._req(method, fragment, data)
+                    failure = None
+                except Exception as e:
+                    failure = e
+                seconds = time.monotonic() - started
+            self.metrics.observe(verb, entity, seconds, failure is not None)
+            if failure is None:
+                if self.retryPolicy is not None:
+                    self.retryPolicy.record(None)
+                return result
+            if self.retryPolicy is None:
+                raise failure
+            kind = classify_async_error(failure)
+            self.retryPolicy.record(kind)
+            if not self.retryPolicy.should_retry(verb, kind, attempt):
+                raise failure
+            await asyncio.sleep(self.retryPolicy.backoff(attempt))
+            attempt += 1
+
+    async def query(self, query, **params):
+        return await self._call("query", query, "POST", "Query", {"query": query, "parameters": params})
+
+    async def invoke(self, entity, verb, *args):
+        return await self._call("invoke", entity, "POST", "/".join(["Invoke", entity, verb]), list(args))
+
+    async def create(self, entity, **properties):
+        return await self._call("create", entity, "POST", "".join(["Create/", entity]), properties)
+
+    async def read(self, uri):
+        return await self._call("read", uri, "GET", uri)
+
+    async def update(self, uri, **properties):
+        await self._call("update", uri, "POST", uri, properties)
+
+    async def bulkupdate(self, uris, **properties):
+        await self._call("bulkupdate", uris, "POST", "BulkUpdate", {"uris": uris, "properties": properties})
+
+    async def delete(self, uri):
+        await self._call("delete", uri, "DELETE", uri)
+
+    async def bulkdelete(self, uris):
+        await self._call("bulkdelete", uris, "POST", "BulkDelete", {"uris": uris})
+
+async def run_query_async(swis:AsyncSwisClient, queryName:str, **params) -> list:
+    # run_query for an AsyncSwisClient
+    queryText, params = expand_list_params(swqlQueries[queryName], params)
+    return (await swis.query(queryText, **params))["results"]
+
+def run_async(asyncSwis:AsyncSwisClient, function, *args, **kwargs) -> object:
+    # Run the coroutine function(asyncSwis, ...) on a new event loop, with the client's session open for it
+    async def main():
+        async with asyncSwis:
+            return await function(asyncSwis, *args, **kwargs)
+    return asyncio.run(main())
+
+def report_metrics(swis:object, metricsFile:str, job:str) -> None:
+    # Print the SWIS call summary at the end of a run and write the textfile if one was asked for
+    if not isinstance(swis, InstrumentedSwisClient):
+        return
+    swis.metrics.print_summary()
+    if swis.retryPolicy is not None and (swis.retryPolicy.retried > 0 or swis.retryPolicy.trips > 0):
+        print(" ".join([str(swis.retryPolicy.retried), "SWIS calls retried, circuit breaker tripped", str(swis.retryPolicy.trips), "times"]))
+    if swis.limiter is not None:
+        print(" ".join(["SWIS calls in flight ended at", str(swis.limiter.limit), "of at most", str(swis.limiter.maximum), "with a peak of", str(swis.limiter.peak)]))
+    if metricsFile is not None:
+        try:
+            swis.metrics.write_prometheus(metricsFile, job)
+        except Exception as e:
+            print(str(e.args))
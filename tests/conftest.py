@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+# The scripts live at the top of the repository and have hyphens in their names,
+# so tests import solarwinds_common from there and load the scripts with load_script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from solarwinds_common import load_script, InstrumentedSwisClient, RetryPolicy
+
+mockServer = load_script("mock-swis-server")
+
+@pytest.fixture
+def inventory():
+    # A small estate; node 1 (10.0.0.1) is the golden node, see build_inventory
+    return mockServer.build_inventory(nodes=10)
+
+@pytest.fixture
+def server(inventory):
+    server = mockServer.start_mock_server(inventory)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def swis(server):
+    # No retries, so any failure shows up in the test instead of being repeated
+    return InstrumentedSwisClient(mockServer.mock_swis_client(server, workers=4), retryPolicy=RetryPolicy(0))
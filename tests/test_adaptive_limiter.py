@@ -0,0 +1,98 @@
+import threading
+
+from solarwinds_common import AdaptiveLimiter, InstrumentedSwisClient
+
+def run_window(limiter:AdaptiveLimiter, seconds:float, failed:bool=False) -> None:
+    # Fill the limit, so the window counts as saturated, then finish every call
+    generations = [limiter.acquire() for call in range(limiter.limit)]
+    for generation in generations:
+        limiter.release(generation, seconds, failed)
+
+def test_limit_grows_by_one_per_good_window():
+    limiter = AdaptiveLimiter(8, latencyTarget=1.0)
+    assert limiter.limit == 2
+    run_window(limiter, 0.1)
+    assert limiter.limit == 3
+    run_window(limiter, 0.1)
+    assert limiter.limit == 4
+
+def test_limit_stops_at_maximum():
+    limiter = AdaptiveLimiter(3, latencyTarget=1.0)
+    for window in range(5):
+        run_window(limiter, 0.1)
+    assert limiter.limit == 3
+    assert limiter.peak == 3
+
+def test_limit_only_grows_when_reached():
+    limiter = AdaptiveLimiter(8, initial=4, latencyTarget=1.0)
+    for call in range(4):
+        limiter.release(limiter.acquire(), 0.1, False)
+    assert limiter.limit == 4
+
+def test_slow_or_failing_window_halves_limit():
+    limiter = AdaptiveLimiter(16, initial=8, latencyTarget=1.0)
+    run_window(limiter, 2.0)
+    assert limiter.limit == 4
+    limiter = AdaptiveLimiter(16, initial=8, latencyTarget=1.0, errorTarget=0.05)
+    run_window(limiter, 0.1, failed=True)
+    assert limiter.limit == 4
+
+def test_limit_never_drops_below_minimum():
+    limiter = AdaptiveLimiter(16, minimum=2, initial=2, latencyTarget=1.0)
+    for window in range(3):
+        run_window(limiter, 5.0)
+    assert limiter.limit == 2
+
+def test_calls_from_an_earlier_limit_are_ignored():
+    # One slow spell halves the limit once, not again for the calls started before the cut
+    limiter = AdaptiveLimiter(16, initial=2, latencyTarget=1.0)
+    first = limiter.acquire()
+    second = limiter.acquire()
+    limiter.release(first, 2.0, False)
+    third = limiter.acquire()
+    limiter.release(second, 2.0, False)
+    assert limiter.limit == 1
+    limiter.release(third, 2.0, False)
+    assert limiter.limit == 1
+    assert limiter.windowCalls == 0
+    assert limiter.inFlight == 0
+
+def test_calls_wait_for_room_under_limit():
+    limiter = AdaptiveLimiter(4, initial=1, latencyTarget=1.0)
+    generation = limiter.acquire()
+    entered = threading.Event()
+
+    def second() -> None:
+        limiter.release(limiter.acquire(), 0.0, False)
+        entered.set()
+
+    thread = threading.Thread(target=second)
+    thread.start()
+    assert not entered.wait(0.2)
+    limiter.release(generation, 0.0, False)
+    assert entered.wait(2)
+    thread.join()
+
+def test_client_never_exceeds_limit():
+    limiter = AdaptiveLimiter(4, initial=2, latencyTarget=10.0)
+    lock = threading.Lock()
+    inFlight = [0, 0]
+
+    class SlowSwis:
+        def query(self, query, **params):
+            with lock:
+                inFlight[0] += 1
+                inFlight[1] = max(inFlight[1], inFlight[0])
+            threading.Event().wait(0.01)
+            with lock:
+                inFlight[0] -= 1
+            return {"results": []}
+
+    swis = InstrumentedSwisClient(SlowSwis(), limiter=limiter)
+    threads = [threading.Thread(target=lambda: [swis.query("SELECT 1") for call in range(10)]) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert inFlight[1] <= limiter.maximum
+    assert limiter.inFlight == 0
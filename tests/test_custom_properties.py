@@ -0,0 +1,46 @@
+from solarwinds_common import load_script
+
+copyNode = load_script("copy-solarwinds-node")
+
+def node_uri(inventory, nodeID:int) -> str:
+    return [node["Uri"] for node in inventory.rows("Orion.Nodes") if node["NodeID"] == nodeID][0]
+
+def calls(swis, verb:str) -> int:
+    return sum([series["count"] for key, series in swis.metrics.series.items() if key[0] == verb])
+
+def test_nodes_with_the_same_values_share_one_bulk_update(inventory, swis, capsys):
+    nodes = [("node%d.example.com" % nodeID, node_uri(inventory, nodeID)) for nodeID in range(2, 8)]
+    errors = copyNode.update_custom_properties(swis, nodes, {"Department": "Golden", "City": "Chicago"})
+    assert errors == {}
+    assert calls(swis, "bulkupdate") == 1
+    assert calls(swis, "update") == 0
+    assert all([inventory.custom_properties(nodeID)["Department"] == "Golden" for nodeID in range(2, 8)])
+
+def test_overrides_split_nodes_into_groups(inventory, swis, capsys):
+    nodes = [("node%d.example.com" % nodeID, node_uri(inventory, nodeID)) for nodeID in range(2, 8)]
+    overrides = {"node2.example.com": {"City": "Evanston"}, "node3.example.com": {"City": "Evanston"}, "node4.example.com": {"City": "Skokie"}}
+    errors = copyNode.update_custom_properties(swis, nodes, {"Department": "Golden", "City": "Chicago"}, overrides)
+    assert errors == {}
+    # Chicago, Evanston and Skokie
+    assert calls(swis, "bulkupdate") == 3
+    assert [inventory.custom_properties(nodeID)["City"] for nodeID in range(2, 8)] == ["Evanston", "Evanston", "Skokie", "Chicago", "Chicago", "Chicago"]
+    assert all([inventory.custom_properties(nodeID)["Department"] == "Golden" for nodeID in range(2, 8)])
+
+def test_groups_are_sent_in_chunks(inventory, swis, capsys):
+    nodes = [("node%d.example.com" % nodeID, node_uri(inventory, nodeID)) for nodeID in range(2, 9)]
+    copyNode.update_custom_properties(swis, nodes, {"Department": "Golden"}, chunkSize=3)
+    assert calls(swis, "bulkupdate") == 3
+
+def test_nothing_to_set_makes_no_calls(inventory, swis, capsys):
+    nodes = [("node2.example.com", node_uri(inventory, 2))]
+    assert copyNode.update_custom_properties(swis, nodes, {}) == {}
+    assert calls(swis, "bulkupdate") + calls(swis, "update") == 0
+
+def test_failed_chunk_falls_back_to_one_node_at_a_time(inventory, swis, capsys):
+    nodes = [("node%d.example.com" % nodeID, node_uri(inventory, nodeID)) for nodeID in range(2, 5)]
+    nodes.insert(1, ("gone.example.com", "swis://mock-swis/Orion/Orion.Nodes/NodeID=9999"))
+    errors = copyNode.update_custom_properties(swis, nodes, {"Department": "Golden"})
+    assert list(errors) == ["gone.example.com"]
+    assert calls(swis, "update") == len(nodes)
+    assert all([inventory.custom_properties(nodeID)["Department"] == "Golden" for nodeID in range(2, 5)])
+    assert "one at a time" in capsys.readouterr().out
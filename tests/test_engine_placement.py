@@ -0,0 +1,35 @@
+from solarwinds_common import load_script
+
+copyNode = load_script("copy-solarwinds-node")
+
+def engines(*elements):
+    return [{"EngineID": engineID, "DisplayName": "swpoller%02d" % engineID, "Elements": count} for engineID, count in enumerate(elements, 1)]
+
+def test_batch_is_spread_over_engines():
+    placement = copyNode.plan_engine_placement(engines(0, 0, 0), ["a", "b", "c", "d", "e", "f"])
+    assert [placement.count(engineID) for engineID in (1, 2, 3)] == [2, 2, 2]
+
+def test_lightest_engine_is_filled_first():
+    # Engine 2 takes every target until it catches up with engine 3, then they take turns,
+    # the lower EngineID first on a tie
+    placement = copyNode.plan_engine_placement(engines(100, 10, 40), ["t%d" % number for number in range(6)], nodeLoad=10)
+    assert placement == [2, 2, 2, 2, 3, 2]
+
+def test_unknown_element_count_counts_as_empty():
+    assert copyNode.plan_engine_placement(engines(None, 5), ["a"]) == [1]
+
+def test_placement_follows_target_order():
+    assert len(copyNode.plan_engine_placement(engines(0, 0), [])) == 0
+    assert copyNode.plan_engine_placement(engines(0, 0), ["a", "b", "c"]) == [1, 2, 1]
+
+def test_copy_nodes_places_batch_on_engines(inventory, swis, capsys):
+    targets = ["placed%d.example.com" % number for number in range(8)]
+    targetIPs = dict([(target, "192.168.0.%d" % (1 + number)) for number, target in enumerate(targets)])
+    before = dict([(engine["EngineID"], engine["Elements"]) for engine in inventory.rows("Orion.Engines")])
+    results = copyNode.copy_nodes(swis, "10.0.0.1", targets, targetIPs=targetIPs, concurrency=4)
+    assert [result["status"] for result in results] == ["succeeded"] * len(targets)
+    engineIDs = [node["EngineID"] for node in inventory.rows("Orion.Nodes") if node["Caption"] in targets]
+    # The primary is excluded and no additional engine gets the whole batch
+    assert 1 not in engineIDs
+    assert max([engineIDs.count(engineID) for engineID in set(engineIDs)]) < len(targets)
+    assert set(engineIDs) <= set(before)
@@ -0,0 +1,53 @@
+from solarwinds_common import load_script
+
+copyApps = load_script("copy-solarwinds-apps")
+copyNode = load_script("copy-solarwinds-node")
+
+def apps(*templateIDs):
+    return [{"ApplicationID": 100 + number, "ApplicationTemplateID": templateID} for number, templateID in enumerate(templateIDs)]
+
+def templates_of(inventory, nodeID:int) -> list:
+    return sorted([app["ApplicationTemplateID"] for app in inventory.rows("Orion.APM.Application") if app["NodeID"] == nodeID])
+
+def test_apps_are_paired_one_for_one():
+    assert copyApps.match_existing_apps(apps(1, 2), {1: [7], 2: [8]}) == {100: 7, 101: 8}
+
+def test_second_app_from_a_template_is_not_matched_twice():
+    # The target has one app from template 1, the source two: only the first is paired
+    assert copyApps.match_existing_apps(apps(1, 1), {1: [7]}) == {100: 7}
+    assert copyApps.match_existing_apps(apps(1, 1), {1: [9, 7]}) == {100: 7, 101: 9}
+
+def test_claimed_apps_are_not_paired_again():
+    assert copyApps.match_existing_apps(apps(1, 1), {1: [7, 9]}, claimed={7}) == {100: 9}
+
+def test_templates_the_target_lacks_are_unmatched():
+    assert copyApps.match_existing_apps(apps(1, 3), {2: [7]}) == {}
+    assert copyApps.match_existing_apps(apps(1), {}) == {}
+
+def test_copy_creates_only_the_apps_a_target_lacks(inventory, swis, capsys):
+    # The golden node has apps from templates 2, 3 and 4; node 2 already has 3, 4 and 5
+    assert templates_of(inventory, 1) == [2, 3, 4]
+    assert templates_of(inventory, 2) == [3, 4, 5]
+    sourceApps = copyApps.get_source_apps(swis, "10.0.0.1")
+    copyApps.copy_apps_batch(swis, "10.0.0.1", ["node2.example.com"], sourceApps)
+    assert templates_of(inventory, 2) == [2, 3, 4, 5]
+
+    # A second run finds nothing left to do
+    copyApps.copy_apps_batch(swis, "10.0.0.1", ["node2.example.com"], sourceApps)
+    assert templates_of(inventory, 2) == [2, 3, 4, 5]
+    assert "already on the node" in capsys.readouterr().out
+
+def test_second_app_from_a_template_is_still_created(inventory, swis, capsys):
+    # Give the golden node a second app from template 3; node 2 has only one
+    inventory.create_application(1, 3, -4, False)
+    sourceApps = copyApps.get_source_apps(swis, "10.0.0.1")
+    copyApps.copy_apps_batch(swis, "10.0.0.1", ["node2.example.com"], sourceApps)
+    assert templates_of(inventory, 2) == [2, 3, 3, 4, 5]
+
+def test_existing_nodes_match_by_name_and_address_only_conflicts(swis):
+    targetIPs = {"node2.example.com": "10.1.0.2", "renamed.example.com": "10.1.0.3", "new.example.com": "192.168.9.9"}
+    found, conflicts = copyNode.find_existing_nodes(swis, list(targetIPs), targetIPs)
+    assert found["node2.example.com"]["NodeID"] == 2
+    assert list(conflicts) == ["renamed.example.com"]
+    assert "node3.example.com" in conflicts["renamed.example.com"]
+    assert "new.example.com" not in found
@@ -0,0 +1,80 @@
+from solarwinds_common import load_script, Journal, iter_batches
+
+copyNode = load_script("copy-solarwinds-node")
+copyApps = load_script("copy-solarwinds-apps")
+
+targetIPs = {"resume1.example.com": "192.168.5.1", "resume2.example.com": "192.168.5.2"}
+
+def creates(swis, entity:str) -> int:
+    return sum([series["count"] for key, series in swis.metrics.series.items() if key == ("create", entity)])
+
+def test_reopened_journal_has_every_step(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = Journal(path)
+    journal.record("a.example.com", "created", Uri="swis://x/Orion/Orion.Nodes/NodeID=9")
+    journal.record("a.example.com", "finished", NodeID=9)
+    journal.close()
+
+    journal = Journal(path)
+    assert journal.done("a.example.com", "finished")
+    assert journal.get("a.example.com", "created") == {"Uri": "swis://x/Orion/Orion.Nodes/NodeID=9"}
+    assert not journal.done("b.example.com", "created")
+    journal.close()
+
+def test_line_cut_short_by_a_crash_is_ignored(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    path.write_text('{"key": "a", "step": "created", "details": {}}\n{"key": "b", "st')
+    journal = Journal(str(path))
+    assert journal.done("a", "created")
+    assert not journal.done("b", "created")
+    journal.close()
+
+def test_batches_keep_order_and_stream():
+    assert list(iter_batches(iter(range(7)), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(iter_batches(iter([]), 3)) == []
+
+def test_rerun_skips_finished_nodes(tmp_path, inventory, swis, capsys):
+    path = str(tmp_path / "journal.jsonl")
+    journal = Journal(path)
+    results = copyNode.copy_nodes(swis, "10.0.0.1", list(targetIPs), targetIPs=targetIPs, journal=journal)
+    journal.close()
+    assert [result["status"] for result in results] == ["succeeded", "succeeded"]
+    nodes = creates(swis, "Orion.Nodes")
+
+    journal = Journal(path)
+    results = copyNode.copy_nodes(swis, "10.0.0.1", list(targetIPs), targetIPs=targetIPs, journal=journal)
+    journal.close()
+    assert [result["status"] for result in results] == ["skipped", "skipped"]
+    assert creates(swis, "Orion.Nodes") == nodes
+    assert len([node for node in inventory.rows("Orion.Nodes") if node["Caption"] in targetIPs]) == 2
+
+def test_node_created_before_a_crash_is_finished_not_created_again(tmp_path, inventory, swis, capsys):
+    # The earlier run created the node and then died before its pollers
+    node = inventory.insert("Orion.Nodes", {"Caption": "resume1.example.com", "DNS": "resume1.example.com", "IPAddress": "192.168.5.1", "EngineID": 2, "Status": 1})
+    inventory.create_custom_properties(node["NodeID"], {"Department": None, "City": None, "Comments": None})
+    journal = Journal(str(tmp_path / "journal.jsonl"))
+    journal.record("resume1.example.com", "created", Uri=node["Uri"])
+
+    results = copyNode.copy_nodes(swis, "10.0.0.1", ["resume1.example.com"], targetIPs=targetIPs, journal=journal)
+    assert results[0]["status"] == "succeeded"
+    assert results[0]["NodeID"] == node["NodeID"]
+    assert creates(swis, "Orion.Nodes") == 0
+    assert len([poller for poller in inventory.rows("Orion.Pollers") if poller["NetObjectID"] == node["NodeID"]]) == len([poller for poller in inventory.rows("Orion.Pollers") if poller["NetObjectID"] == 1])
+    assert inventory.custom_properties(node["NodeID"])["Department"] == "Networking"
+    assert journal.done("resume1.example.com", "finished")
+    journal.close()
+
+def test_app_copy_resumes_from_the_journal(tmp_path, inventory, swis, capsys):
+    sourceApps = copyApps.get_source_apps(swis, "10.0.0.1")
+    path = str(tmp_path / "journal.jsonl")
+    journal = Journal(path)
+    copyApps.copy_apps_batch(swis, "10.0.0.1", ["node5.example.com"], sourceApps, journal=journal, preflight=False)
+    journal.close()
+    apps = len([app for app in inventory.rows("Orion.APM.Application") if app["NodeID"] == 5])
+
+    # Without the pre-flight check only the journal stops the monitors being created twice
+    journal = Journal(path)
+    copyApps.copy_apps_batch(swis, "10.0.0.1", ["node5.example.com"], sourceApps, journal=journal, preflight=False)
+    journal.close()
+    assert len([app for app in inventory.rows("Orion.APM.Application") if app["NodeID"] == 5]) == apps
+    assert "already copied according to the journal" in capsys.readouterr().out
@@ -0,0 +1,71 @@
+from solarwinds_common import load_script
+
+reconcileNodes = load_script("reconcile-solarwinds-nodes")
+
+targets = ["node2.example.com", "node3.example.com"]
+
+def writes(swis) -> int:
+    return sum([series["count"] for key, series in swis.metrics.series.items() if key[0] not in ("query", "read")])
+
+def reconcile(swis, **options) -> dict:
+    # Every node's Comments differ on purpose, so they are left out as the benchmark does
+    golden = reconcileNodes.golden_state(swis, "10.0.0.1", ["Comments"])
+    return dict([(result["target"], result) for result in reconcileNodes.reconcile_nodes(swis, "10.0.0.1", targets, golden, **options)])
+
+def test_fingerprint_ignores_key_order_but_not_values():
+    assert reconcileNodes.fingerprint([{"a": 1, "b": 2}]) == reconcileNodes.fingerprint([{"b": 2, "a": 1}])
+    assert reconcileNodes.fingerprint([{"a": 1}]) != reconcileNodes.fingerprint([{"a": 2}])
+    assert len(reconcileNodes.fingerprint([])) == reconcileNodes.fingerprintLength
+
+def test_apps_from_one_template_are_ranked_in_order():
+    apps = [{"ApplicationID": 5, "ApplicationTemplateID": 2}, {"ApplicationID": 6, "ApplicationTemplateID": 3}, {"ApplicationID": 7, "ApplicationTemplateID": 2}]
+    assert dict([(key, app["ApplicationID"]) for key, app in reconcileNodes.ranked_apps(apps).items()]) == {(2, 0): 5, (3, 0): 6, (2, 1): 7}
+
+def test_manifest_values_take_the_golden_type():
+    assert reconcileNodes.coerce_custom_prop("7", 3) == 7
+    assert reconcileNodes.coerce_custom_prop("2.5", 1.0) == 2.5
+    assert reconcileNodes.coerce_custom_prop("yes", False) is True
+    assert reconcileNodes.coerce_custom_prop("seven", 3) == "seven"
+    assert reconcileNodes.coerce_custom_prop("7", "3") == "7"
+    assert reconcileNodes.coerce_custom_prop("7", None) == "7"
+
+def test_dry_run_reports_drift_without_writing(swis, capsys):
+    results = reconcile(swis, dryRun=True)
+    assert [results[target]["status"] for target in targets] == ["drifted", "drifted"]
+    assert results["node2.example.com"]["apps"] == "drifted"
+    assert results["node2.example.com"]["customprops"] == "same"
+    assert writes(swis) == 0
+
+def test_fixed_clones_match_the_golden_fingerprints(swis, capsys):
+    results = reconcile(swis)
+    assert [results[target]["status"] for target in targets] == ["fixed", "fixed"]
+    written = writes(swis)
+    assert written > 0
+
+    # A second pass finds nothing to do and writes nothing
+    results = reconcile(swis)
+    assert [results[target]["status"] for target in targets] == ["same", "same"]
+    assert writes(swis) == written
+
+def test_only_the_drifted_section_is_written(inventory, swis, capsys):
+    reconcile(swis)
+    inventory.custom_properties(3)["Department"] = "Elsewhere"
+    results = reconcile(swis)
+    assert results["node2.example.com"]["status"] == "same"
+    assert results["node3.example.com"]["status"] == "fixed"
+    assert [section for section in reconcileNodes.sections if results["node3.example.com"][section] != "same"] == ["customprops"]
+    assert inventory.custom_properties(3)["Department"] == "Networking"
+
+def test_overrides_are_kept_instead_of_the_golden_value(inventory, swis, capsys):
+    reconcile(swis)
+    results = reconcile(swis, overrides={"node3.example.com": {"City": "Chicago"}})
+    assert results["node3.example.com"]["customprops"] == "fixed"
+    assert inventory.custom_properties(3)["City"] == "Chicago"
+    assert inventory.custom_properties(2)["City"] == "Evanston"
+    results = reconcile(swis, overrides={"node3.example.com": {"City": "Chicago"}})
+    assert results["node3.example.com"]["status"] == "same"
+
+def test_golden_node_is_skipped(swis, capsys):
+    golden = reconcileNodes.golden_state(swis, "10.0.0.1", ["Comments"])
+    results = reconcileNodes.reconcile_nodes(swis, "10.0.0.1", ["golden.example.com"], golden)
+    assert results[0]["status"] == "skipped"
@@ -0,0 +1,111 @@
+import time
+
+import pytest
+import requests
+
+from solarwinds_common import load_script, RetryPolicy, InstrumentedSwisClient, classify_swis_error
+
+mockServer = load_script("mock-swis-server")
+
+def http_error(status:int, reason:str="") -> requests.exceptions.HTTPError:
+    response = requests.models.Response()
+    response.status_code = status
+    response.reason = reason
+    return requests.exceptions.HTTPError(" ".join([str(status), reason]), response=response)
+
+class FlakySwis:
+    # Fails the first `failures` calls with the given error, then answers
+    def __init__(self, error:Exception, failures:int):
+        self.error = error
+        self.failures = failures
+        self.calls = 0
+
+    def query(self, query, **params):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return {"results": []}
+
+def test_errors_are_classified():
+    assert classify_swis_error(requests.exceptions.ConnectTimeout()) == "unsent"
+    assert classify_swis_error(http_error(503)) == "busy"
+    assert classify_swis_error(http_error(429)) == "busy"
+    assert classify_swis_error(http_error(502)) == "transient"
+    assert classify_swis_error(http_error(500, "Transaction was deadlocked")) == "transient"
+    assert classify_swis_error(http_error(500, "Invalid column")) == "permanent"
+    assert classify_swis_error(http_error(400)) == "permanent"
+    assert classify_swis_error(Exception("anything else")) == "permanent"
+
+def test_only_idempotent_calls_repeat_after_transient_errors():
+    policy = RetryPolicy(3)
+    assert policy.should_retry("query", "transient", 0)
+    assert not policy.should_retry("create", "transient", 0)
+    assert policy.should_retry("create", "busy", 0)
+    assert policy.should_retry("create", "unsent", 0)
+    assert not policy.should_retry("query", "permanent", 0)
+    assert not policy.should_retry("query", "transient", 3)
+
+def test_backoff_stays_under_the_cap():
+    policy = RetryPolicy(5, baseDelay=0.5, maxDelay=2.0)
+    assert all([0 <= policy.backoff(attempt) <= 2.0 for attempt in range(10)])
+    assert policy.retried == 10
+
+def test_client_repeats_transient_failures():
+    swis = FlakySwis(http_error(503), 2)
+    client = InstrumentedSwisClient(swis, retryPolicy=RetryPolicy(3, baseDelay=0.001, maxDelay=0.001))
+    assert client.query("SELECT 1") == {"results": []}
+    assert swis.calls == 3
+    assert client.metrics.totals()["errors"] == 2
+
+def test_client_gives_up_after_retries():
+    swis = FlakySwis(http_error(502), 10)
+    client = InstrumentedSwisClient(swis, retryPolicy=RetryPolicy(2, baseDelay=0.001, maxDelay=0.001))
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.query("SELECT 1")
+    assert swis.calls == 3
+
+def test_client_never_repeats_permanent_failures():
+    swis = FlakySwis(http_error(400), 1)
+    client = InstrumentedSwisClient(swis, retryPolicy=RetryPolicy(3, baseDelay=0.001, maxDelay=0.001))
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.query("SELECT 1")
+    assert swis.calls == 1
+
+def test_breaker_trips_after_threshold_and_pauses_calls():
+    policy = RetryPolicy(0, threshold=3, cooldown=0.3)
+    for failure in range(2):
+        policy.record("transient")
+    assert policy.trips == 0
+    policy.record("transient")
+    assert policy.trips == 1
+    started = time.monotonic()
+    policy.wait_if_open()
+    assert time.monotonic() - started >= 0.25
+
+def test_one_more_failure_after_cooldown_trips_again():
+    policy = RetryPolicy(0, threshold=3, cooldown=0.05)
+    for failure in range(3):
+        policy.record("transient")
+    policy.wait_if_open()
+    policy.record("busy")
+    assert policy.trips == 2
+
+def test_success_and_permanent_errors_reset_the_count():
+    policy = RetryPolicy(0, threshold=3, cooldown=0.05)
+    for kind in ("transient", "transient", None, "transient", "transient", "permanent", "transient"):
+        policy.record(kind)
+    assert policy.trips == 0
+
+def test_breaker_counts_failures_against_the_mock_server(inventory):
+    # Every request fails, so with no retries each call counts towards the breaker
+    server = mockServer.start_mock_server(inventory, errorRate=1.0)
+    try:
+        policy = RetryPolicy(0, threshold=2, cooldown=0.05)
+        client = InstrumentedSwisClient(mockServer.mock_swis_client(server), retryPolicy=policy)
+        for call in range(2):
+            with pytest.raises(requests.exceptions.HTTPError):
+                client.query("SELECT NodeID FROM Orion.Nodes")
+        assert policy.trips == 1
+    finally:
+        server.shutdown()
+        server.server_close()
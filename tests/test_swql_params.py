@@ -0,0 +1,30 @@
+from solarwinds_common import expand_list_params, run_query, run_swql
+
+def test_scalars_pass_through():
+    query, params = expand_list_params("SELECT NodeID FROM Orion.Nodes WHERE IPAddress = @ip", {"ip": "10.0.0.1"})
+    assert query == "SELECT NodeID FROM Orion.Nodes WHERE IPAddress = @ip"
+    assert params == {"ip": "10.0.0.1"}
+
+def test_list_is_padded_to_a_power_of_two():
+    query, params = expand_list_params("WHERE NodeID in (@ids)", {"ids": [4, 5, 6]})
+    assert query == "WHERE NodeID in (@ids0, @ids1, @ids2, @ids3)"
+    assert params == {"ids0": 4, "ids1": 5, "ids2": 6, "ids3": 6}
+
+def test_batches_of_similar_size_share_a_query_text():
+    assert expand_list_params("in (@ids)", {"ids": [1, 2, 3]})[0] == expand_list_params("in (@ids)", {"ids": [7, 8, 9, 10]})[0]
+
+def test_empty_list_matches_nothing():
+    query, params = expand_list_params("in (@ids)", {"ids": []})
+    assert query == "in (@ids0)"
+    assert params == {"ids0": None}
+
+def test_names_sharing_a_prefix_are_left_alone():
+    query, params = expand_list_params("Caption in (@names) or Caption = @namesake", {"names": ["a", "b"], "namesake": "c"})
+    assert query == "Caption in (@names0, @names1) or Caption = @namesake"
+    assert params == {"names0": "a", "names1": "b", "namesake": "c"}
+
+def test_values_are_never_spliced_into_the_query(swis):
+    # A value that would break a query built by concatenation is matched literally
+    assert run_swql(swis, "SELECT NodeID FROM Orion.Nodes WHERE Caption = @caption", caption="x' or '1'='1") == []
+    nodes = run_query(swis, "nodes_by_name_or_ip", names=["node2.example.com", "node3.example.com", "node4.example.com"], ips=[])
+    assert sorted([node["NodeID"] for node in nodes]) == [2, 3, 4]